@@ -0,0 +1,36 @@
+# cofure_bot/backtest/__main__.py
+# python -m cofure_bot.backtest --data ./history --interval 5m [--rules rules.json] [--out result.json]
+import argparse
+import json
+import time
+
+from .engine import DEFAULT_RULESETS, RuleSet, run_backtest
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Backtest luật tín hiệu trên dữ liệu nến cục bộ")
+    ap.add_argument("--data", required=True, help="thư mục <SYMBOL>/<interval>/*.csv|json (+ <SYMBOL>/funding/)")
+    ap.add_argument("--interval", default="5m")
+    ap.add_argument("--symbols", help="danh sách symbol, ngăn cách bởi dấu phẩy (mặc định: tất cả)")
+    ap.add_argument("--rules", help="file JSON: [{name, kind, every, horizon, params}]")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--out", help="ghi kết quả JSON ra file")
+    args = ap.parse_args(argv)
+
+    rulesets = DEFAULT_RULESETS
+    if args.rules:
+        with open(args.rules, "r", encoding="utf-8") as f:
+            rulesets = [RuleSet.from_dict(d) for d in json.load(f)]
+    symbols = [s.strip().upper() for s in args.symbols.split(",")] if args.symbols else None
+
+    t0 = time.perf_counter()
+    result = run_backtest(args.data, args.interval, symbols, rulesets, args.workers)
+    result["elapsed_sec"] = round(time.perf_counter() - t0, 2)
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# cofure_bot/backtest/data.py
+import glob
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from cofure_bot.storage.history import HistoryStore
+
+# Bố cục thư mục dữ liệu:
+#   <root>/<SYMBOL>/<interval>/*.csv|*.json   nến (file dump data.binance.vision hoặc JSON /fapi/v1/klines)
+#   <root>/<SYMBOL>/funding/*.csv|*.json      funding (dump fundingRate hoặc JSON /fapi/v1/fundingRate)
+# hoặc thư mục HistoryStore (cùng bố cục, file cột *.bin) → đọc thẳng memmap, không parse.
+KLINE_COLUMNS = ("open_time", "open", "high", "low", "close", "volume")
+
+def _has_header(path: str) -> bool:
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.readline().strip()
+    return bool(first) and not (first[0].isdigit() or first[0] == "-")
+
+def _load_csv(path: str, usecols) -> np.ndarray:
+    arr = np.loadtxt(path, delimiter=",", skiprows=1 if _has_header(path) else 0,
+                     usecols=usecols, dtype=np.float64, ndmin=2)
+    return arr
+
+def _concat_sorted(parts: List[np.ndarray], width: int) -> np.ndarray:
+    if not parts:
+        return np.empty((0, width))
+    a = np.concatenate(parts)
+    a = a[np.argsort(a[:, 0], kind="stable")]
+    # bỏ trùng open time (các file tháng/ngày chồng nhau)
+    keep = np.ones(len(a), dtype=bool)
+    keep[1:] = a[1:, 0] != a[:-1, 0]
+    return a[keep]
+
+def load_klines(root: str, symbol: str, interval: str) -> Dict[str, np.ndarray]:
+    table = HistoryStore(root).klines(symbol, interval)
+    if table.exists():
+        cols = table.range()
+        return {c: cols[c] for c in KLINE_COLUMNS}
+    parts = []
+    for path in sorted(glob.glob(os.path.join(root, symbol, interval, "*"))):
+        if path.endswith(".csv"):
+            parts.append(_load_csv(path, usecols=range(6)))
+        elif path.endswith(".json"):
+            with open(path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+            if rows:
+                parts.append(np.array([[float(x) for x in r[:6]] for r in rows], dtype=np.float64))
+    a = _concat_sorted(parts, 6)
+    out = {c: a[:, i] for i, c in enumerate(KLINE_COLUMNS)}
+    out["open_time"] = out["open_time"].astype(np.int64)
+    return out
+
+def load_funding(root: str, symbol: str) -> Dict[str, np.ndarray]:
+    """Funding đã chốt: {"time": ms, "rate": tỷ lệ}; không có file → mảng rỗng."""
+    table = HistoryStore(root).funding(symbol)
+    if table.exists():
+        return table.range()
+    parts = []
+    for path in sorted(glob.glob(os.path.join(root, symbol, "funding", "*"))):
+        if path.endswith(".csv"):
+            # calc_time, funding_interval_hours, last_funding_rate
+            parts.append(_load_csv(path, usecols=(0, 2)))
+        elif path.endswith(".json"):
+            with open(path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+            if rows:
+                parts.append(np.array([[float(r["fundingTime"]), float(r["fundingRate"])] for r in rows],
+                                      dtype=np.float64))
+    a = _concat_sorted(parts, 2)
+    return {"time": a[:, 0].astype(np.int64), "rate": a[:, 1]}
+
+def funding_asof(open_time: np.ndarray, funding: Dict[str, np.ndarray]) -> np.ndarray:
+    """Funding đã chốt gần nhất tại mỗi nến (không nhìn trước); chưa có → 0."""
+    if len(funding["time"]) == 0:
+        return np.zeros(len(open_time))
+    idx = np.searchsorted(funding["time"], open_time, side="right") - 1
+    out = funding["rate"][np.clip(idx, 0, None)]
+    return np.where(idx >= 0, out, 0.0)
+
+def list_symbols(root: str, interval: str) -> List[str]:
+    return sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d, interval)))
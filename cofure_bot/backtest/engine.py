@@ -0,0 +1,251 @@
+# cofure_bot/backtest/engine.py
+import contextlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from cofure_bot.data.indicators import EMA_PERIODS, RSI_PERIOD, VOL_MA, ema_series, rsi_series
+from cofure_bot.data.kline_cache import INTERVAL_MS
+from cofure_bot.signals import engine as rules
+from cofure_bot.scheduler import jobs
+from .data import funding_asof, list_symbols, load_funding, load_klines
+
+WARMUP_CANDLES  = max(EMA_PERIODS)
+HORIZON_CANDLES = 288        # giữ lệnh tối đa 1 ngày nến 5m rồi đóng theo giá
+CHUNK_SIGNALS   = 4096       # số tín hiệu xét TP/SL cùng lúc (giới hạn bộ nhớ)
+
+OUTCOME_TP, OUTCOME_SL, OUTCOME_TIMEOUT = 1, -1, 0
+
+class RuleSet:
+    """
+    1 bộ luật để backtest. kind="signal": tín hiệu định kỳ (signal_from_metrics) mỗi
+    `every` nến; kind="urgent": bộ lọc khẩn của scheduler (_urgent_candidate +
+    cooldown + _urgent_confirm). `params` (chỉ kind="urgent") ghi đè hằng số cùng tên
+    trong scheduler.jobs; luật tín hiệu không có tham số chỉnh được.
+    """
+    def __init__(self, name: str, kind: str = "signal", every: int = 6,
+                 horizon: int = HORIZON_CANDLES, params: Optional[Dict[str, Any]] = None):
+        if kind not in ("signal", "urgent"):
+            raise ValueError(f"Unknown rule kind: {kind}")
+        params = dict(params or {})
+        if params and kind != "urgent":
+            raise ValueError(f"Rule kind {kind!r} takes no params: {', '.join(sorted(params))}")
+        for k in params:
+            if not k.isupper() or not hasattr(jobs, k):
+                raise ValueError(f"Unknown scheduler parameter: {k}")
+        self.name = name
+        self.kind = kind
+        self.every = max(1, int(every))
+        self.horizon = max(1, int(horizon))
+        self.params = params
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "RuleSet":
+        return cls(d["name"], d.get("kind", "signal"), d.get("every", 6),
+                   d.get("horizon", HORIZON_CANDLES), d.get("params"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "kind": self.kind, "every": self.every,
+                "horizon": self.horizon, "params": self.params}
+
+# Như bot chạy thật trên nến 5m: tín hiệu mỗi 30', quét khẩn mỗi 10'
+DEFAULT_RULESETS = (
+    RuleSet("halfhour", kind="signal", every=6),
+    RuleSet("urgent", kind="urgent", every=2),
+)
+
+@contextlib.contextmanager
+def _patched(module, params: Dict[str, Any]):
+    old = {k: getattr(module, k) for k in params}
+    try:
+        for k, v in params.items():
+            setattr(module, k, v)
+        yield
+    finally:
+        for k, v in old.items():
+            setattr(module, k, v)
+
+# === Chỉ báo theo thời gian (cùng định nghĩa với data/indicators.py) ===
+def indicator_series(close: np.ndarray, volume: np.ndarray, funding: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Giá trị chỉ báo tại mọi nến, tính liên tục trên cả lịch sử (như IndicatorBook
+    chạy streaming), không dựng lại theo cửa sổ 200 nến của REST.
+    """
+    out = {"last": close}
+    for p in EMA_PERIODS:
+        e = ema_series(close, p)
+        out[f"ema{p}"] = np.where(np.isnan(e), close, e)
+    r = rsi_series(close, RSI_PERIOD)
+    out["rsi"] = np.where(np.isnan(r), 50.0, r)
+    cs = np.concatenate(([0.0], np.cumsum(volume)))
+    ma = np.full(len(volume), np.nan)
+    ma[VOL_MA - 1:] = (cs[VOL_MA:] - cs[:-VOL_MA]) / VOL_MA
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vr = np.where(ma > 1e-12, volume / ma, 0.0)
+    out["vol_ratio"] = np.where(np.isnan(ma), 1.0, vr)
+    for n in (1, 3):
+        ret = np.zeros(len(close))
+        base = close[:-n]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ret[n:] = np.where(base != 0, close[n:] / base - 1.0, 0.0)
+        out[f"ret{n}"] = ret
+    out["funding"] = funding
+    return out
+
+def _metrics_at(ind: Dict[str, np.ndarray], i: int) -> Dict[str, float]:
+    m = {k: float(v[i]) for k, v in ind.items()}
+    m["trend"] = 1 if m["ema50"] > m["ema200"] else -1
+    return m
+
+# === Sinh tín hiệu bằng đúng hàm của bot ===
+def _signals_for(rs: RuleSet, symbol: str, ind: Dict[str, np.ndarray], open_time: np.ndarray,
+                 step_ms: int) -> List[tuple]:
+    """[(i, is_long, entry, tp, sl)] tại các nến quyết định."""
+    T = len(open_time)
+    steps = np.arange(WARMUP_CANDLES, T - 1, rs.every)
+    out = []
+    if rs.kind == "signal":
+        for i in steps:
+            s = rules.signal_from_metrics(symbol, _metrics_at(ind, i))
+            out.append((i, s["side"] == "LONG", s["entry"], s["tp"], s["sl"]))
+        return out
+
+    with _patched(jobs, rs.params):
+        # lọc thô vector hoá = cổng đầu tiên của _urgent_candidate; luật đầy đủ chạy ở dưới
+        gate = (np.abs(ind["funding"][steps]) >= jobs.ALERT_FUNDING) | (ind["vol_ratio"][steps] >= jobs.ALERT_VOLRATIO)
+        cooldown_ms = jobs.ALERT_COOLDOWN_MIN * 60_000
+        last_alert = None
+        for i in steps[gate]:
+            it = jobs._urgent_candidate(symbol, _metrics_at(ind, i))
+            if it is None:
+                continue
+            # close time nến i = lúc bot ra quyết định
+            t = int(open_time[i]) + step_ms
+            if not it["strong"] and last_alert is not None and t - last_alert < cooldown_ms:
+                continue
+            it = jobs._urgent_confirm(it)
+            if it is None:
+                continue
+            last_alert = t
+            s = it["signal"]
+            out.append((i, s["side"] == "LONG", s["entry"], s["tp"], s["sl"]))
+    return out
+
+# === Xét kết quả: vector hoá trên (tín hiệu × nến giữ lệnh) ===
+def resolve(high: np.ndarray, low: np.ndarray, close: np.ndarray, idx: np.ndarray, is_long: np.ndarray,
+            entry: np.ndarray, tp: np.ndarray, sl: np.ndarray, horizon: int) -> Dict[str, np.ndarray]:
+    """
+    Với mỗi tín hiệu tại nến idx (vào lệnh ở giá đóng cửa), tìm nến đầu tiên chạm TP/SL
+    trong `horizon` nến sau đó. Chạm cả hai trong cùng nến → tính SL (thận trọng).
+    Hết horizon → đóng theo giá đóng cửa. Trả về outcome, R, số nến giữ lệnh.
+    """
+    n = len(idx)
+    outcome = np.zeros(n, dtype=np.int8)
+    r = np.zeros(n)
+    bars = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return {"outcome": outcome, "r": r, "bars": bars}
+    H = sliding_window_view(high, horizon)
+    L = sliding_window_view(low, horizon)
+    risk = np.abs(entry - sl)
+    risk = np.where(risk > 0, risk, np.nan)
+    for a in range(0, n, CHUNK_SIGNALS):
+        b = min(n, a + CHUNK_SIGNALS)
+        rows = idx[a:b] + 1
+        hw, lw = H[rows], L[rows]
+        lg = is_long[a:b, None]
+        hit_tp = np.where(lg, hw >= tp[a:b, None], lw <= tp[a:b, None])
+        hit_sl = np.where(lg, lw <= sl[a:b, None], hw >= sl[a:b, None])
+        first_tp = np.where(hit_tp.any(axis=1), hit_tp.argmax(axis=1), horizon)
+        first_sl = np.where(hit_sl.any(axis=1), hit_sl.argmax(axis=1), horizon)
+        win = first_tp < first_sl
+        loss = (first_sl <= first_tp) & (first_sl < horizon)
+        oc = np.where(win, OUTCOME_TP, np.where(loss, OUTCOME_SL, OUTCOME_TIMEOUT))
+        exit_px = np.where(win, tp[a:b], np.where(loss, sl[a:b], close[rows + horizon - 1]))
+        sign = np.where(is_long[a:b], 1.0, -1.0)
+        outcome[a:b] = oc
+        r[a:b] = sign * (exit_px - entry[a:b]) / risk[a:b]
+        bars[a:b] = np.where(win, first_tp, np.where(loss, first_sl, horizon - 1)) + 1
+    return {"outcome": outcome, "r": np.nan_to_num(r), "bars": bars}
+
+# === 1 symbol (chạy trong process con) ===
+def run_symbol(root: str, symbol: str, interval: str, rulesets: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    k = load_klines(root, symbol, interval)
+    T = len(k["open_time"])
+    step_ms = INTERVAL_MS.get(interval, 0)
+    fund = funding_asof(k["open_time"], load_funding(root, symbol))
+    ind = indicator_series(k["close"], k["volume"], fund)
+    result = {"symbol": symbol, "candles": T, "rules": {}}
+    for d in rulesets:
+        rs = RuleSet.from_dict(d)
+        sigs = [s for s in _signals_for(rs, symbol, ind, k["open_time"], step_ms) if s[0] + rs.horizon < T]
+        idx = np.array([s[0] for s in sigs], dtype=np.int64)
+        cols = np.array([s[1:] for s in sigs], dtype=np.float64).reshape(-1, 4)
+        res = resolve(k["high"], k["low"], k["close"], idx, cols[:, 0] > 0.5,
+                      cols[:, 1], cols[:, 2], cols[:, 3], rs.horizon)
+        res["exit_time"] = k["open_time"][idx + res["bars"]] + step_ms
+        result["rules"][rs.name] = res
+    return result
+
+# === Tổng hợp ===
+def summarize(trades: List[Dict[str, np.ndarray]], minutes_per_bar: float) -> Dict[str, Any]:
+    if not trades:
+        return {"trades": 0}
+    oc = np.concatenate([t["outcome"] for t in trades])
+    r = np.concatenate([t["r"] for t in trades])
+    bars = np.concatenate([t["bars"] for t in trades])
+    et = np.concatenate([t["exit_time"] for t in trades])
+    wins, losses = int((oc == OUTCOME_TP).sum()), int((oc == OUTCOME_SL).sum())
+    # đường vốn theo R, ghi nhận theo thời điểm đóng lệnh
+    equity = np.cumsum(r[np.argsort(et, kind="stable")])
+    drawdown = float((np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:] - equity).max()) if len(equity) else 0.0
+
+    def avg_minutes(mask):
+        return round(float(bars[mask].mean()) * minutes_per_bar, 1) if mask.any() else None
+
+    return {
+        "trades": int(len(oc)),
+        "wins": wins,
+        "losses": losses,
+        "timeouts": int((oc == OUTCOME_TIMEOUT).sum()),
+        "hit_rate": round(wins / (wins + losses), 4) if wins + losses else None,
+        "avg_r": round(float(r.mean()), 4) if len(r) else None,
+        "total_r": round(float(r.sum()), 2),
+        "avg_minutes_to_tp": avg_minutes(oc == OUTCOME_TP),
+        "avg_minutes_to_sl": avg_minutes(oc == OUTCOME_SL),
+        "max_drawdown_r": round(drawdown, 2),
+    }
+
+def run_backtest(root: str, interval: str = "5m", symbols: Optional[List[str]] = None,
+                 rulesets: Iterable[RuleSet] = DEFAULT_RULESETS, workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Backtest mọi bộ luật trên dữ liệu cục bộ, mỗi symbol 1 task trong process pool.
+    Giới hạn cảnh báo/giờ và top-K của scheduler là luật liên symbol nên không áp dụng.
+    """
+    symbols = symbols or list_symbols(root, interval)
+    rulesets = list(rulesets)
+    specs = [rs.to_dict() for rs in rulesets]
+    per_rule: Dict[str, List[Dict[str, np.ndarray]]] = {rs.name: [] for rs in rulesets}
+    candles = 0
+    workers = workers or min(len(symbols) or 1, os.cpu_count() or 1)
+    with contextlib.ExitStack() as stack:
+        if workers <= 1:
+            results = (run_symbol(root, s, interval, specs) for s in symbols)
+        else:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            n = len(symbols)
+            results = pool.map(run_symbol, [root] * n, symbols, [interval] * n, [specs] * n)
+        for res in results:
+            candles += res["candles"]
+            for name, t in res["rules"].items():
+                per_rule[name].append(t)
+    minutes = INTERVAL_MS.get(interval, 60_000) / 60_000
+    return {
+        "interval": interval,
+        "symbols": len(symbols),
+        "candles": candles,
+        "rules": {rs.name: {**rs.to_dict(), **summarize(per_rule[rs.name], minutes)} for rs in rulesets},
+    }
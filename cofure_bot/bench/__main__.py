@@ -0,0 +1,67 @@
+# cofure_bot/bench/__main__.py
+# python -m cofure_bot.bench [--sizes 5,20,50,100,200,500] [--cases ...] [--latency-ms 20]
+#                            [--out bench_results.json] [--compare old.json]
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+
+DEFAULT_PORT = 18765
+BENCH_USER_ID = "424242"
+
+def _point_env_at(base: str):
+    # phải đặt trước khi import cofure_bot.config (giá trị đọc lúc import)
+    os.environ["BINANCE_FAPI_URL"] = base
+    os.environ["FF_CALENDAR_URL"] = f"{base}/ff_calendar.json"
+    os.environ["FX_RATE_URL"] = f"{base}/fx/latest"
+    os.environ["FX_RATE_FALLBACK_URL"] = f"{base}/fx/v6/latest/USD"
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:bench"
+    os.environ["TELEGRAM_ALLOWED_USER_ID"] = BENCH_USER_ID
+    os.environ["MARKET_STREAM"] = "0"
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="cofure_bench_")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark job/lệnh với server Binance/Telegram giả lập")
+    ap.add_argument("--sizes", default="5,20,50,100,200,500", help="số symbol trong universe")
+    ap.add_argument("--cases", default="all",
+                    help="job_urgent_alerts,job_halfhour_signals,generate_batch,test_full (mặc định: all)")
+    ap.add_argument("--repeat", type=int, default=3, help="số lượt nóng mỗi case (lấy trung vị)")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="độ trễ mỗi request của server giả")
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--fixtures", help="thư mục response ghi sẵn (ticker_24hr.json, klines/<SYM>.json, ...)")
+    ap.add_argument("--telegram-limits", action="store_true",
+                    help="giữ giới hạn gửi của Telegram (deliver_ms gồm cả thời gian chờ token)")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--compare", help="file kết quả cũ để so sánh")
+    args = ap.parse_args(argv)
+
+    base = f"http://127.0.0.1:{args.port}"
+    _point_env_at(base)
+    from .runner import CASES, compare, load, run, start_server
+
+    cases = CASES if args.cases == "all" else [c.strip() for c in args.cases.split(",")]
+    sizes = [int(s) for s in args.sizes.split(",")]
+    server = start_server(args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                          fixtures=args.fixtures)
+    try:
+        def progress(r):
+            print(f"{r['case']:<22}{r['size']:>5} {r['phase']:<5} wall={r['wall_ms']:>9.1f}ms "
+                  f"cpu={r['cpu_ms']:>9.1f}ms deliver={r['deliver_ms']:>8.1f}ms "
+                  f"req={r['requests']['binance']:>4}/{r['requests']['telegram']:<3}"
+                  + (f" ERROR {r['error']}" if r["error"] else ""), flush=True)
+        result = asyncio.run(run(base, cases, sizes, args.repeat, args.latency_ms,
+                                 args.telegram_limits, progress))
+    finally:
+        server.terminate()
+        server.join(5)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"→ {args.out}")
+    if args.compare:
+        print("\n".join(compare(load(args.compare), result)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+# cofure_bot/bench/fake_server.py
+import asyncio
+import json
+import os
+import random
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+from aiohttp import WSMsgType, web
+
+# Server giả lập Binance Futures + Telegram Bot API + lịch vĩ mô/tỷ giá cho benchmark.
+# Dữ liệu sinh tất định theo symbol (hoặc đọc từ thư mục fixtures ghi sẵn), cùng định dạng JSON thật.
+STEP_MS        = 300_000            # nến 5m
+HISTORY_BARS   = 3000               # số nến sinh sẵn trước thời điểm khởi động
+FUTURE_BARS    = 2000               # đủ cho ~7 ngày chạy liên tục
+CORE_SYMBOLS   = ("BTCUSDT", "ETHUSDT")
+CONTROL_PREFIX = "/_bench"
+
+def universe(n: int) -> List[str]:
+    extra = max(0, n - len(CORE_SYMBOLS))
+    return list(CORE_SYMBOLS[:n]) + [f"C{i:03d}USDT" for i in range(extra)]
+
+class _Series:
+    """Nến 5m tất định của 1 symbol: random walk + vài cú tăng volume."""
+    def __init__(self, symbol: str, anchor_ms: int):
+        rnd = np.random.default_rng(zlib.crc32(symbol.encode()))
+        n = HISTORY_BARS + FUTURE_BARS
+        self.t0 = anchor_ms - HISTORY_BARS * STEP_MS
+        ret = rnd.normal(0, 0.002, n)
+        close = (20 + rnd.random() * 200) * np.exp(np.cumsum(ret))
+        opn = np.concatenate([[close[0]], close[:-1]])
+        wick = np.abs(rnd.normal(0, 0.001, n))
+        self.open = opn
+        self.close = close
+        self.high = np.maximum(opn, close) * (1 + wick)
+        self.low = np.minimum(opn, close) * (1 - wick)
+        vol = rnd.gamma(2.0, 500.0, n)
+        spikes = rnd.random(n) < 0.01
+        vol[spikes] *= rnd.uniform(3, 8, int(spikes.sum()))
+        self.volume = vol
+
+    def last_index(self, now_ms: int) -> int:
+        return min((now_ms - self.t0) // STEP_MS, len(self.close) - 1)
+
+    def rows(self, start: Optional[int], limit: int, now_ms: int) -> List[list]:
+        last = self.last_index(now_ms)
+        if start is None:
+            i = max(0, last - limit + 1)
+        else:
+            i = max(0, -(-(start - self.t0) // STEP_MS))
+        j = min(last + 1, i + limit)
+        out = []
+        for k in range(i, j):
+            t = self.t0 + k * STEP_MS
+            c, v = self.close[k], self.volume[k]
+            out.append([t, f"{self.open[k]:.6f}", f"{self.high[k]:.6f}", f"{self.low[k]:.6f}", f"{c:.6f}",
+                        f"{v:.3f}", t + STEP_MS - 1, f"{c * v:.3f}", 100, f"{v / 2:.3f}", f"{c * v / 2:.3f}", "0"])
+        return out
+
+class FakeServer:
+    """
+    1 aiohttp app phục vụ mọi host: /fapi/v1/*, /bot<token>/<method>, /ff_calendar.json, /fx,
+    và /stream (combined stream WebSocket: SUBSCRIBE/UNSUBSCRIBE, đẩy tin bằng push_*()).
+    Độ trễ cấu hình được (latency_ms ± jitter_ms) cho mọi request trừ /_bench/*.
+    """
+    def __init__(self, symbols: int = 50, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 fixtures: Optional[str] = None):
+        self.anchor_ms = int(time.time() * 1000) // STEP_MS * STEP_MS
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fixtures = fixtures
+        self._series: Dict[str, _Series] = {}
+        self._message_id = 0
+        self.counts: Dict[str, int] = {}
+        # WebSocket: kết nối đang mở → stream đã đăng ký; lệnh nhận được theo thứ tự
+        self._ws: Dict[web.WebSocketResponse, Set[str]] = {}
+        self.ws_connects = 0
+        self.ws_commands: List[dict] = []
+        self.set_universe(symbols)
+
+    def set_universe(self, n: int):
+        self.symbols = universe(n)
+
+    def _series_for(self, symbol: str) -> _Series:
+        s = self._series.get(symbol)
+        if s is None:
+            s = self._series[symbol] = _Series(symbol, self.anchor_ms)
+        return s
+
+    def _fixture(self, name: str) -> Optional[Any]:
+        if not self.fixtures:
+            return None
+        path = os.path.join(self.fixtures, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    # --- Binance ---
+    def ticker_24hr(self) -> List[dict]:
+        rec = self._fixture("ticker_24hr.json")
+        if rec is not None:
+            return rec
+        now = int(time.time() * 1000)
+        out = []
+        for i, sym in enumerate(self.symbols):
+            s = self._series_for(sym)
+            k = s.last_index(now)
+            first, last = s.open[max(0, k - 287)], s.close[k]
+            out.append({
+                "symbol": sym, "priceChange": f"{last - first:.6f}",
+                "priceChangePercent": f"{(last / first - 1) * 100:.3f}", "lastPrice": f"{last:.6f}",
+                "volume": f"{1e6 / (i + 1):.3f}", "quoteVolume": f"{5e9 / (i + 1) + 6e6:.2f}",
+                "openTime": now - 86_400_000, "closeTime": now, "count": 1000,
+            })
+        return out
+
+    def premium_index(self) -> List[dict]:
+        rec = self._fixture("premium_index.json")
+        if rec is not None:
+            return rec
+        now = int(time.time() * 1000)
+        nxt = now - now % 28_800_000 + 28_800_000
+        out = []
+        for i, sym in enumerate(self.symbols):
+            s = self._series_for(sym)
+            last = s.close[s.last_index(now)]
+            rate = ((i * 37) % 21 - 10) / 10_000
+            out.append({"symbol": sym, "markPrice": f"{last:.6f}", "indexPrice": f"{last * 0.9999:.6f}",
+                        "lastFundingRate": f"{rate:.6f}", "interestRate": "0.00010000",
+                        "nextFundingTime": nxt, "time": now})
+        return out
+
+    def klines(self, q) -> List[list]:
+        sym = q.get("symbol", "")
+        rec = self._fixture(os.path.join("klines", f"{sym}.json"))
+        limit = int(q.get("limit", 500))
+        start = int(q["startTime"]) if "startTime" in q else None
+        if rec is not None:
+            rows = [r for r in rec if start is None or r[0] >= start]
+            return rows[:limit] if start is not None else rows[-limit:]
+        return self._series_for(sym).rows(start, limit, int(time.time() * 1000))
+
+    def funding_rate(self, q) -> List[dict]:
+        sym = q.get("symbol", "")
+        limit = int(q.get("limit", 100))
+        now = int(time.time() * 1000)
+        t = now - now % 28_800_000
+        rows = [{"symbol": sym, "fundingTime": t - k * 28_800_000, "fundingRate": "0.00010000"}
+                for k in range(limit)]
+        return rows[::-1]
+
+    # --- Lịch vĩ mô / tỷ giá ---
+    def ff_calendar(self) -> List[dict]:
+        rec = self._fixture("ff_calendar.json")
+        if rec is not None:
+            return rec
+        now = datetime.now(timezone.utc).replace(minute=30, second=0, microsecond=0)
+        return [
+            {"title": "CPI m/m", "country": "USD", "date": (now + timedelta(hours=2)).isoformat(),
+             "impact": "High", "forecast": "0.3%", "previous": "0.2%"},
+            {"title": "FOMC Member Speaks", "country": "USD", "date": (now + timedelta(hours=5)).isoformat(),
+             "impact": "Medium", "forecast": "", "previous": ""},
+            {"title": "Bank Holiday", "country": "JPY", "date": now.isoformat(), "impact": "Holiday"},
+        ]
+
+    # --- Telegram ---
+    async def telegram(self, method: str, request: web.Request) -> dict:
+        try:
+            params = dict(await request.post())
+        except Exception:
+            params = {}
+        if not params:
+            try:
+                params = await request.json()
+            except Exception:
+                params = {}
+        m = method.lower()
+        if m == "getme":
+            return {"id": 1, "is_bot": True, "first_name": "Cofure", "username": "cofure_bench_bot"}
+        if m in ("sendmessage", "editmessagetext"):
+            self._message_id += 1
+            chat_id = int(params.get("chat_id") or 0)
+            return {"message_id": int(params.get("message_id") or self._message_id), "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private" if chat_id >= 0 else "group"},
+                    "text": params.get("text", "")}
+        return True
+
+    # --- WebSocket (combined stream) ---
+    async def stream(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.ws_connects += 1
+        streams = self._ws[ws] = {s for s in request.query.get("streams", "").split("/") if s}
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    cmd = json.loads(msg.data)
+                except ValueError:
+                    continue
+                self.ws_commands.append(cmd)
+                params = cmd.get("params") or []
+                if cmd.get("method") == "SUBSCRIBE":
+                    streams.update(params)
+                elif cmd.get("method") == "UNSUBSCRIBE":
+                    streams.difference_update(params)
+                await ws.send_json({"result": None, "id": cmd.get("id")})
+        finally:
+            self._ws.pop(ws, None)
+        return ws
+
+    @property
+    def subscriptions(self) -> Set[str]:
+        """Stream đang được đăng ký trên mọi kết nối."""
+        return set().union(*self._ws.values())
+
+    async def publish(self, stream: str, data: Any) -> int:
+        """Đẩy 1 tin tới các kết nối đã đăng ký `stream`; trả về số kết nối nhận."""
+        sent = 0
+        for ws, streams in list(self._ws.items()):
+            if stream in streams and not ws.closed:
+                await ws.send_json({"stream": stream, "data": data})
+                sent += 1
+        return sent
+
+    async def push_kline(self, symbol: str, row: list, interval: str = "5m", closed: bool = False) -> int:
+        """Đẩy 1 nến (định dạng /fapi/v1/klines) như tin kline của Binance."""
+        k = {"t": row[0], "T": row[6], "s": symbol, "i": interval, "o": row[1], "h": row[2], "l": row[3],
+             "c": row[4], "v": row[5], "q": row[7], "n": row[8], "V": row[9], "Q": row[10], "x": closed}
+        return await self.publish(f"{symbol.lower()}@kline_{interval}",
+                                  {"e": "kline", "E": int(time.time() * 1000), "s": symbol, "k": k})
+
+    async def push_mark_prices(self) -> int:
+        """Đẩy 1 tin !markPrice@arr cho cả universe (cùng số liệu với premiumIndex)."""
+        data = [{"e": "markPriceUpdate", "E": d["time"], "s": d["symbol"], "p": d["markPrice"],
+                 "i": d["indexPrice"], "r": d["lastFundingRate"], "T": d["nextFundingTime"]}
+                for d in self.premium_index()]
+        return await self.publish("!markPrice@arr@1s", data)
+
+    async def drop_ws(self):
+        """Cắt mọi kết nối WebSocket (giả lập mất mạng / Binance ngắt định kỳ)."""
+        for ws in list(self._ws):
+            await ws.close(code=1001, message=b"going away")
+
+    # --- HTTP ---
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        path = request.path
+        if path.startswith(CONTROL_PREFIX):
+            return await self._control(request)
+        # /bot<token>/<method> → /bot/<method> (không ghi token vào thống kê)
+        key = "/bot/" + path.rsplit("/", 1)[-1] if path.startswith("/bot") else path
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if self.latency_ms or self.jitter_ms:
+            await asyncio.sleep(max(0.0, self.latency_ms + random.uniform(-1, 1) * self.jitter_ms) / 1000)
+        q = request.query
+        if path == "/stream":
+            return await self.stream(request)
+        if path.startswith("/bot"):
+            return web.json_response({"ok": True, "result": await self.telegram(path.rsplit("/", 1)[-1], request)})
+        if path.endswith("/ticker/24hr"):
+            return web.json_response(self.ticker_24hr())
+        if path.endswith("/premiumIndex"):
+            return web.json_response(self.premium_index())
+        if path.endswith("/klines"):
+            return web.json_response(self.klines(q))
+        if path.endswith("/fundingRate"):
+            return web.json_response(self.funding_rate(q))
+        if path.endswith("/ff_calendar.json"):
+            return web.json_response(self.ff_calendar())
+        if path.startswith("/fx"):
+            return web.json_response({"result": "success", "base": "USD", "rates": {"VND": 25400.0}})
+        return web.json_response({"code": -1121, "msg": "Invalid path"}, status=404)
+
+    async def _control(self, request: web.Request) -> web.Response:
+        op = request.path[len(CONTROL_PREFIX):]
+        q = request.query
+        if op == "/config":
+            if "symbols" in q:
+                self.set_universe(int(q["symbols"]))
+            if "latency_ms" in q:
+                self.latency_ms = float(q["latency_ms"])
+            if "jitter_ms" in q:
+                self.jitter_ms = float(q["jitter_ms"])
+        if op == "/ws_drop":
+            await self.drop_ws()
+        counts = dict(self.counts)
+        if op == "/reset":
+            # trả về số request từ lần reset trước rồi đếm lại từ 0
+            self.counts.clear()
+        return web.json_response({"symbols": len(self.symbols), "latency_ms": self.latency_ms,
+                                  "requests": counts})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        return app
+
+async def _serve(port: int, ready, **kw):
+    runner = web.AppRunner(FakeServer(**kw).app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    ready.set()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+def serve(port: int, ready=None, **kw):
+    """Chạy server (dùng làm target của multiprocessing.Process để CPU đo không lẫn server)."""
+    class _Noop:
+        def set(self):
+            pass
+    try:
+        asyncio.run(_serve(port, ready or _Noop(), **kw))
+    except KeyboardInterrupt:
+        pass
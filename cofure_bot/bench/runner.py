@@ -0,0 +1,213 @@
+# cofure_bot/bench/runner.py
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import aiohttp
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder, CallbackContext
+
+from cofure_bot.config import BINANCE_FAPI_URL, TELEGRAM_ALLOWED_USER_ID, TELEGRAM_BOT_TOKEN, VERSION
+from cofure_bot.data.binance_client import BinanceClient, BOT_DATA_KEY
+from cofure_bot.handlers.menu import test_full_cmd
+from cofure_bot.scheduler import jobs
+from cofure_bot.signals.engine import generate_batch
+from cofure_bot.utils import outbox as outbox_mod
+from cofure_bot.utils.outbox import Outbox, OUTBOX_KEY
+from .fake_server import CONTROL_PREFIX, serve, universe
+
+CASES = ("job_urgent_alerts", "job_halfhour_signals", "generate_batch", "test_full")
+SIZES = (5, 20, 50, 100, 200, 500)
+DELIVER_TIMEOUT_SEC = 120
+BENCH_WEIGHT_BUDGET = 10 ** 9     # server giả không giới hạn weight → không chờ limiter
+
+def _git_rev() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             timeout=5, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def _patch_policies(telegram_limits: bool):
+    """
+    Bỏ các chính sách theo giờ/tần suất để mỗi lượt chạy đi hết cùng 1 đường code:
+    khung giờ làm việc, cooldown/giới hạn cảnh báo theo giờ, (tuỳ chọn) giới hạn gửi của Telegram.
+    """
+    jobs._in_work_hours = lambda: True
+    jobs.ALERT_PER_HOUR_MAX = 10 ** 9
+    jobs.ALERT_COOLDOWN_MIN = 0
+    if not telegram_limits:
+        outbox_mod.CHAT_RATE = outbox_mod.GROUP_RATE = outbox_mod.GLOBAL_RATE = 1e6
+        outbox_mod.CHAT_BURST = outbox_mod.GROUP_BURST = outbox_mod.GLOBAL_BURST = 10 ** 6
+
+def _next_tick(client: BinanceClient):
+    """Giả lập tick kế tiếp: snapshot/funding hết hạn, cache nến làm mới phần đuôi ngay."""
+    client._snapshot = None
+    client._funding = None
+    client.kline_cache.min_refresh_sec = 0.0
+
+def _fake_update(bot, text: str) -> Update:
+    uid = TELEGRAM_ALLOWED_USER_ID
+    return Update.de_json({
+        "update_id": 1,
+        "message": {"message_id": 1, "date": int(time.time()), "text": text,
+                    "chat": {"id": uid, "type": "private"},
+                    "from": {"id": uid, "is_bot": False, "first_name": "bench"}},
+    }, bot)
+
+class Bench:
+    def __init__(self, base_url: str, repeat: int = 3):
+        self.base_url = base_url.rstrip("/")
+        self.repeat = max(1, repeat)
+        self.application: Optional[Application] = None
+        self.outbox: Optional[Outbox] = None
+        self._http: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "Bench":
+        self._http = aiohttp.ClientSession()
+        self.application = (ApplicationBuilder().token(TELEGRAM_BOT_TOKEN)
+                            .base_url(f"{self.base_url}/bot").updater(None).build())
+        await self.application.initialize()
+        self.outbox = Outbox(self.application.bot)
+        self.application.bot_data[OUTBOX_KEY] = self.outbox
+        await self.outbox.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.outbox.stop()
+        await self.application.shutdown()
+        await self._http.close()
+
+    async def _control(self, op: str, **params) -> Dict[str, Any]:
+        async with self._http.get(f"{self.base_url}{CONTROL_PREFIX}/{op}", params=params) as r:
+            return await r.json()
+
+    def _case(self, name: str, client: BinanceClient, size: int) -> Callable[[], Awaitable[Any]]:
+        context = CallbackContext(self.application)
+        if name == "job_urgent_alerts":
+            return lambda: jobs.job_urgent_alerts(context)
+        if name == "job_halfhour_signals":
+            return lambda: jobs.job_halfhour_signals(context)
+        if name == "generate_batch":
+            symbols = universe(size)
+            return lambda: generate_batch(client, symbols, count=len(symbols))
+        if name == "test_full":
+            update = _fake_update(self.application.bot, "/test_full")
+            return lambda: test_full_cmd(update, context)
+        raise ValueError(f"unknown case: {name}")
+
+    async def _measure(self, fn: Callable[[], Awaitable[Any]]) -> Dict[str, Any]:
+        await self._control("reset")
+        error = None
+        c0, t0 = time.process_time(), time.perf_counter()
+        try:
+            await fn()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        t1 = time.perf_counter()
+        await self.outbox.join(DELIVER_TIMEOUT_SEC)
+        t2, c1 = time.perf_counter(), time.process_time()
+        by_path = (await self._control("reset"))["requests"]
+        return {
+            "wall_ms": (t1 - t0) * 1000,
+            "deliver_ms": (t2 - t1) * 1000,
+            "cpu_ms": (c1 - c0) * 1000,
+            "requests": {
+                "binance": sum(n for p, n in by_path.items() if p.startswith("/fapi")),
+                "telegram": sum(n for p, n in by_path.items() if p.startswith("/bot")),
+                "other": sum(n for p, n in by_path.items() if not p.startswith(("/fapi", "/bot"))),
+            },
+            "messages": by_path.get("/bot/sendMessage", 0),
+            "by_path": by_path,
+            "error": error,
+        }
+
+    async def run_case(self, name: str, size: int) -> List[Dict[str, Any]]:
+        """1 lượt lạnh (client mới) + `repeat` lượt nóng (tick kế tiếp, cache đã có)."""
+        await self._control("config", symbols=size)
+        client = await BinanceClient(base_url=BINANCE_FAPI_URL).start()
+        client.limiter.budget = BENCH_WEIGHT_BUDGET
+        self.application.bot_data[BOT_DATA_KEY] = client
+        try:
+            fn = self._case(name, client, size)
+            cold = await self._measure(fn)
+            warm = []
+            for _ in range(self.repeat):
+                _next_tick(client)
+                warm.append(await self._measure(fn))
+        finally:
+            await client.close()
+        out = [{"case": name, "size": size, "phase": "cold", "runs": 1, **_rounded(cold)}]
+        med = dict(warm[-1])
+        for k in ("wall_ms", "deliver_ms", "cpu_ms"):
+            med[k] = statistics.median(w[k] for w in warm)
+        out.append({"case": name, "size": size, "phase": "warm", "runs": len(warm), **_rounded(med)})
+        return out
+
+def _rounded(r: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: (round(v, 2) if isinstance(v, float) else v) for k, v in r.items()}
+
+async def run(base_url: str, cases: Sequence[str] = CASES, sizes: Sequence[int] = SIZES,
+              repeat: int = 3, latency_ms: float = 0.0, telegram_limits: bool = False,
+              progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    _patch_policies(telegram_limits)
+    results: List[Dict[str, Any]] = []
+    async with Bench(base_url, repeat) as bench:
+        for size in sizes:
+            for case in cases:
+                for r in await bench.run_case(case, size):
+                    results.append(r)
+                    if progress:
+                        progress(r)
+    return {
+        "meta": {
+            "version": VERSION, "git": _git_rev(),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "latency_ms": latency_ms, "repeat": repeat,
+            "telegram_limits": telegram_limits,
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+def start_server(port: int, **kw) -> multiprocessing.Process:
+    """Server giả chạy ở process riêng (CPU đo được chỉ là của bot)."""
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Event()
+    proc = ctx.Process(target=serve, args=(port, ready), kwargs=kw, daemon=True, name="bench_fake_server")
+    proc.start()
+    if not ready.wait(30):
+        proc.terminate()
+        raise RuntimeError("fake server did not start")
+    return proc
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float = 1.2) -> List[str]:
+    """Bảng so sánh 2 file kết quả; dòng chậm hơn `threshold` lần được đánh dấu."""
+    base = {(r["case"], r["size"], r["phase"]): r for r in old.get("results", [])}
+    lines = [f"{'case':<22}{'size':>5} {'phase':<5} {'wall_ms':>22} {'cpu_ms':>22} {'binance_req':>14}"]
+
+    def cell(a, b):
+        ratio = (b / a) if a else float("inf") if b else 1.0
+        return f"{a:>8.1f}→{b:<8.1f}x{ratio:4.2f}", ratio
+
+    for r in new.get("results", []):
+        o = base.get((r["case"], r["size"], r["phase"]))
+        if o is None:
+            continue
+        wall, wr = cell(o["wall_ms"], r["wall_ms"])
+        cpu, cr = cell(o["cpu_ms"], r["cpu_ms"])
+        req = f"{o['requests']['binance']:>6}→{r['requests']['binance']:<6}"
+        flag = " !!" if max(wr, cr) > threshold or r["requests"]["binance"] > o["requests"]["binance"] else ""
+        lines.append(f"{r['case']:<22}{r['size']:>5} {r['phase']:<5} {wall} {cpu} {req}{flag}")
+    return lines
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
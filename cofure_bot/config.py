@@ -1,4 +1,5 @@
 import os
+import secrets
 
 APP_NAME = "Cofure"
 TZ_NAME = os.getenv("TZ", "Asia/Ho_Chi_Minh")
@@ -11,7 +12,47 @@ VERSION = os.getenv("VERSION", "v1.0.0-branch5")
 # Telegram
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_ALLOWED_USER_ID = int(os.getenv("TELEGRAM_ALLOWED_USER_ID", "0"))
+# Chat/user khác được phép /sub nhận tín hiệu (id cách nhau dấu phẩy); chủ bot luôn được phép
+TELEGRAM_SUBSCRIBER_IDS = {int(x) for x in os.getenv("TELEGRAM_SUBSCRIBER_IDS", "").replace(" ", "").split(",") if x}
 PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "https://cofure.onrender.com")
+# Telegram gửi kèm header X-Telegram-Bot-Api-Secret-Token; không đặt → sinh ngẫu nhiên mỗi lần chạy
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBHOOK_QUEUE_MAX = int(os.getenv("WEBHOOK_QUEUE_MAX", "1000"))
+# /debug/* (profile CPU, tracemalloc, dump task): tắt khi không đặt token
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+# Watchdog event loop: ghi lại callback chặn loop quá SLOW_CALLBACK_MS; /health báo degraded
+# khi trung vị độ trễ 60 giây gần nhất vượt LOOP_LAG_DEGRADED_MS
+SLOW_CALLBACK_MS = float(os.getenv("SLOW_CALLBACK_MS", "100"))
+LOOP_LAG_DEGRADED_MS = float(os.getenv("LOOP_LAG_DEGRADED_MS", "200"))
+
+# Binance (đổi URL để chạy với server giả lập khi test/benchmark)
+BINANCE_FAPI_URL = os.getenv("BINANCE_FAPI_URL", "https://fapi.binance.com")
+BINANCE_WS_URL = os.getenv("BINANCE_WS_URL", "wss://fstream.binance.com")
+MARKET_STREAM_ENABLED = os.getenv("MARKET_STREAM", "1") == "1"
 
 # Macro calendar (nếu có proxy JSON; không có cũng chạy bình thường)
 MACRO_ENDPOINT = os.getenv("MACRO_ENDPOINT", "")
+# Lịch ForexFactory và tỷ giá USD/VND (đổi URL để chạy với server giả lập khi benchmark)
+FF_CALENDAR_URL = os.getenv("FF_CALENDAR_URL", "https://nfs.faireconomy.media/ff_calendar_thisweek.json")
+FX_RATE_URL = os.getenv("FX_RATE_URL", "https://api.exchangerate.host/latest")
+FX_RATE_FALLBACK_URL = os.getenv("FX_RATE_FALLBACK_URL", "https://open.er-api.com/v6/latest/USD")
+
+# Thư mục lưu trạng thái (chỉ báo, cache...) để khởi động lại không phải warm-up
+DATA_DIR = os.getenv("DATA_DIR", ".cofure_data")
+INDICATOR_STATE_FILE = os.path.join(DATA_DIR, "indicators.json")
+MACRO_CALENDAR_FILE = os.path.join(DATA_DIR, "macro_calendar.json")
+STATE_DB_FILE = os.path.join(DATA_DIR, "state.db")
+# Kho lịch sử nến/funding dạng cột (memmap); cache nến đọc từ đây khi khởi động lại
+HISTORY_DIR = os.getenv("HISTORY_DIR", os.path.join(DATA_DIR, "history"))
+HISTORY_STORE_ENABLED = os.getenv("HISTORY_STORE", "1") == "1"
+# Tính chỉ báo cho cả nhóm symbol: "inline" (trên event loop), "pool" (ProcessPoolExecutor,
+# nến qua shared memory) hoặc "auto" (pool khi nhóm từ COMPUTE_POOL_MIN_SYMBOLS symbol trở lên)
+COMPUTE_MODE = os.getenv("COMPUTE_MODE", "auto").lower()
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", str(max(0, (os.cpu_count() or 1) - 1))))
+COMPUTE_POOL_MIN_SYMBOLS = int(os.getenv("COMPUTE_POOL_MIN_SYMBOLS", "300"))
+
+# Chạy theo vai trò: "all" = 1 process (gói free của Render); "split" = tách 2 process con:
+# "ingress" (webhook, lệnh nhẹ, gửi tin Telegram) và "worker" (job quét, lệnh cần dữ liệu, state)
+ROLE = os.getenv("COFURE_ROLE", "all").lower()
+# Unix socket nối ingress ↔ worker
+IPC_SOCKET = os.getenv("IPC_SOCKET", os.path.join(DATA_DIR, "ipc.sock"))
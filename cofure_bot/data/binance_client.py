@@ -1,103 +1,413 @@
+import asyncio
+import time
 import aiohttp
-from typing import List, Dict, Any
-from ..utils.net import with_retry
+from typing import Iterable, List, Dict, Any, Optional
+from urllib.parse import urlsplit
+from .compute_pool import ComputePool
+from .kline_cache import INTERVAL_MS, KLINES_MAX_LIMIT, KlineCache
+from .funding import FundingInfo, FundingTable
+from .indicators import SIGNAL_WINDOW, build_frame
+from .ranking import UniverseRanker
+from .resample import TIMEFRAMES, TimeframeBook, rows_to_columns, timeframe_rows
+from .streaming import IndicatorBook
+from .rate_limit import WeightLimiter, request_weight, retry_after_seconds
+from cofure_bot.utils.metrics import (
+    BINANCE_ERRORS, BINANCE_REQUESTS, BINANCE_SECONDS, BINANCE_WEIGHT, CACHE_LOOKUPS,
+)
 
 BINANCE_FAPI = "https://fapi.binance.com"
 HEADERS = {"Accept": "application/json"}
 
-@with_retry(max_attempts=3, base_delay=0.8)
-async def _get_json(session: aiohttp.ClientSession, url: str, params: dict = None):
-    async with session.get(
-        url,
-        params=params,
-        headers=HEADERS,
-        timeout=aiohttp.ClientTimeout(total=15)
-    ) as r:
-        r.raise_for_status()
-        return await r.json()
-
-async def fetch_24h_tickers(session: aiohttp.ClientSession) -> List[Dict[str, Any]]:
+# Pool kết nối dùng chung cho toàn bot
+POOL_LIMIT          = 64     # tổng số kết nối mở tối đa
+POOL_LIMIT_PER_HOST = 32     # tối đa/host (fapi.binance.com)
+DNS_TTL_SEC         = 300    # cache DNS 5 phút
+KEEPALIVE_SEC       = 60     # giữ kết nối rảnh để tái sử dụng giữa các lượt quét
+REQUEST_TIMEOUT_SEC = 15
+MAX_ATTEMPTS        = 3
+RETRY_BASE_DELAY    = 0.8
+
+# Bảng funding (premiumIndex) dùng lại trong 1 lượt quét
+FUNDING_TTL_SEC     = 30
+# Số series lạnh warm vào IndicatorBook giữa 2 lần nhường event loop
+WARM_CHUNK          = 32
+
+# Khoá lưu client trong application.bot_data
+BOT_DATA_KEY = "binance"
+
+class BinanceClient:
+    """
+    Client HTTP dùng chung: 1 ClientSession duy nhất, keep-alive, cache DNS, giới hạn kết nối.
+    Tạo 1 lần trong main.main(), mọi job/handler lấy qua get_client(context).
+    """
+    def __init__(self, base_url: str = BINANCE_FAPI,
+                 limit: int = POOL_LIMIT, limit_per_host: int = POOL_LIMIT_PER_HOST,
+                 dns_ttl: int = DNS_TTL_SEC, keepalive: float = KEEPALIVE_SEC,
+                 timeout: float = REQUEST_TIMEOUT_SEC):
+        self.base_url = base_url.rstrip("/")
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._dns_ttl = dns_ttl
+        self._keepalive = keepalive
+        self._timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Ngân sách weight/phút dùng chung cho mọi request REST
+        self.limiter = WeightLimiter()
+        # Cache nến dùng chung: các lượt quét sau chỉ tải nến mới
+        self.kline_cache = KlineCache()
+        # Bảng funding toàn universe (premiumIndex), làm mới theo TTL
+        self._funding: Optional[FundingTable] = None
+        self._funding_lock = asyncio.Lock()
+        # Trạng thái chỉ báo O(1) theo (symbol, interval); main() nạp/lưu ra đĩa
+        self.indicator_book = IndicatorBook()
+        # Nến khung lớn (15m/1h/4h) dựng từ nến cơ sở trong cache
+        self.timeframes = TimeframeBook()
+        # Xếp hạng toàn universe để chọn symbol quét nến (data/ranking.py)
+        self.ranker = UniverseRanker()
+        # Tính ma trận chỉ báo tại chỗ hoặc ở process pool (main() cấu hình theo COMPUTE_MODE)
+        self.compute = ComputePool()
+        # MarketStream (WebSocket) nếu được bật; None → chỉ dùng REST
+        self.stream = None
+        # MarketSnapshot dùng chung giữa các job trong cùng tick (data/snapshot.py)
+        self._snapshot = None
+        self._snapshot_lock = asyncio.Lock()
+
+    async def start(self) -> "BinanceClient":
+        self._ensure_session()
+        return self
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._limit,
+                limit_per_host=self._limit_per_host,
+                ttl_dns_cache=self._dns_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=self._keepalive,
+                enable_cleanup_closed=True,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+            )
+        return self._session
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Session dùng chung (cũng dùng cho host khác: lịch vĩ mô, tỷ giá)."""
+        return self._ensure_session()
+
+    async def close(self):
+        self.compute.close()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            # cho SSL transport đóng hẳn (khuyến nghị của aiohttp)
+            await asyncio.sleep(0.25)
+        self._session = None
+
+    def update_funding(self, items: Iterable[Dict[str, Any]]) -> FundingTable:
+        """
+        Gộp tin markPrice của WebSocket (toàn universe) vào bảng funding dùng chung;
+        lãi suất giữ theo bản REST gần nhất. Bảng coi như vừa làm mới → funding_table()
+        không gọi lại premiumIndex.
+        """
+        table = self._funding
+        if table is None:
+            table = self._funding = FundingTable([])
+        for d in items or []:
+            try:
+                old = table.get(d["s"])
+                table.update(FundingInfo.from_mark_price(d, old.interest_rate if old else 0.0001))
+            except (KeyError, TypeError, ValueError):
+                continue
+        table.fetched_at = time.monotonic()
+        return table
+
+    async def __aenter__(self) -> "BinanceClient":
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def get_json(self, path: str, params: dict = None):
+        """
+        GET JSON qua WeightLimiter: chờ ngân sách weight, đồng bộ weight đã dùng từ header,
+        429/418 → tạm dừng theo Retry-After rồi thử lại; lỗi mạng/5xx → backoff;
+        4xx khác → báo lỗi ngay.
+        """
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        endpoint = urlsplit(url).path
+        weight = request_weight(path, params)
+        attempt = 1
+        while True:
+            await self.limiter.acquire(weight)
+            BINANCE_WEIGHT.inc(weight, endpoint=endpoint)
+            t0 = time.perf_counter()
+            try:
+                async with self.session.get(url, params=params) as r:
+                    self.limiter.sync(r.headers)
+                    BINANCE_REQUESTS.inc(endpoint=endpoint, status=r.status)
+                    if r.status in (418, 429):
+                        BINANCE_ERRORS.inc(endpoint=endpoint, kind="rate_limited")
+                        self.limiter.ban(retry_after_seconds(r.headers))
+                        if attempt >= MAX_ATTEMPTS:
+                            r.raise_for_status()
+                        attempt += 1
+                        continue
+                    r.raise_for_status()
+                    data = await r.json()
+                    BINANCE_SECONDS.observe(time.perf_counter() - t0, endpoint=endpoint)
+                    return data
+            except aiohttp.ClientResponseError as e:
+                if e.status not in (418, 429):
+                    BINANCE_ERRORS.inc(endpoint=endpoint, kind="http_5xx" if e.status >= 500 else "http_4xx")
+                if e.status < 500 or attempt >= MAX_ATTEMPTS:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                BINANCE_ERRORS.inc(endpoint=endpoint,
+                                   kind="timeout" if isinstance(e, asyncio.TimeoutError) else "network")
+                if attempt >= MAX_ATTEMPTS:
+                    raise
+            await asyncio.sleep(RETRY_BASE_DELAY * attempt)
+            attempt += 1
+
+def get_client(context) -> BinanceClient:
+    """Lấy BinanceClient dùng chung từ context (job hoặc handler)."""
+    return context.bot_data[BOT_DATA_KEY]
+
+async def fetch_24h_tickers(client: BinanceClient) -> List[Dict[str, Any]]:
     """
     Trả về toàn bộ 24h tickers của Futures.
     Lọc lấy các symbol kết thúc bằng 'USDT' (perpetual USDT pairs).
     """
-    url = f"{BINANCE_FAPI}/fapi/v1/ticker/24hr"
-    data = await _get_json(session, url)
+    data = await client.get_json("/fapi/v1/ticker/24hr")
     return [d for d in data if isinstance(d, dict) and d.get("symbol", "").endswith("USDT")]
 
-async def top_gainers(session: aiohttp.ClientSession, n: int = 5) -> List[Dict[str, Any]]:
-    t = await fetch_24h_tickers(session)
+async def top_gainers(client: BinanceClient, n: int = 5) -> List[Dict[str, Any]]:
+    t = await fetch_24h_tickers(client)
     t = sorted(t, key=lambda x: float(x.get("priceChangePercent", 0) or 0), reverse=True)
     return t[:n]
 
-async def funding_rate_latest(session: aiohttp.ClientSession, symbol: str) -> float:
-    url = f"{BINANCE_FAPI}/fapi/v1/fundingRate"
-    data = await _get_json(session, url, params={"symbol": symbol, "limit": 1})
+async def funding_rate_latest(client: BinanceClient, symbol: str) -> float:
+    data = await client.get_json("/fapi/v1/fundingRate", params={"symbol": symbol, "limit": 1})
     try:
         return float(data[0]["fundingRate"]) if data else 0.0
     except Exception:
         return 0.0
 
-async def klines(session: aiohttp.ClientSession, symbol: str, interval: str = "5m", limit: int = 200):
-    url = f"{BINANCE_FAPI}/fapi/v1/klines"
-    return await _get_json(session, url, params={"symbol": symbol, "interval": interval, "limit": limit})
+async def fetch_funding_table(client: BinanceClient) -> FundingTable:
+    """1 request /fapi/v1/premiumIndex cho toàn bộ symbol: funding, funding dự kiến, mark price."""
+    data = await client.get_json("/fapi/v1/premiumIndex")
+    return FundingTable.from_raw(data if isinstance(data, list) else [])
+
+async def funding_table(client: BinanceClient, max_age: float = FUNDING_TTL_SEC) -> FundingTable:
+    """Bảng funding dùng chung; các lời gọi trong cùng lượt quét không tải lại."""
+    async with client._funding_lock:
+        if client._funding is None or client._funding.age() > max_age:
+            CACHE_LOOKUPS.inc(cache="funding", result="miss")
+            client._funding = await fetch_funding_table(client)
+        else:
+            CACHE_LOOKUPS.inc(cache="funding", result="hit")
+        return client._funding
+
+async def klines(client: BinanceClient, symbol: str, interval: str = "5m", limit: int = 200,
+                 start_time: Optional[int] = None):
+    params = {"symbol": symbol, "interval": interval, "limit": limit}
+    if start_time is not None:
+        params["startTime"] = int(start_time)
+    return await client.get_json("/fapi/v1/klines", params=params)
+
+async def cached_klines(client: BinanceClient, symbol: str, interval: str = "5m", limit: int = 200):
+    """Như klines() nhưng đi qua KlineCache: chỉ tải nến mới kể từ lần trước."""
+    async def fetch(start_time, n):
+        return await klines(client, symbol, interval=interval, limit=n, start_time=start_time)
+    return await client.kline_cache.get(fetch, symbol, interval, limit)
+
+async def cached_klines_since(client: BinanceClient, symbol: str, interval: str, since: int):
+    """Nến có open time >= since, qua KlineCache (chỉ tải phần còn thiếu)."""
+    async def fetch(start_time, n):
+        return await klines(client, symbol, interval=interval, limit=n, start_time=start_time)
+    return await client.kline_cache.get_since(fetch, symbol, interval, since)
 
-# === Chỉ báo cơ bản ===
+# === Chỉ báo cơ bản (bản tham chiếu thuần Python, cùng định nghĩa với data/indicators.py) ===
 def rsi(series, period: int = 14) -> float:
+    """RSI Wilder trên toàn bộ chuỗi (seed = trung bình `period` biến động đầu)."""
     if len(series) <= period:
         return 50.0
-    gains, losses = [], []
+    avg_gain = avg_loss = 0.0
     for i in range(1, period + 1):
-        delta = series[-i] - series[-i - 1]
-        (gains if delta >= 0 else losses).append(abs(delta))
-    avg_gain = sum(gains) / len(gains) if gains else 0.0
-    avg_loss = sum(losses) / len(losses) if losses else 1e-9
-    rs = (avg_gain / avg_loss) if avg_loss else 0
-    return 100 - (100 / (1 + rs))
+        delta = series[i] - series[i - 1]
+        avg_gain += max(delta, 0.0)
+        avg_loss += max(-delta, 0.0)
+    avg_gain /= period
+    avg_loss /= period
+    for i in range(period + 1, len(series)):
+        delta = series[i] - series[i - 1]
+        avg_gain = (avg_gain * (period - 1) + max(delta, 0.0)) / period
+        avg_loss = (avg_loss * (period - 1) + max(-delta, 0.0)) / period
+    if avg_loss <= 0:
+        return 100.0 if avg_gain > 0 else 50.0
+    return 100 - (100 / (1 + avg_gain / avg_loss))
 
 def ema(series, period: int):
+    """EMA trên toàn bộ chuỗi, seed = SMA của `period` giá đầu."""
     if len(series) < period:
         return series[-1]
     k = 2 / (period + 1)
-    e = series[-period]
-    for p in series[-period + 1:]:
+    e = sum(series[:period]) / period
+    for p in series[period:]:
         e = p * k + e * (1 - k)
     return e
 
-async def quick_signal_metrics(session: aiohttp.ClientSession, symbol: str, interval: str = "5m"):
-    ks = await klines(session, symbol, interval=interval, limit=200)
-    closes = [float(k[4]) for k in ks]
-    vol = [float(k[5]) for k in ks]
-    last = closes[-1]
-    rsi_val = rsi(closes, 14)
-    ema50 = ema(closes, 50)
-    ema200 = ema(closes, 200 if len(closes) >= 200 else max(10, len(closes)-1))
-    trend = 1 if ema50 > ema200 else -1
-
-    # ⚙️ an toàn khi MA20 volume = 0
-    if len(vol) >= 20:
-        ma20 = sum(vol[-20:]) / 20.0
-        vol_ratio = (vol[-1] / ma20) if ma20 > 1e-12 else 0.0
-    else:
-        vol_ratio = 1.0
-
-    fund = await funding_rate_latest(session, symbol)
+def _metrics_from_row(symbol: str, row: Dict[str, float], funding: FundingTable) -> Dict[str, Any]:
+    fi = funding.get(symbol)
+    last = row["last"]
     return {
         "last": last,
-        "rsi": rsi_val,
-        "ema50": ema50,
-        "ema200": ema200,
-        "trend": trend,
-        "vol_ratio": vol_ratio,
-        "funding": fund,
+        "rsi": row["rsi"],
+        "ema9": row["ema9"],
+        "ema21": row["ema21"],
+        "ema50": row["ema50"],
+        "ema200": row["ema200"],
+        "trend": 1 if row["ema50"] > row["ema200"] else -1,
+        "vol_ratio": row["vol_ratio"],
+        "ret1": row["ret1"],
+        "ret3": row["ret3"],
+        "funding": fi.funding if fi else 0.0,
+        "funding_next": fi.predicted_funding if fi else 0.0,
+        "mark_price": fi.mark_price if fi else last,
+        "next_funding_time": fi.next_funding_time if fi else 0,
     }
+
+async def batch_signal_metrics(client: BinanceClient, symbols: List[str], interval: str = "5m",
+                               funding: Optional[FundingTable] = None,
+                               concurrency: int = POOL_LIMIT_PER_HOST) -> Dict[str, Dict[str, Any]]:
+    """
+    Chỉ số nhanh cho nhiều symbol: tải nến song song (qua cache, tối đa `concurrency`
+    request cùng lúc) rồi tính chỉ báo 1 lượt vector hoá cho cả nhóm (tại chỗ hoặc ở
+    process pool khi nhóm lớn, xem client.compute).
+    Symbol lỗi tải nến sẽ bị bỏ qua.
+    """
+    if funding is None:
+        funding = await funding_table(client)
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(sym):
+        async with sem:
+            return await cached_klines(client, sym, interval=interval, limit=SIGNAL_WINDOW)
+
+    results = await asyncio.gather(*(one(s) for s in symbols), return_exceptions=True)
+    series = {s: ks for s, ks in zip(symbols, results) if isinstance(ks, list) and ks}
+    frame = await client.compute.frame(series)
+    return {s: _metrics_from_row(s, frame.row(s), funding) for s in frame.symbols}
+
+async def _advance_book(client: BinanceClient, symbol: str, interval: str) -> Optional[Dict[str, float]]:
+    """O(1): chỉ nạp các nến đã đóng kể từ lần trước; None nếu state chưa có/chưa đủ/hở nến."""
+    st = client.indicator_book.get(symbol, interval)
+    if st is None or not st.ready:
+        return None
+    ks = await cached_klines_since(client, symbol, interval, st.last_open_time)
+    return client.indicator_book.advance(symbol, interval, ks)
+
+async def book_signal_metrics(client: BinanceClient, symbols: List[str], interval: str = "5m",
+                              funding: Optional[FundingTable] = None,
+                              concurrency: int = POOL_LIMIT_PER_HOST) -> Dict[str, Dict[str, Any]]:
+    """
+    Như batch_signal_metrics nhưng đi qua client.indicator_book: symbol đã có state chỉ
+    nạp nến mới (MarketStream nạp sẵn nến vừa đóng → thường chỉ còn peek nến đang chạy).
+    Series lạnh (chưa có state / hở nến) tính bằng batch_signal_metrics rồi warm state
+    từ cùng cửa sổ nến cho các lượt sau.
+    """
+    if funding is None:
+        funding = await funding_table(client)
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(sym):
+        async with sem:
+            return await _advance_book(client, sym, interval)
+
+    results = await asyncio.gather(*(one(s) for s in symbols), return_exceptions=True)
+    out = {s: _metrics_from_row(s, row, funding)
+           for s, row in zip(symbols, results) if isinstance(row, dict)}
+    cold = [s for s in symbols if s not in out]
+    CACHE_LOOKUPS.inc(len(out), cache="indicators", result="hit")
+    if not cold:
+        return out
+    CACHE_LOOKUPS.inc(len(cold), cache="indicators", result="miss")
+    out.update(await batch_signal_metrics(client, cold, interval=interval, funding=funding,
+                                          concurrency=concurrency))
+    book = client.indicator_book
+    for i, sym in enumerate(cold):
+        ks = client.kline_cache.peek(sym, interval)
+        if ks:
+            book.warm(sym, interval, ks[-SIGNAL_WINDOW:])
+        if i % WARM_CHUNK == WARM_CHUNK - 1:
+            # warm O(cửa sổ) mỗi symbol → nhường event loop giữa các nhóm
+            await asyncio.sleep(0)
+    return out
+
+async def quick_signal_metrics(client: BinanceClient, symbol: str, interval: str = "5m",
+                               funding: Optional[FundingTable] = None):
+    if funding is None:
+        funding = await funding_table(client)
+    row = await _advance_book(client, symbol, interval)
+    if row is None:
+        ks = await cached_klines(client, symbol, interval=interval, limit=SIGNAL_WINDOW)
+        row = client.indicator_book.warm(symbol, interval, ks)
+        if row is None:
+            # listing mới, chưa đủ nến cho EMA200 → tính lại trên cửa sổ
+            row = build_frame({symbol: ks}).row(symbol)
+    return _metrics_from_row(symbol, row, funding)
+
+async def timeframe_metrics(client: BinanceClient, symbols: List[str], timeframes=TIMEFRAMES,
+                            interval: str = "5m",
+                            concurrency: int = POOL_LIMIT_PER_HOST) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Xu hướng EMA/RSI trên các khung lớn, dựng từ nến `interval` đang có trong KlineCache.
+    Lần đầu mỗi symbol: nạp lịch sử từ HistoryStore, thiếu thì 1 request nến cơ sở dài
+    (không bao giờ gọi klines() theo từng khung); các lần sau chỉ cộng dồn nến mới.
+    """
+    book = client.timeframes
+    step = INTERVAL_MS[interval]
+    depth = max(INTERVAL_MS[tf] // step for tf in timeframes) * book.maxlen
+    history = client.kline_cache.history
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def seed(sym):
+        cols = None
+        if history is not None:
+            table = history.klines(sym, interval)
+            last = table.last_key()
+            cached = client.kline_cache.peek(sym, interval)
+            # đĩa phải dài ít nhất bằng 1 request và nối liền nến trong cache
+            if last is not None and len(table) >= min(depth, KLINES_MAX_LIMIT) \
+                    and (not cached or last + step >= cached[0][0]):
+                cols = table.tail(depth)
+        if cols is None:
+            async with sem:
+                rows = await klines(client, sym, interval=interval, limit=min(depth, KLINES_MAX_LIMIT))
+            cols = rows_to_columns(rows or [])
+        book.seed(sym, interval, timeframes, cols)
+
+    pending = [s for s in symbols if not book.seeded(s, interval, timeframes)]
+    if pending:
+        # symbol lỗi chưa được seed → lần sau thử lại, lần này chỉ có nến trong cache
+        await asyncio.gather(*(seed(s) for s in pending), return_exceptions=True)
+    for s in symbols:
+        book.feed(s, interval, timeframes, client.kline_cache.peek(s, interval))
+    return timeframe_rows(book, symbols, interval, timeframes)
+
 # --- NEW: danh sách symbol có volume ổn định ---
-async def active_symbols(session: aiohttp.ClientSession, min_quote_volume: float = 5_000_000.0) -> List[str]:
+async def active_symbols(client: BinanceClient, min_quote_volume: float = 5_000_000.0) -> List[str]:
     """
     Lấy danh sách toàn bộ Futures USDT có quoteVolume >= ngưỡng (mặc định 5 triệu USDT/24h).
     Trả về danh sách symbol, ví dụ ["BTCUSDT", "ETHUSDT", ...]
     """
-    tickers = await fetch_24h_tickers(session)
+    tickers = await fetch_24h_tickers(client)
+    return symbols_from_tickers(tickers, min_quote_volume)
+
+def symbols_from_tickers(tickers: List[Dict[str, Any]], min_quote_volume: float = 5_000_000.0) -> List[str]:
     syms: List[str] = []
     for t in tickers:
         try:
@@ -0,0 +1,133 @@
+# cofure_bot/data/compute_pool.py
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .indicators import IndicatorFrame, build_frame, compute_matrix
+
+logger = logging.getLogger(__name__)
+
+COMPUTE_MODES     = ("auto", "inline", "pool")
+POOL_MIN_SYMBOLS  = 300     # "auto": universe nhỏ hơn → tính ngay trên event loop
+SHARD_MIN_ROWS    = 32      # shard nhỏ hơn → chi phí IPC lớn hơn phần tính
+PACK_CHUNK_ROWS   = 64      # số symbol đóng gói vào shared memory giữa 2 lần nhường event loop
+_FIELDS = IndicatorFrame.FIELDS
+
+# === Trong process con ===
+def _compute_shard(in_name: str, out_name: str, n: int, t: int, lo: int, hi: int) -> int:
+    """Tính chỉ báo cho dòng [lo, hi) của khối vào (2 × n × t: close, volume), ghi vào khối ra."""
+    # process con chỉ mượn khối (dùng chung resource tracker với process cha); cha tạo và unlink
+    shm_in, shm_out = SharedMemory(name=in_name), SharedMemory(name=out_name)
+    try:
+        data = np.ndarray((2, n, t), dtype=np.float64, buffer=shm_in.buf)
+        out = np.ndarray((len(_FIELDS), n), dtype=np.float64, buffer=shm_out.buf)
+        cols = compute_matrix(data[0, lo:hi], data[1, lo:hi])
+        for j, f in enumerate(_FIELDS):
+            out[j, lo:hi] = cols[f]
+        del data, out, cols       # bỏ view trước khi close() (còn view → BufferError)
+    finally:
+        shm_in.close()
+        shm_out.close()
+    return hi - lo
+
+def _warm() -> int:
+    return 0
+
+# === Trong process chính ===
+class ComputePool:
+    """
+    Tính ma trận chỉ báo (EMA/RSI/vol) cho cả nhóm symbol: "inline" trên event loop,
+    "pool" ở ProcessPoolExecutor chia symbol thành shard theo số worker, "auto" chọn
+    theo số symbol. Nến chỉ đi qua shared memory (close/volume vào, cột chỉ báo ra),
+    không pickle list nến. Đóng gói từng shard rồi nhường loop → loop không bị chặn cả lượt.
+    """
+    def __init__(self, mode: str = "inline", workers: int = 0, min_symbols: int = POOL_MIN_SYMBOLS):
+        if mode not in COMPUTE_MODES:
+            raise ValueError(f"unknown compute mode: {mode}")
+        self.mode = mode
+        self.workers = max(0, workers)
+        self.min_symbols = min_symbols
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.pooled = 0
+        self.inline = 0
+
+    def use_pool(self, n_symbols: int) -> bool:
+        if self.workers < 1 or self.mode == "inline":
+            return False
+        return self.mode == "pool" or n_symbols >= self.min_symbols
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: process con không thừa hưởng thread/socket của bot
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def start(self):
+        """Khởi động sẵn các worker (import numpy...) để lượt quét đầu không phải chờ."""
+        if self.workers < 1 or self.mode == "inline":
+            return
+        loop = asyncio.get_running_loop()
+        pool = self._pool()
+        await asyncio.gather(*(loop.run_in_executor(pool, _warm) for _ in range(self.workers)))
+        logger.info("Compute pool ready: %d workers (mode=%s)", self.workers, self.mode)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def frame(self, series: Dict[str, Sequence[Sequence]]) -> IndicatorFrame:
+        """Như indicators.build_frame(series), tính ở pool khi đủ lớn."""
+        if not self.use_pool(len(series)):
+            self.inline += 1
+            return build_frame(series)
+        self.pooled += 1
+        groups: Dict[int, List[str]] = {}
+        for sym, rows in series.items():
+            if rows:
+                groups.setdefault(len(rows), []).append(sym)
+        parts = await asyncio.gather(*(self._group(series, syms, t) for t, syms in groups.items()))
+        symbols = [s for syms, _ in parts for s in syms]
+        columns = {f: (np.concatenate([cols[f] for _, cols in parts]) if parts else np.empty(0))
+                   for f in _FIELDS}
+        return IndicatorFrame(symbols, columns)
+
+    def _shards(self, n: int) -> List[Tuple[int, int]]:
+        k = max(1, min(self.workers, n // SHARD_MIN_ROWS))
+        step = -(-n // k)
+        return [(lo, min(n, lo + step)) for lo in range(0, n, step)]
+
+    async def _group(self, series, syms: List[str], t: int) -> Tuple[List[str], Dict[str, np.ndarray]]:
+        n = len(syms)
+        loop = asyncio.get_running_loop()
+        pool = self._pool()
+        shm_in = SharedMemory(create=True, size=2 * n * t * 8)
+        shm_out = SharedMemory(create=True, size=len(_FIELDS) * n * 8)
+        data = np.ndarray((2, n, t), dtype=np.float64, buffer=shm_in.buf)
+        out = np.ndarray((len(_FIELDS), n), dtype=np.float64, buffer=shm_out.buf)
+        try:
+            jobs = []
+            for lo, hi in self._shards(n):
+                # đóng gói shard này rồi gửi ngay; shard sau đóng gói trong lúc worker tính
+                for i in range(lo, hi):
+                    rows = series[syms[i]]
+                    data[0, i] = [k[4] for k in rows]
+                    data[1, i] = [k[5] for k in rows]
+                    if (i - lo) % PACK_CHUNK_ROWS == PACK_CHUNK_ROWS - 1:
+                        await asyncio.sleep(0)
+                jobs.append(loop.run_in_executor(pool, _compute_shard, shm_in.name, shm_out.name, n, t, lo, hi))
+            await asyncio.gather(*jobs)
+            columns = {f: out[j].copy() for j, f in enumerate(_FIELDS)}
+        finally:
+            del data, out
+            shm_in.close()
+            shm_out.close()
+            shm_in.unlink()
+            shm_out.unlink()
+        return syms, columns
@@ -0,0 +1,96 @@
+# cofure_bot/data/funding.py
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+# Biên kẹp của Binance cho (interest - premium) khi tính funding
+FUNDING_CLAMP = 0.0005
+
+class FundingInfo:
+    """1 dòng của /fapi/v1/premiumIndex (funding + mark price)."""
+    __slots__ = ("symbol", "funding", "interest_rate", "mark_price", "index_price", "next_funding_time")
+
+    def __init__(self, symbol: str, funding: float, interest_rate: float,
+                 mark_price: float, index_price: float, next_funding_time: int):
+        self.symbol = symbol
+        self.funding = funding                      # lastFundingRate
+        self.interest_rate = interest_rate
+        self.mark_price = mark_price
+        self.index_price = index_price
+        self.next_funding_time = next_funding_time  # ms UTC
+
+    @property
+    def premium(self) -> float:
+        return (self.mark_price - self.index_price) / self.index_price if self.index_price else 0.0
+
+    @property
+    def predicted_funding(self) -> float:
+        """Ước lượng funding kỳ tới theo công thức Binance: P + clamp(I - P, ±0.05%)."""
+        p = self.premium
+        return p + max(-FUNDING_CLAMP, min(FUNDING_CLAMP, self.interest_rate - p))
+
+    @classmethod
+    def from_raw(cls, d: Dict[str, Any]) -> "FundingInfo":
+        def f(k):
+            try:
+                return float(d.get(k) or 0.0)
+            except (TypeError, ValueError):
+                return 0.0
+        return cls(
+            symbol=d["symbol"],
+            funding=f("lastFundingRate"),
+            interest_rate=f("interestRate"),
+            mark_price=f("markPrice"),
+            index_price=f("indexPrice"),
+            next_funding_time=int(d.get("nextFundingTime") or 0),
+        )
+
+    @classmethod
+    def from_mark_price(cls, d: Dict[str, Any], interest_rate: float) -> "FundingInfo":
+        """1 phần tử của stream markPrice (s, p, i, r, T); stream không có lãi suất → truyền vào."""
+        return cls(
+            symbol=d["s"],
+            funding=float(d.get("r") or 0.0),
+            interest_rate=interest_rate,
+            mark_price=float(d.get("p") or 0.0),
+            index_price=float(d.get("i") or 0.0),
+            next_funding_time=int(d.get("T") or 0),
+        )
+
+class FundingTable:
+    """Bảng funding/mark price cho toàn bộ universe, tải 1 lần mỗi lượt quét."""
+    def __init__(self, rows: List[FundingInfo], fetched_at: Optional[float] = None):
+        self._rows: Dict[str, FundingInfo] = {r.symbol: r for r in rows}
+        self.fetched_at = time.monotonic() if fetched_at is None else fetched_at
+
+    @classmethod
+    def from_raw(cls, data: List[Dict[str, Any]]) -> "FundingTable":
+        rows = []
+        for d in data or []:
+            if isinstance(d, dict) and d.get("symbol"):
+                try:
+                    rows.append(FundingInfo.from_raw(d))
+                except Exception:
+                    continue
+        return cls(rows)
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    def get(self, symbol: str) -> Optional[FundingInfo]:
+        return self._rows.get(symbol)
+
+    def rate(self, symbol: str, default: float = 0.0) -> float:
+        r = self._rows.get(symbol)
+        return r.funding if r else default
+
+    def update(self, info: FundingInfo):
+        self._rows[info.symbol] = info
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._rows
+
+    def __iter__(self) -> Iterator[FundingInfo]:
+        return iter(self._rows.values())
+
+    def __len__(self) -> int:
+        return len(self._rows)
@@ -0,0 +1,125 @@
+# cofure_bot/data/history_sync.py
+# python -m cofure_bot.data.history_sync --symbols BTCUSDT,ETHUSDT --interval 5m --days 365 [--root DIR]
+import argparse
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from cofure_bot.config import BINANCE_FAPI_URL, HISTORY_DIR
+from cofure_bot.storage.history import HistoryStore
+from .binance_client import BinanceClient, active_symbols, klines
+from .kline_cache import INTERVAL_MS, KLINES_MAX_LIMIT
+
+logger = logging.getLogger(__name__)
+
+FUNDING_MAX_LIMIT = 1000    # limit tối đa của /fapi/v1/fundingRate
+SYNC_CONCURRENCY  = 4
+
+async def _fetch_range(client: BinanceClient, symbol: str, interval: str, start: int, end: int) -> List[list]:
+    """Nến đã đóng có open time trong [start, end), mỗi request tối đa 1500 nến, không xin thừa."""
+    step = INTERVAL_MS[interval]
+    out: List[list] = []
+    while start < end:
+        want = min(KLINES_MAX_LIMIT, (end - start + step - 1) // step)
+        rows = await klines(client, symbol, interval=interval, limit=int(want), start_time=start)
+        rows = [r for r in rows or [] if r[0] < end]
+        if not rows:
+            break
+        out.extend(rows)
+        start = int(rows[-1][0]) + step
+    return out
+
+async def sync_klines(client: BinanceClient, store: HistoryStore, symbol: str, interval: str,
+                      start: Optional[int] = None) -> int:
+    """
+    Đồng bộ nến đã đóng của 1 symbol vào HistoryStore: chỉ tải đoạn thiếu phía trước
+    (start < nến đầu trên đĩa) và từ nến cuối trên đĩa tới hiện tại. Trả về số nến đã ghi.
+    """
+    step = INTERVAL_MS[interval]
+    now = int(time.time() * 1000)
+    end = now - now % step          # bỏ nến đang chạy
+    table = store.klines(symbol, interval)
+    first, last = table.first_key(), table.last_key()
+    if start is not None:
+        start = -(-start // step) * step    # làm tròn lên open time của nến
+    written = 0
+    if first is not None and start is not None and start < first:
+        written += store.prepend_klines(symbol, interval, await _fetch_range(client, symbol, interval, start, first))
+    if last is None:
+        if start is None:
+            start = end - KLINES_MAX_LIMIT * step
+        rows = await _fetch_range(client, symbol, interval, start, end)
+    else:
+        rows = await _fetch_range(client, symbol, interval, last + step, end)
+    if rows:
+        written += store.append_klines(symbol, interval, rows)
+    return written
+
+async def sync_funding(client: BinanceClient, store: HistoryStore, symbol: str,
+                       start: Optional[int] = None) -> int:
+    """Funding đã chốt từ lần cuối trên đĩa (hoặc `start`) tới hiện tại."""
+    last = store.funding(symbol).last_key()
+    since = last + 1 if last is not None else start
+    written = 0
+    while True:
+        params = {"symbol": symbol, "limit": FUNDING_MAX_LIMIT}
+        if since is not None:
+            params["startTime"] = int(since)
+        rows = await client.get_json("/fapi/v1/fundingRate", params=params)
+        if not rows:
+            break
+        written += store.append_funding(symbol, rows)
+        if len(rows) < FUNDING_MAX_LIMIT:
+            break
+        since = int(rows[-1]["fundingTime"]) + 1
+    return written
+
+async def sync_history(client: BinanceClient, store: HistoryStore, symbols: List[str], interval: str = "5m",
+                       days: Optional[float] = None, funding: bool = True,
+                       concurrency: int = SYNC_CONCURRENCY) -> Dict[str, int]:
+    """Đồng bộ nhiều symbol song song (weight đã qua WeightLimiter của client)."""
+    start = int((time.time() - days * 86400) * 1000) if days else None
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(sym: str) -> int:
+        async with sem:
+            try:
+                n = await sync_klines(client, store, sym, interval, start)
+                if funding:
+                    await sync_funding(client, store, sym, start)
+                return n
+            except Exception as e:
+                logger.warning("History sync failed for %s: %s", sym, e)
+                return 0
+
+    counts = await asyncio.gather(*(one(s) for s in symbols))
+    return dict(zip(symbols, counts))
+
+async def _main(args):
+    store = HistoryStore(args.root)
+    async with BinanceClient(base_url=BINANCE_FAPI_URL) as client:
+        if args.symbols:
+            symbols = [s.strip().upper() for s in args.symbols.split(",")]
+        else:
+            symbols = sorted(set(await active_symbols(client)) | set(store.symbols(args.interval)))
+        t0 = time.perf_counter()
+        counts = await sync_history(client, store, symbols, args.interval, args.days,
+                                    funding=not args.no_funding, concurrency=args.concurrency)
+        logger.info("Synced %d candles for %d symbols in %.1fs",
+                    sum(counts.values()), len(symbols), time.perf_counter() - t0)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Tải bù lịch sử nến/funding vào HistoryStore")
+    ap.add_argument("--root", default=HISTORY_DIR)
+    ap.add_argument("--symbols", help="danh sách symbol, ngăn cách bởi dấu phẩy (mặc định: universe + symbol đã có)")
+    ap.add_argument("--interval", default="5m")
+    ap.add_argument("--days", type=float, default=None, help="lùi về bao nhiêu ngày (mặc định: 1500 nến)")
+    ap.add_argument("--no-funding", action="store_true")
+    ap.add_argument("--concurrency", type=int, default=SYNC_CONCURRENCY)
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(_main(args))
+
+if __name__ == "__main__":
+    main()
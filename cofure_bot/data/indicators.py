@@ -0,0 +1,175 @@
+# cofure_bot/data/indicators.py
+from itertools import accumulate
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Kỳ EMA tính sẵn cho mọi symbol
+EMA_PERIODS = (9, 21, 50, 200)
+RSI_PERIOD  = 14
+VOL_MA      = 20
+# Số nến mỗi lượt tính chỉ báo (cửa sổ REST); streaming.IndicatorBook trượt trên cùng cửa sổ
+SIGNAL_WINDOW = 200
+
+# === Chỉ báo theo ma trận (symbols × nến), trục thời gian = cột ===
+def ema_matrix(x: np.ndarray, period: int) -> np.ndarray:
+    """
+    EMA cho từng hàng của ma trận x (n × T), seed = SMA của `period` giá đầu.
+    Các cột trước khi đủ `period` giá là NaN. Nếu T < period → cả hàng NaN.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(x.shape, np.nan)
+    T = x.shape[-1]
+    if T < period:
+        return out
+    k = 2.0 / (period + 1)
+    e = x[..., :period].mean(axis=-1)
+    out[..., period - 1] = e
+    for t in range(period, T):
+        e = x[..., t] * k + e * (1 - k)
+        out[..., t] = e
+    return out
+
+def rsi_matrix(x: np.ndarray, period: int = RSI_PERIOD) -> np.ndarray:
+    """RSI Wilder cho từng hàng (n × T); seed = trung bình `period` biến động đầu."""
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(x.shape, np.nan)
+    T = x.shape[-1]
+    if T <= period:
+        return out
+    d = np.diff(x, axis=-1)
+    gain = np.where(d > 0, d, 0.0)
+    loss = np.where(d < 0, -d, 0.0)
+    ag = gain[..., :period].mean(axis=-1)
+    al = loss[..., :period].mean(axis=-1)
+    out[..., period] = _rsi_from_avg(ag, al)
+    for t in range(period, T - 1):
+        ag = (ag * (period - 1) + gain[..., t]) / period
+        al = (al * (period - 1) + loss[..., t]) / period
+        out[..., t + 1] = _rsi_from_avg(ag, al)
+    return out
+
+def _rsi_from_avg(ag, al):
+    ag = np.asarray(ag, dtype=np.float64)
+    al = np.asarray(al, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = 100.0 - 100.0 / (1.0 + ag / al)
+    # không có nhịp giảm: tăng → 100, đi ngang → 50
+    return np.where(al > 0, r, np.where(ag > 0, 100.0, 50.0))
+
+# === Chuỗi 1 chiều rất dài (backtest): accumulate trên float thuần nhanh hơn numpy từng bước ===
+def ema_series(x: np.ndarray, period: int) -> np.ndarray:
+    """Như ema_matrix cho 1 chuỗi (kết quả trùng khớp)."""
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(x.shape, np.nan)
+    if len(x) < period:
+        return out
+    k = 2.0 / (period + 1)
+    seed = float(x[None, :period].mean(axis=-1)[0])
+    out[period - 1:] = list(accumulate(x[period:].tolist(), lambda e, v: v * k + e * (1 - k), initial=seed))
+    return out
+
+def rsi_series(x: np.ndarray, period: int = RSI_PERIOD) -> np.ndarray:
+    """Như rsi_matrix cho 1 chuỗi (kết quả trùng khớp)."""
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(x.shape, np.nan)
+    if len(x) <= period:
+        return out
+    d = np.diff(x)
+    gain = np.where(d > 0, d, 0.0)
+    loss = np.where(d < 0, -d, 0.0)
+
+    def wilder(a, g):
+        return (a * (period - 1) + g) / period
+
+    ag = accumulate(gain[period:].tolist(), wilder, initial=float(gain[None, :period].mean(axis=-1)[0]))
+    al = accumulate(loss[period:].tolist(), wilder, initial=float(loss[None, :period].mean(axis=-1)[0]))
+    out[period:] = _rsi_from_avg(np.fromiter(ag, np.float64), np.fromiter(al, np.float64))
+    return out
+
+def vol_ratio_matrix(v: np.ndarray, window: int = VOL_MA) -> np.ndarray:
+    """Volume nến cuối / MA`window` volume (cột cuối). T < window → 1.0; MA = 0 → 0.0."""
+    v = np.asarray(v, dtype=np.float64)
+    if v.shape[-1] < window:
+        return np.ones(v.shape[:-1])
+    ma = v[..., -window:].mean(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = v[..., -1] / ma
+    return np.where(ma > 1e-12, r, 0.0)
+
+def returns_last(x: np.ndarray, n: int) -> np.ndarray:
+    """Tỷ suất sinh lời n nến gần nhất (cột cuối so với cột -n-1)."""
+    x = np.asarray(x, dtype=np.float64)
+    if x.shape[-1] <= n:
+        return np.zeros(x.shape[:-1])
+    base = x[..., -n - 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = x[..., -1] / base - 1.0
+    return np.where(base != 0, r, 0.0)
+
+# === Kết quả 1 lượt tính cho cả universe ===
+class IndicatorFrame:
+    """Giá trị chỉ báo tại nến cuối cho mỗi symbol; tra cứu theo symbol."""
+    FIELDS = ("last", "ema9", "ema21", "ema50", "ema200", "rsi", "vol_ratio", "ret1", "ret3")
+
+    def __init__(self, symbols: List[str], columns: Dict[str, np.ndarray]):
+        self.symbols = symbols
+        self.index = {s: i for i, s in enumerate(symbols)}
+        self.columns = columns
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.index
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def row(self, symbol: str) -> Optional[Dict[str, float]]:
+        i = self.index.get(symbol)
+        if i is None:
+            return None
+        return {f: float(self.columns[f][i]) for f in self.FIELDS}
+
+def _last_or_close(mat: np.ndarray, closes: np.ndarray) -> np.ndarray:
+    # chưa đủ nến để seed → dùng giá đóng cửa cuối (giữ hành vi cũ của ema())
+    last = mat[:, -1]
+    return np.where(np.isnan(last), closes[:, -1], last)
+
+def compute_matrix(closes: np.ndarray, volumes: np.ndarray) -> Dict[str, np.ndarray]:
+    """Tính toàn bộ chỉ báo cho ma trận cùng độ dài (n × T)."""
+    closes = np.asarray(closes, dtype=np.float64)
+    volumes = np.asarray(volumes, dtype=np.float64)
+    T = closes.shape[1]
+    cols = {"last": closes[:, -1]}
+    for p in EMA_PERIODS:
+        # EMA200 khi thiếu nến: hạ kỳ như quick_signal_metrics cũ
+        period = p if (p != 200 or T >= 200) else max(10, T - 1)
+        cols[f"ema{p}"] = _last_or_close(ema_matrix(closes, period), closes)
+    r = rsi_matrix(closes, RSI_PERIOD)[:, -1]
+    cols["rsi"] = np.where(np.isnan(r), 50.0, r)
+    cols["vol_ratio"] = vol_ratio_matrix(volumes, VOL_MA)
+    cols["ret1"] = returns_last(closes, 1)
+    cols["ret3"] = returns_last(closes, 3)
+    return cols
+
+def build_frame(series: Dict[str, Sequence[Sequence]]) -> IndicatorFrame:
+    """
+    series: {symbol: nến thô Binance}. Gom các symbol có cùng số nến thành 1 ma trận
+    (thường là tất cả) rồi tính 1 lượt cho cả nhóm.
+    """
+    groups: Dict[int, List[str]] = {}
+    for sym, rows in series.items():
+        if rows:
+            groups.setdefault(len(rows), []).append(sym)
+
+    symbols: List[str] = []
+    parts: Dict[str, List[np.ndarray]] = {f: [] for f in IndicatorFrame.FIELDS}
+    for _, syms in groups.items():
+        closes = np.array([[k[4] for k in series[s]] for s in syms], dtype=np.float64)
+        vols = np.array([[k[5] for k in series[s]] for s in syms], dtype=np.float64)
+        cols = compute_matrix(closes, vols)
+        symbols.extend(syms)
+        for f in IndicatorFrame.FIELDS:
+            parts[f].append(cols[f])
+
+    columns = {f: (np.concatenate(v) if v else np.empty(0)) for f, v in parts.items()}
+    return IndicatorFrame(symbols, columns)
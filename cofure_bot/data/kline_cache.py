@@ -0,0 +1,212 @@
+# cofure_bot/data/kline_cache.py
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from cofure_bot.utils.metrics import CACHE_LOOKUPS
+
+# Độ dài 1 nến (ms) theo interval của Binance
+INTERVAL_MS = {
+    "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "6h": 21_600_000,
+    "8h": 28_800_000, "12h": 43_200_000, "1d": 86_400_000,
+}
+
+KLINE_CACHE_LEN   = 500    # số nến giữ lại mỗi (symbol, interval)
+KLINES_MAX_LIMIT  = 1500   # limit tối đa của /fapi/v1/klines
+MIN_REFRESH_SEC   = 5.0    # 2 lần gọi sát nhau (cùng 1 lượt quét) dùng lại cache
+LIVE_STALE_SEC    = 30.0   # WebSocket im lặng quá lâu → quay lại làm mới bằng REST
+PERSIST_GRACE_MS  = 5_000  # nến đóng được vài giây mới ghi đĩa (chờ bản cuối từ WebSocket)
+
+# fetch(start_time_ms | None, limit) -> list nến thô của Binance
+Fetcher = Callable[[Optional[int], int], Awaitable[list]]
+
+class _Series:
+    __slots__ = ("rows", "loaded", "refreshed_at", "live_at", "lock")
+
+    def __init__(self, maxlen: int):
+        self.rows: Deque[list] = deque(maxlen=maxlen)
+        self.loaded = 0            # limit đã tải đầy đủ lần đầu
+        self.refreshed_at = 0.0    # time.monotonic() lần làm mới gần nhất
+        self.live_at = 0.0         # lần cuối WebSocket đẩy nến vào (0 = không live)
+        self.lock = asyncio.Lock()
+
+class KlineCache:
+    """
+    Cache nến trong bộ nhớ theo (symbol, interval), lưu dạng ring buffer.
+    Lần đầu tải đủ `limit` nến; các lần sau chỉ xin nến có open time >= nến cuối
+    đang giữ (startTime + limit nhỏ) và thay thế nến cuối còn đang chạy.
+    Có `history` (HistoryStore) → lần đầu đọc nến đã đóng từ đĩa, chỉ tải phần còn thiếu,
+    và ghi nối các nến vừa đóng xuống đĩa.
+    """
+    def __init__(self, maxlen: int = KLINE_CACHE_LEN, min_refresh_sec: float = MIN_REFRESH_SEC,
+                 history=None):
+        self.maxlen = maxlen
+        self.min_refresh_sec = min_refresh_sec
+        self.history = history
+        self._series: Dict[Tuple[str, str], _Series] = {}
+
+    def _get_series(self, symbol: str, interval: str) -> _Series:
+        key = (symbol, interval)
+        s = self._series.get(key)
+        if s is None:
+            s = self._series[key] = _Series(self.maxlen)
+        return s
+
+    def peek(self, symbol: str, interval: str) -> List[list]:
+        """Trả về nến đang có trong cache (không gọi mạng)."""
+        s = self._series.get((symbol, interval))
+        return list(s.rows) if s else []
+
+    def merge(self, symbol: str, interval: str, rows: List[list]):
+        """Gộp nến mới: cùng open time → thay nến cuối, mới hơn → nối thêm, cũ hơn → bỏ."""
+        buf = self._get_series(symbol, interval).rows
+        for row in rows:
+            if not buf or row[0] > buf[-1][0]:
+                buf.append(row)
+            elif row[0] == buf[-1][0]:
+                buf[-1] = row
+
+    def merge_live(self, symbol: str, interval: str, row: list) -> bool:
+        """
+        Nến từ WebSocket. Chỉ nhận khi series đã có lịch sử và nối liền nến cuối;
+        hở nến (mất kết nối) → bỏ cờ live để lần get() sau tự backfill qua REST.
+        """
+        s = self._series.get((symbol, interval))
+        if s is None or not s.rows:
+            return False
+        step = INTERVAL_MS.get(interval)
+        if step and row[0] > s.rows[-1][0] + step:
+            s.live_at = 0.0
+            s.refreshed_at = 0.0
+            return False
+        self.merge(symbol, interval, [row])
+        s.live_at = time.monotonic()
+        return True
+
+    def mark_stale(self, interval: Optional[str] = None):
+        """Mất WebSocket: mọi series (của interval) phải làm mới lại bằng REST."""
+        for (_, i), s in self._series.items():
+            if interval is None or i == interval:
+                s.live_at = 0.0
+                s.refreshed_at = 0.0
+
+    def is_live(self, symbol: str, interval: str) -> bool:
+        s = self._series.get((symbol, interval))
+        return bool(s and s.live_at and time.monotonic() - s.live_at < LIVE_STALE_SEC)
+
+    async def get(self, fetch: Fetcher, symbol: str, interval: str = "5m", limit: int = 200) -> List[list]:
+        limit = min(limit, self.maxlen)
+        s = self._get_series(symbol, interval)
+        async with s.lock:
+            if s.loaded < limit or not s.rows:
+                result = await self._load_full(fetch, s, symbol, interval, limit)
+            else:
+                result = await self._refresh(fetch, s, symbol, interval, limit)
+            CACHE_LOOKUPS.inc(cache="klines", result=result)
+            self._persist(s, symbol, interval)
+            out = list(s.rows)
+        return out[-limit:]
+
+    async def get_since(self, fetch: Fetcher, symbol: str, interval: str, since: int) -> List[list]:
+        """
+        Nến có open time >= since. Cache chưa phủ tới `since` (vd. vừa khởi động lại)
+        thì chỉ xin từ `since` trở đi thay vì tải cả lịch sử.
+        """
+        s = self._get_series(symbol, interval)
+        async with s.lock:
+            if s.rows and s.rows[0][0] <= since:
+                result = await self._refresh(fetch, s, symbol, interval, s.loaded or 1)
+            else:
+                result = "miss"
+                step = INTERVAL_MS.get(interval) or 1
+                missing = (int(time.time() * 1000) - since) // step + 1
+                rows = await fetch(since, max(1, min(int(missing) + 1, KLINES_MAX_LIMIT)))
+                if rows:
+                    # cache chưa phủ `since` → thay bằng đoạn vừa tải (chưa đủ lịch sử đầy đủ)
+                    s.rows.clear()
+                    s.rows.extend(rows)
+                    s.loaded = 0
+                s.refreshed_at = time.monotonic()
+            CACHE_LOOKUPS.inc(cache="klines", result=result)
+            self._persist(s, symbol, interval)
+            return [r for r in s.rows if r[0] >= since]
+
+    async def _refresh(self, fetch: Fetcher, s: _Series, symbol: str, interval: str, limit: int) -> str:
+        """Làm mới phần đuôi; trả về "hit" (không gọi mạng), "partial" hoặc "miss" (tải lại hết)."""
+        now = time.monotonic()
+        if now - s.refreshed_at < self.min_refresh_sec:
+            return "hit"
+        if s.live_at and now - s.live_at < LIVE_STALE_SEC:
+            # WebSocket đang đẩy nến → dữ liệu đã mới, không cần REST
+            return "hit"
+        step = INTERVAL_MS.get(interval)
+        last_open = s.rows[-1][0]
+        missing = ((int(time.time() * 1000) - last_open) // step + 1) if step else limit
+        if missing > self.maxlen:
+            # nghỉ quá lâu → tải lại toàn bộ còn rẻ hơn
+            return await self._load_full(fetch, s, symbol, interval, max(limit, s.loaded))
+        rows = await fetch(last_open, max(1, min(int(missing) + 1, KLINES_MAX_LIMIT)))
+        self.merge(symbol, interval, rows or [])
+        s.refreshed_at = now
+        return "partial"
+
+    async def _load_full(self, fetch: Fetcher, s: _Series, symbol: str, interval: str, limit: int) -> str:
+        result = "partial"      # đọc từ đĩa, chỉ tải phần thiếu
+        rows = await self._load_from_history(fetch, symbol, interval, limit)
+        if rows is None:
+            result = "miss"
+            rows = await fetch(None, limit)
+        s.rows.clear()
+        s.rows.extend(rows or [])
+        # listing mới có ít nến hơn limit: vẫn coi là đã tải đủ
+        s.loaded = limit
+        s.refreshed_at = time.monotonic()
+        return result
+
+    async def _load_from_history(self, fetch: Fetcher, symbol: str, interval: str,
+                                 limit: int) -> Optional[List[list]]:
+        """Nến đã đóng trên đĩa + phần còn thiếu tới hiện tại; đĩa không đủ → None (tải như cũ)."""
+        step = INTERVAL_MS.get(interval)
+        if self.history is None or not step:
+            return None
+        rows = self.history.kline_rows(symbol, interval, limit, step)
+        if not rows:
+            return None
+        missing = (int(time.time() * 1000) - rows[-1][0]) // step
+        if missing > KLINES_MAX_LIMIT or len(rows) + missing < limit:
+            return None
+        if missing > 0:
+            rows.extend(await fetch(rows[-1][0] + step, int(missing)) or [])
+        return rows
+
+    def _persist(self, s: _Series, symbol: str, interval: str):
+        """
+        Ghi nối các nến đã đóng mới hơn nến cuối trên đĩa. Chỉ ghi khi liền mạch với đĩa;
+        hở (bot nghỉ quá lâu) thì để history_sync tải bù.
+        """
+        step = INTERVAL_MS.get(interval)
+        if self.history is None or not step or not s.rows:
+            return
+        last = self.history.klines(symbol, interval).last_key()
+        now_ms = int(time.time() * 1000)
+        new = []
+        for row in reversed(s.rows):
+            if last is not None and row[0] <= last:
+                break
+            if row[0] + step + PERSIST_GRACE_MS <= now_ms:
+                new.append(row)
+        if not new:
+            return
+        new.reverse()
+        if last is not None and new[0][0] != last + step:
+            return
+        self.history.append_klines(symbol, interval, new)
+
+    def drop(self, symbol: str, interval: Optional[str] = None):
+        for key in [k for k in self._series if k[0] == symbol and (interval is None or k[1] == interval)]:
+            self._series.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._series)
@@ -1,11 +1,20 @@
+import asyncio
+import json
+import time
 import aiohttp
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional
 import pytz
 
+from cofure_bot.config import MACRO_CALENDAR_FILE, FF_CALENDAR_URL
+from cofure_bot.utils.files import write_snapshot
+
 VN_TZ = pytz.timezone("Asia/Ho_Chi_Minh")
 
-FF_THISWEEK = "https://nfs.faireconomy.media/ff_calendar_thisweek.json"
+FF_THISWEEK = FF_CALENDAR_URL
+
+CALENDAR_TTL_SEC   = 300    # quá hạn → xác thực lại bằng GET có điều kiện (thường chỉ nhận 304)
+CALENDAR_RETRY_SEC = 60     # tải lỗi → giữ dữ liệu cũ, thử lại sau
 
 # Từ khóa sự kiện quan trọng tác động mạnh tới crypto (IN HOA để so khớp)
 CRYPTO_KEYS = {
@@ -110,16 +119,6 @@ def _vi(title: str) -> str:
         out = out.replace(k, v)
     return out or "Sự kiện vĩ mô"
 
-async def _fetch_ff_week() -> List[Dict[str, Any]]:
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(FF_THISWEEK, timeout=aiohttp.ClientTimeout(total=12)) as r:
-                if r.status != 200:
-                    return []
-                return await r.json()
-    except Exception:
-        return []
-
 def _pick_actual(e: Dict[str, Any]) -> str:
     cands = ["actual", "value", "result", "release"]
     for k in cands:
@@ -174,28 +173,139 @@ def _filter_events_crypto_high(raw: List[Dict[str, Any]]) -> List[Dict[str, Any]
     out.sort(key=lambda x: x["time_vn"])
     return out
 
+class MacroCalendar:
+    """
+    Lịch ForexFactory tuần này: cache trong bộ nhớ + snapshot trên đĩa (sống qua restart).
+    Hết TTL thì xác thực lại bằng ETag/If-Modified-Since; 304 → giữ nguyên, chỉ lọc
+    lại khi nội dung đổi. Sự kiện đã lọc được đánh chỉ mục theo ngày giờ VN.
+    """
+    def __init__(self, path: str = MACRO_CALENDAR_FILE, ttl: float = CALENDAR_TTL_SEC):
+        self.path = path
+        self.ttl = ttl
+        self.raw: List[Dict[str, Any]] = []
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.fetched_at = 0.0          # time.time() lần tải/xác thực thành công gần nhất
+        self.events: List[Dict[str, Any]] = []
+        self.by_date: Dict[date, List[Dict[str, Any]]] = {}
+        self.version = 0               # tăng mỗi khi danh sách sự kiện thay đổi
+        self.requests = 0
+        self.not_modified = 0
+        self._retry_at = 0.0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    def _index(self, raw: List[Dict[str, Any]]) -> bool:
+        events = _filter_events_crypto_high(raw)
+        by_date: Dict[date, List[Dict[str, Any]]] = {}
+        for e in events:
+            by_date.setdefault(e["time_vn"].date(), []).append(e)
+        changed = events != self.events
+        self.raw, self.events, self.by_date = raw, events, by_date
+        if changed:
+            self.version += 1
+        return changed
+
+    # --- Snapshot trên đĩa ---
+    def _load(self):
+        self._loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                d = json.load(f)
+            raw = d.get("raw")
+            if not isinstance(raw, list):
+                return
+        except (OSError, ValueError, AttributeError):
+            return
+        self.etag = d.get("etag")
+        self.last_modified = d.get("last_modified")
+        self.fetched_at = float(d.get("fetched_at") or 0.0)
+        self._index(raw)
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {"raw": self.raw, "etag": self.etag,
+                "last_modified": self.last_modified, "fetched_at": self.fetched_at}
+
+    # --- Làm mới ---
+    async def _get(self, session: aiohttp.ClientSession):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        self.requests += 1
+        async with session.get(FF_THISWEEK, headers=headers, timeout=aiohttp.ClientTimeout(total=12)) as r:
+            if r.status == 304:
+                self.not_modified += 1
+                return None
+            if r.status != 200:
+                raise aiohttp.ClientResponseError(r.request_info, r.history, status=r.status)
+            return await r.json(), r.headers.get("ETag"), r.headers.get("Last-Modified")
+
+    async def refresh(self, session: Optional[aiohttp.ClientSession] = None,
+                      max_age: Optional[float] = None) -> bool:
+        """
+        Làm mới nếu dữ liệu cũ hơn max_age (mặc định TTL). Trả về True nếu danh sách
+        sự kiện thay đổi. Lỗi mạng → giữ dữ liệu cũ.
+        """
+        max_age = self.ttl if max_age is None else max_age
+        async with self._lock:
+            if not self._loaded:
+                await asyncio.to_thread(self._load)
+            now = time.time()
+            if now - self.fetched_at < max_age or now < self._retry_at:
+                return False
+            # Ưu tiên session dùng chung (BinanceClient.session); không có thì mở tạm
+            try:
+                if session is None:
+                    async with aiohttp.ClientSession() as tmp:
+                        res = await self._get(tmp)
+                else:
+                    res = await self._get(session)
+            except Exception:
+                self._retry_at = now + CALENDAR_RETRY_SEC
+                return False
+            self.fetched_at = now
+            if res is None:
+                return False
+            raw, self.etag, self.last_modified = res
+            changed = self._index(raw if isinstance(raw, list) else [])
+            try:
+                await asyncio.to_thread(write_snapshot, self.path, self._snapshot())
+            except OSError:
+                pass
+            return changed
+
+    # --- Tra cứu (không gọi mạng) ---
+    def for_date(self, d: date) -> List[Dict[str, Any]]:
+        return list(self.by_date.get(d, ()))
+
+    def between(self, start: date, end: date) -> List[Dict[str, Any]]:
+        return [e for e in self.events if start <= e["time_vn"].date() <= end]
+
+CALENDAR = MacroCalendar()
+
+async def macro_calendar(session: Optional[aiohttp.ClientSession] = None,
+                         max_age: Optional[float] = None) -> MacroCalendar:
+    await CALENDAR.refresh(session, max_age)
+    return CALENDAR
+
 # ====== PUBLIC ======
-async def fetch_macro_for_date(target_date_vn) -> List[Dict[str, Any]]:
-    raw = await _fetch_ff_week()
-    if not raw:
-        return []
-    events = _filter_events_crypto_high(raw)
-    return [e for e in events if e["time_vn"].date() == target_date_vn]
-
-async def fetch_macro_today() -> List[Dict[str, Any]]:
+async def fetch_macro_for_date(target_date_vn, session: Optional[aiohttp.ClientSession] = None) -> List[Dict[str, Any]]:
+    cal = await macro_calendar(session)
+    return cal.for_date(target_date_vn)
+
+async def fetch_macro_today(session: Optional[aiohttp.ClientSession] = None) -> List[Dict[str, Any]]:
     today = datetime.now(VN_TZ).date()
-    return await fetch_macro_for_date(today)
+    return await fetch_macro_for_date(today, session)
 
-async def fetch_macro_tomorrow() -> List[Dict[str, Any]]:
+async def fetch_macro_tomorrow(session: Optional[aiohttp.ClientSession] = None) -> List[Dict[str, Any]]:
     tomorrow = (datetime.now(VN_TZ) + timedelta(days=1)).date()
-    return await fetch_macro_for_date(tomorrow)
+    return await fetch_macro_for_date(tomorrow, session)
 
-async def fetch_macro_week() -> List[Dict[str, Any]]:
-    raw = await _fetch_ff_week()
-    if not raw:
-        return []
-    events = _filter_events_crypto_high(raw)
+async def fetch_macro_week(session: Optional[aiohttp.ClientSession] = None) -> List[Dict[str, Any]]:
+    cal = await macro_calendar(session)
     now = datetime.now(VN_TZ)
     monday = (now - timedelta(days=now.weekday())).date()
     sunday = monday + timedelta(days=6)
-    return [e for e in events if monday <= e["time_vn"].date() <= sunday]
+    return cal.between(monday, sunday)
@@ -0,0 +1,191 @@
+# cofure_bot/data/market_stream.py
+import asyncio
+import json
+import logging
+import time
+from typing import Iterable, List, Optional, Set
+
+import aiohttp
+
+from .binance_client import BinanceClient, cached_klines
+from .indicators import SIGNAL_WINDOW
+
+logger = logging.getLogger(__name__)
+
+BINANCE_FSTREAM = "wss://fstream.binance.com"
+
+MARK_PRICE_STREAM   = "!markPrice@arr@1s"
+MAX_STREAMS         = 200     # Binance cho tối đa 1024 stream/kết nối; giữ mức an toàn
+SUBSCRIBE_BATCH     = 50      # số stream mỗi lệnh SUBSCRIBE
+SUBSCRIBE_GAP_SEC   = 0.25    # Binance giới hạn 10 message gửi lên/giây
+RECONNECT_MIN_SEC   = 1.0
+RECONNECT_MAX_SEC   = 60.0
+BACKFILL_CONCURRENCY = 8
+
+def _kline_stream(symbol: str, interval: str) -> str:
+    return f"{symbol.lower()}@kline_{interval}"
+
+def _kline_row(k: dict) -> list:
+    # cùng thứ tự cột với /fapi/v1/klines
+    return [k["t"], k["o"], k["h"], k["l"], k["c"], k["v"], k["T"], k["q"], k["n"], k["V"], k["Q"], "0"]
+
+class MarketStream:
+    """
+    Nhận dữ liệu thị trường qua combined stream của Binance và ghi thẳng vào
+    trạng thái dùng chung của BinanceClient (KlineCache + bảng funding), để các job
+    đọc dữ liệu mới mà không phải gọi REST. Tự kết nối lại, đăng ký lại stream
+    và backfill khoảng hở bằng REST.
+    """
+    def __init__(self, client: BinanceClient, url: str = BINANCE_FSTREAM, interval: str = "5m",
+                 max_streams: int = MAX_STREAMS):
+        self.client = client
+        self.url = url.rstrip("/")
+        self.interval = interval
+        self.max_streams = max_streams
+        self._symbols: Set[str] = set()
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._task: Optional[asyncio.Task] = None
+        # backfill chạy nền sau mỗi lần kết nối (giữ tham chiếu để không bị GC, huỷ khi stop)
+        self._backfills: Set[asyncio.Task] = set()
+        self._msg_id = 0
+        self._send_lock = asyncio.Lock()
+        self.connected = asyncio.Event()
+        self.messages = 0
+        self.reconnects = 0
+        self.last_message_at = 0.0
+
+    # --- Vòng đời ---
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="market_stream")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for t in list(self._backfills):
+            t.cancel()
+        if self._backfills:
+            await asyncio.gather(*self._backfills, return_exceptions=True)
+        if self._ws is not None and not self._ws.closed:
+            await self._ws.close()
+        self.connected.clear()
+
+    @property
+    def symbols(self) -> List[str]:
+        return sorted(self._symbols)
+
+    # --- Đăng ký symbol ---
+    async def set_symbols(self, symbols: Iterable[str]):
+        """Theo dõi đúng tập symbol này (cắt ở max_streams); gửi SUBSCRIBE/UNSUBSCRIBE phần chênh."""
+        wanted = set(list(dict.fromkeys(symbols))[: self.max_streams])
+        added, removed = wanted - self._symbols, self._symbols - wanted
+        self._symbols = wanted
+        if not self.connected.is_set():
+            # sẽ đăng ký toàn bộ khi kết nối
+            return
+        if removed:
+            await self._send("UNSUBSCRIBE", [_kline_stream(s, self.interval) for s in removed])
+        if added:
+            await self._send("SUBSCRIBE", [_kline_stream(s, self.interval) for s in added])
+            await self._backfill(added)
+
+    async def _send(self, method: str, params: List[str]):
+        ws = self._ws
+        if ws is None or ws.closed:
+            return
+        async with self._send_lock:
+            for i in range(0, len(params), SUBSCRIBE_BATCH):
+                self._msg_id += 1
+                await ws.send_str(json.dumps({"method": method, "params": params[i:i + SUBSCRIBE_BATCH], "id": self._msg_id}))
+                await asyncio.sleep(SUBSCRIBE_GAP_SEC)
+
+    async def _backfill(self, symbols: Iterable[str]):
+        """Bù nến bị lỡ qua REST (KlineCache chỉ xin phần còn thiếu)."""
+        sem = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+
+        async def one(sym):
+            async with sem:
+                try:
+                    await cached_klines(self.client, sym, interval=self.interval, limit=SIGNAL_WINDOW)
+                except Exception as e:
+                    logger.debug("backfill %s failed: %s", sym, e)
+
+        await asyncio.gather(*(one(s) for s in list(symbols)))
+
+    def _spawn_backfill(self, symbols: Set[str]):
+        t = asyncio.create_task(self._backfill(symbols), name="market_stream_backfill")
+        self._backfills.add(t)
+        t.add_done_callback(self._backfill_done)
+
+    def _backfill_done(self, t: asyncio.Task):
+        self._backfills.discard(t)
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning("Market stream backfill failed: %s", t.exception())
+
+    # --- Vòng kết nối ---
+    async def _run(self):
+        delay = RECONNECT_MIN_SEC
+        while True:
+            try:
+                url = f"{self.url}/stream?streams={MARK_PRICE_STREAM}"
+                async with self.client.session.ws_connect(url, heartbeat=30, autoping=True) as ws:
+                    self._ws = ws
+                    self.connected.set()
+                    delay = RECONNECT_MIN_SEC
+                    logger.info("Market stream connected (%d symbols)", len(self._symbols))
+                    if self._symbols:
+                        await self._send("SUBSCRIBE", [_kline_stream(s, self.interval) for s in self._symbols])
+                        self._spawn_backfill(set(self._symbols))
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self._on_text(msg.data)
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Market stream error: %s", e)
+            finally:
+                self._ws = None
+                if self.connected.is_set():
+                    self.connected.clear()
+                    # dữ liệu cache không còn được đẩy → REST làm mới cho tới khi nối lại
+                    self.client.kline_cache.mark_stale(self.interval)
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SEC)
+
+    # --- Xử lý message ---
+    def _on_text(self, raw: str):
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            return
+        stream, data = msg.get("stream"), msg.get("data")
+        if not stream or data is None:
+            return  # phản hồi SUBSCRIBE {"result": null, "id": n}
+        self.messages += 1
+        self.last_message_at = time.monotonic()
+        if stream.startswith("!markPrice@arr"):
+            self._on_mark_prices(data)
+        elif "@kline_" in stream and isinstance(data, dict):
+            k = data.get("k") or {}
+            if k.get("i") == self.interval:
+                sym, row = data.get("s") or k.get("s"), _kline_row(k)
+                if self.client.kline_cache.merge_live(sym, self.interval, row) and k.get("x"):
+                    # nến vừa đóng → trạng thái chỉ báo tiến 1 nến (O(1)), lượt quét sau chỉ peek
+                    self.client.indicator_book.close_candle(sym, self.interval, row)
+
+    def _on_mark_prices(self, items: list):
+        self.client.update_funding(items)
+
+async def track_symbols(client: BinanceClient, symbols: Iterable[str]):
+    """Các job gọi để stream theo dõi đúng tập ứng viên đang quét (không có stream → bỏ qua)."""
+    stream = getattr(client, "stream", None)
+    if stream is not None:
+        await stream.set_symbols(symbols)
@@ -0,0 +1,88 @@
+# cofure_bot/data/ranking.py
+import heapq
+import math
+from statistics import median
+from typing import Dict, Iterable, List, Mapping, Sequence
+
+from .funding import FundingTable
+
+# Tầng 1: chấm điểm toàn universe chỉ từ bảng ticker 24h + funding (đã tải sẵn, không gọi thêm)
+RANK_WEIGHTS = {"move": 1.0, "funding": 1.0, "premium": 0.5, "liquidity": 0.5}
+FEATURE_CAP   = 8.0      # 1 đặc trưng (đã chia trung vị) không vượt quá → 1 symbol bất thường không át hết
+EXPLORE_SHARE = 0.1      # phần slot quay vòng phần còn lại của universe
+EVICT_AFTER   = 30       # số lượt chọn liên tiếp vắng mặt → bỏ nến của symbol khỏi cache
+
+def _features(symbols: Sequence[str], tickers: Mapping, funding: FundingTable) -> Dict[str, List[float]]:
+    out = {}
+    for s in symbols:
+        t = tickers.get(s)
+        fi = funding.get(s)
+        out[s] = [
+            abs(t.change_pct) if t else 0.0,
+            max(abs(fi.funding), abs(fi.predicted_funding)) if fi else 0.0,
+            abs(fi.premium) if fi else 0.0,
+            t.quote_volume if t else 0.0,
+        ]
+    return out
+
+def prefilter_scores(symbols: Sequence[str], tickers: Mapping, funding: FundingTable) -> Dict[str, float]:
+    """
+    Điểm tầng 1 mỗi symbol: biến động 24h, |funding| (đã chốt/dự kiến), |premium| mark-index
+    (chia cho trung vị toàn universe → không phụ thuộc đơn vị) + thanh khoản (log so với trung vị).
+    """
+    feats = _features(symbols, tickers, funding)
+    if not feats:
+        return {}
+    cols = list(zip(*feats.values()))
+    scale = []
+    for col in cols[:3]:
+        m = median(col)
+        scale.append(m if m > 0 else (sum(col) / len(col)) or 1.0)
+    qv_med = median(cols[3]) or 1.0
+    w = RANK_WEIGHTS
+    scores = {}
+    for s, (move, fund, prem, qv) in feats.items():
+        scores[s] = (w["move"] * min(FEATURE_CAP, move / scale[0])
+                     + w["funding"] * min(FEATURE_CAP, fund / scale[1])
+                     + w["premium"] * min(FEATURE_CAP, prem / scale[2])
+                     + w["liquidity"] * (math.log10(qv / qv_med) if qv > 0 else -1.0))
+    return scores
+
+class UniverseRanker:
+    """
+    Chọn `k` symbol đưa sang tầng 2 (tải nến, tính chỉ báo): top-K theo điểm tầng 1 (heap),
+    cộng vài slot quay vòng qua phần còn lại để cả thị trường lần lượt được chấm bằng nến.
+    """
+    def __init__(self, explore_share: float = EXPLORE_SHARE, evict_after: int = EVICT_AFTER):
+        self.explore_share = explore_share
+        self.evict_after = evict_after
+        self.scores: Dict[str, float] = {}
+        self._cursor = 0
+        self._tick = 0
+        self._last_picked: Dict[str, int] = {}
+
+    def select(self, universe: Sequence[str], tickers: Mapping, funding: FundingTable, k: int) -> List[str]:
+        self.scores = prefilter_scores(universe, tickers, funding)
+        k = min(k, len(universe))
+        n_explore = int(k * self.explore_share) if len(universe) > k else 0
+        top = heapq.nlargest(k - n_explore, universe, key=self.scores.__getitem__)
+        explore: List[str] = []
+        if n_explore:
+            chosen = set(top)
+            rest = [s for s in universe if s not in chosen]
+            start = self._cursor % len(rest)
+            explore = [rest[(start + i) % len(rest)] for i in range(min(n_explore, len(rest)))]
+            self._cursor = start + len(explore)
+        picks = top + explore
+        self._tick += 1
+        for s in picks:
+            self._last_picked[s] = self._tick
+        return picks
+
+    def evicted(self, keep: Iterable[str] = ()) -> List[str]:
+        """Symbol vắng mặt quá `evict_after` lượt (trừ `keep`): caller bỏ cache nến của chúng."""
+        keep = set(keep)
+        old = [s for s, t in self._last_picked.items() if self._tick - t > self.evict_after and s not in keep]
+        for s in old:
+            self._last_picked.pop(s, None)
+        return old
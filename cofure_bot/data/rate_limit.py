@@ -0,0 +1,111 @@
+# cofure_bot/data/rate_limit.py
+import asyncio
+import time
+from typing import Mapping, Optional
+
+# Binance Futures: 2400 weight/phút/IP — chừa biên cho các tiến trình/IP dùng chung
+WEIGHT_LIMIT_1M   = 2400
+WEIGHT_BUDGET_1M  = 2000
+USED_WEIGHT_HEADER = "X-MBX-USED-WEIGHT-1M"
+MAX_BAN_WAIT_SEC  = 120.0   # bị cấm lâu hơn → báo lỗi ngay thay vì treo job
+
+class RateLimitedError(Exception):
+    """Đang bị Binance chặn (429/418) quá lâu để chờ."""
+
+def request_weight(path: str, params: Optional[Mapping] = None) -> int:
+    """Weight của 1 request REST theo tài liệu Binance USDⓈ-M Futures."""
+    params = params or {}
+    if path.endswith("/klines"):
+        limit = int(params.get("limit", 500))
+        if limit < 100:
+            return 1
+        if limit < 500:
+            return 2
+        if limit <= 1000:
+            return 5
+        return 10
+    if path.endswith("/ticker/24hr"):
+        return 1 if "symbol" in params else 40
+    if path.endswith("/premiumIndex"):
+        return 1 if "symbol" in params else 10
+    return 1
+
+def retry_after_seconds(headers: Mapping, default: float = 60.0) -> float:
+    try:
+        return max(1.0, float(headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return default
+
+class WeightLimiter:
+    """
+    Ngân sách weight theo cửa sổ 1 phút (giống Binance). Người gọi xếp hàng FIFO
+    (asyncio.Lock công bằng) và chờ sang phút mới khi hết ngân sách thay vì bị lỗi.
+    Số weight đã dùng được đồng bộ lại từ header X-MBX-USED-WEIGHT-1M.
+    """
+    def __init__(self, budget: int = WEIGHT_BUDGET_1M, max_ban_wait: float = MAX_BAN_WAIT_SEC):
+        self.budget = budget
+        self.max_ban_wait = max_ban_wait
+        self._window = self._current_window()
+        self._used = 0
+        self._banned_until = 0.0
+        self._lock = asyncio.Lock()
+        self.waits = 0          # số lần phải chờ ngân sách
+        self.bans = 0           # số lần nhận 429/418
+
+    @staticmethod
+    def _current_window() -> int:
+        return int(time.time() // 60)
+
+    def _roll(self):
+        w = self._current_window()
+        if w != self._window:
+            self._window = w
+            self._used = 0
+
+    @property
+    def used(self) -> int:
+        self._roll()
+        return self._used
+
+    def headroom(self) -> int:
+        """Weight còn dùng được trong phút hiện tại."""
+        if time.time() < self._banned_until:
+            return 0
+        return max(0, self.budget - self.used)
+
+    def affordable(self, weight_each: int, reserve: int = 0) -> int:
+        """Số request (mỗi cái `weight_each`) còn gửi được trong phút này."""
+        return max(0, self.headroom() - reserve) // max(1, weight_each)
+
+    async def acquire(self, weight: int = 1):
+        async with self._lock:
+            while True:
+                now = time.time()
+                if now < self._banned_until:
+                    wait = self._banned_until - now
+                    if wait > self.max_ban_wait:
+                        raise RateLimitedError(f"Binance rate limited for {wait:.0f}s more")
+                elif self.used + weight <= self.budget or self._used == 0:
+                    self._used += weight
+                    return
+                else:
+                    wait = (self._window + 1) * 60 - now + 0.05
+                self.waits += 1
+                await asyncio.sleep(max(0.05, wait))
+
+    def sync(self, headers: Mapping):
+        """Cập nhật weight đã dùng theo số liệu của server (chính xác hơn ước lượng local)."""
+        v = headers.get(USED_WEIGHT_HEADER)
+        if v is None:
+            return
+        try:
+            used = int(v)
+        except (TypeError, ValueError):
+            return
+        self._roll()
+        self._used = max(self._used, used)
+
+    def ban(self, seconds: float):
+        """Nhận 429/418: dừng mọi request tới khi hết Retry-After."""
+        self.bans += 1
+        self._banned_until = max(self._banned_until, time.time() + seconds)
@@ -0,0 +1,189 @@
+# cofure_bot/data/resample.py
+from collections import deque
+from typing import Deque, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .indicators import build_frame
+from .kline_cache import INTERVAL_MS
+
+# Khung lớn dựng từ nến cơ sở (1m/5m) đang có: không gọi thêm klines() cho từng khung
+TIMEFRAMES  = ("15m", "1h", "4h")
+TF_BARS     = 150     # số nến giữ lại mỗi (symbol, khung)
+TF_MIN_BARS = 22      # ít hơn → chưa đủ cho EMA21, trend = 0
+TF_SLOW_MIN = 50      # đủ nến → xu hướng theo EMA21/50, chưa đủ → EMA9/21
+
+# Nến khung lớn: [open_time, open, high, low, close, volume] (cùng vị trí cột với nến Binance)
+Bar = List[float]
+
+def _aggregate(bucket: int, rows: Mapping[int, Sequence]) -> Bar:
+    ordered = [rows[t] for t in sorted(rows)]
+    return [bucket, float(ordered[0][1]), max(float(r[2]) for r in ordered), min(float(r[3]) for r in ordered),
+            float(ordered[-1][4]), sum(float(r[5]) for r in ordered)]
+
+def rows_to_columns(rows: Sequence[Sequence]) -> Dict[str, np.ndarray]:
+    """Nến thô Binance (giá dạng chuỗi) → cột numpy như HistoryStore."""
+    return {
+        "open_time": np.array([int(r[0]) for r in rows], dtype=np.int64),
+        "open": np.array([float(r[1]) for r in rows], dtype=np.float64),
+        "high": np.array([float(r[2]) for r in rows], dtype=np.float64),
+        "low": np.array([float(r[3]) for r in rows], dtype=np.float64),
+        "close": np.array([float(r[4]) for r in rows], dtype=np.float64),
+        "volume": np.array([float(r[5]) for r in rows], dtype=np.float64),
+    }
+
+class _TfSeries:
+    """
+    1 khung của 1 symbol: các nến đã đóng + nhóm nến cơ sở của nến đang chạy
+    (theo open time → nến cơ sở đang chạy được thay tại chỗ khi cập nhật).
+    """
+    __slots__ = ("step", "bars", "bucket", "partial", "seeded")
+
+    def __init__(self, step: int, maxlen: int):
+        self.step = step
+        self.bars: Deque[Bar] = deque(maxlen=maxlen)
+        self.bucket = -1
+        self.partial: Dict[int, Sequence] = {}
+        self.seeded = False
+
+    def _close_bucket(self):
+        if self.partial:
+            self.bars.append(_aggregate(self.bucket, self.partial))
+            self.partial = {}
+
+    def seed(self, cols: Mapping[str, np.ndarray]):
+        """Dựng 1 lượt (vector hoá) từ cột nến cơ sở tăng dần; nhóm cuối giữ lại làm nến đang chạy."""
+        self.seeded = True
+        self.bars.clear()
+        self.bucket = -1
+        self.partial = {}
+        t = np.asarray(cols["open_time"], dtype=np.int64)
+        if not len(t):
+            return
+        b = t - t % self.step
+        starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+        last = int(starts[-1])
+        done = starts[:-1]
+        if len(done):
+            o = np.asarray(cols["open"])[done]
+            h = np.maximum.reduceat(np.asarray(cols["high"][:last]), done)
+            lo = np.minimum.reduceat(np.asarray(cols["low"][:last]), done)
+            c = np.asarray(cols["close"])[starts[1:] - 1]
+            v = np.add.reduceat(np.asarray(cols["volume"][:last]), done)
+            self.bars.extend([int(bt), *vals] for bt, *vals in zip(b[done].tolist(), o.tolist(), h.tolist(),
+                                                                   lo.tolist(), c.tolist(), v.tolist()))
+        self.bucket = int(b[last])
+        self.partial = {int(t[i]): (int(t[i]), float(cols["open"][i]), float(cols["high"][i]),
+                                    float(cols["low"][i]), float(cols["close"][i]), float(cols["volume"][i]))
+                        for i in range(last, len(t))}
+
+    def feed(self, rows: Sequence[Sequence]):
+        for r in rows:
+            t = int(r[0])
+            b = t - t % self.step
+            if b < self.bucket:
+                continue
+            if b > self.bucket:
+                self._close_bucket()
+                self.bucket = b
+            self.partial[t] = r
+
+    def rows(self) -> List[Bar]:
+        out = list(self.bars)
+        if self.partial:
+            out.append(_aggregate(self.bucket, self.partial))
+        return out
+
+class TimeframeBook:
+    """
+    Nến khung lớn theo (symbol, interval cơ sở, khung), cập nhật tăng dần: mỗi lần chỉ
+    nạp các nến cơ sở từ nến đã nạp cuối (kể cả nến đang chạy) trở đi.
+    """
+    def __init__(self, maxlen: int = TF_BARS):
+        self.maxlen = maxlen
+        self._series: Dict[Tuple[str, str, str], _TfSeries] = {}
+        self._fed: Dict[Tuple[str, str], int] = {}      # open time nến cơ sở nạp gần nhất
+
+    def _get(self, symbol: str, base: str, tf: str) -> _TfSeries:
+        key = (symbol, base, tf)
+        s = self._series.get(key)
+        if s is None:
+            step = INTERVAL_MS[tf]
+            if step % INTERVAL_MS[base]:
+                raise ValueError(f"{tf} is not a multiple of {base}")
+            s = self._series[key] = _TfSeries(step, self.maxlen)
+        return s
+
+    def seeded(self, symbol: str, base: str, timeframes: Sequence[str]) -> bool:
+        return all(self._get(symbol, base, tf).seeded for tf in timeframes)
+
+    def seed(self, symbol: str, base: str, timeframes: Sequence[str], cols: Mapping[str, np.ndarray]):
+        """Nạp lịch sử cho các khung chưa có (cột từ HistoryStore hoặc rows_to_columns)."""
+        t = cols["open_time"]
+        for tf in timeframes:
+            s = self._get(symbol, base, tf)
+            if not s.seeded:
+                s.seed(cols)
+        if len(t):
+            # khung mới thêm sau: lùi mốc để lần feed() sau nạp lại phần sau lịch sử
+            # (khung đã có bỏ qua nến cũ hơn nến đang chạy → nạp lại không đổi kết quả)
+            key = (symbol, base)
+            self._fed[key] = min(self._fed.get(key, int(t[-1])), int(t[-1]))
+
+    def feed(self, symbol: str, base: str, timeframes: Sequence[str], rows: Sequence[Sequence]):
+        """Nến cơ sở tăng dần (vd. KlineCache.peek); chỉ phần từ nến đã nạp cuối được xử lý."""
+        if not rows:
+            return
+        last = self._fed.get((symbol, base), 0)
+        i = len(rows)
+        while i > 0 and int(rows[i - 1][0]) >= last:
+            i -= 1
+        new = rows[i:]
+        if not new:
+            return
+        for tf in timeframes:
+            self._get(symbol, base, tf).feed(new)
+        self._fed[(symbol, base)] = int(new[-1][0])
+
+    def bars(self, symbol: str, base: str, tf: str) -> List[Bar]:
+        s = self._series.get((symbol, base, tf))
+        return s.rows() if s else []
+
+    def drop(self, symbol: str):
+        for key in [k for k in self._series if k[0] == symbol]:
+            self._series.pop(key, None)
+        for key in [k for k in self._fed if k[0] == symbol]:
+            self._fed.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._series)
+
+def _trend(row: Dict[str, float], n: int) -> int:
+    if n < TF_MIN_BARS:
+        return 0
+    fast, slow = (row["ema21"], row["ema50"]) if n >= TF_SLOW_MIN else (row["ema9"], row["ema21"])
+    if fast > slow and row["rsi"] >= 50:
+        return 1
+    if fast < slow and row["rsi"] <= 50:
+        return -1
+    return 0
+
+def timeframe_rows(book: TimeframeBook, symbols: Sequence[str], base: str,
+                   timeframes: Sequence[str]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    EMA/RSI trên từng khung cho nhiều symbol (mỗi khung tính vector hoá 1 lượt).
+    Kết quả {symbol: {khung: {"trend": 1/-1/0, "rsi", "ema21", "ema50", "last", "bars"}}}.
+    """
+    out: Dict[str, Dict[str, Dict[str, float]]] = {s: {} for s in symbols}
+    for tf in timeframes:
+        series = {s: book.bars(s, base, tf) for s in symbols}
+        frame = build_frame({s: b for s, b in series.items() if len(b) >= TF_MIN_BARS})
+        for s in symbols:
+            n = len(series[s])
+            row: Optional[Dict[str, float]] = frame.row(s)
+            if row is None:
+                out[s][tf] = {"trend": 0, "bars": n}
+                continue
+            out[s][tf] = {"trend": _trend(row, n), "rsi": row["rsi"], "ema21": row["ema21"],
+                          "ema50": row["ema50"], "last": row["last"], "bars": n}
+    return out
@@ -0,0 +1,169 @@
+# cofure_bot/data/snapshot.py
+import time
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from .binance_client import (
+    BinanceClient, fetch_24h_tickers, funding_table, book_signal_metrics, symbols_from_tickers,
+)
+from .funding import FundingTable
+from .market_stream import track_symbols
+from cofure_bot.utils.metrics import CACHE_LOOKUPS, SCAN_SECONDS, SCAN_SYMBOLS, SCAN_UNIVERSE
+
+SNAPSHOT_TTL_SEC = 60
+# Luôn có trong snapshot (snapshot vĩ mô, fallback)
+CORE_SYMBOLS = ("BTCUSDT", "ETHUSDT")
+SNAPSHOT_CONCURRENCY = 16
+
+class TickerRow:
+    """1 dòng ticker 24h, chỉ giữ các cột bot dùng."""
+    __slots__ = ("symbol", "last_price", "change_pct", "quote_volume")
+
+    def __init__(self, symbol: str, last_price: float, change_pct: float, quote_volume: float):
+        self.symbol = symbol
+        self.last_price = last_price
+        self.change_pct = change_pct
+        self.quote_volume = quote_volume
+
+    @classmethod
+    def from_raw(cls, d: Dict[str, Any]) -> "TickerRow":
+        def f(k):
+            try:
+                return float(d.get(k) or 0.0)
+            except (TypeError, ValueError):
+                return 0.0
+        return cls(d["symbol"], f("lastPrice"), f("priceChangePercent"), f("quoteVolume"))
+
+class MetricRecord:
+    """Chỉ số nhanh của 1 symbol; đọc như dict (m["rsi"], m.get("funding")) để code cũ dùng nguyên."""
+    __slots__ = ("last", "rsi", "ema9", "ema21", "ema50", "ema200", "trend", "vol_ratio",
+                 "ret1", "ret3", "funding", "funding_next", "mark_price", "next_funding_time")
+
+    def __init__(self, m: Mapping[str, Any]):
+        for k in self.__slots__:
+            object.__setattr__(self, k, m.get(k))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("MetricRecord is immutable")
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__
+
+    def get(self, key: str, default=None):
+        v = getattr(self, key, None)
+        return default if v is None else v
+
+    def keys(self) -> Tuple[str, ...]:
+        return self.__slots__
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+class MarketSnapshot:
+    """
+    Ảnh chụp thị trường bất biến cho 1 tick: bảng ticker 24h, bảng funding và
+    chỉ số của các symbol ứng viên. Mọi job/lệnh trong cùng tick đọc chung.
+    """
+    __slots__ = ("created_at", "_tickers", "_funding", "_metrics", "_universe", "_candidates")
+
+    def __init__(self, tickers: Dict[str, TickerRow], funding: FundingTable,
+                 metrics: Dict[str, MetricRecord], universe: List[str], candidates: List[str]):
+        self.created_at = time.monotonic()
+        self._tickers = MappingProxyType(tickers)
+        self._funding = funding
+        self._metrics = MappingProxyType(metrics)
+        self._universe = tuple(universe)
+        self._candidates = tuple(candidates)
+
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    @property
+    def tickers(self) -> Mapping[str, TickerRow]:
+        return self._tickers
+
+    @property
+    def funding(self) -> FundingTable:
+        return self._funding
+
+    @property
+    def metrics(self) -> Mapping[str, MetricRecord]:
+        return self._metrics
+
+    @property
+    def universe(self) -> Tuple[str, ...]:
+        """Symbol đạt ngưỡng volume, sắp xếp như active_symbols()."""
+        return self._universe
+
+    @property
+    def candidates(self) -> Tuple[str, ...]:
+        """Symbol đã tính chỉ số, theo thứ tự xếp hạng tầng 1 (điểm cao trước)."""
+        return self._candidates
+
+    def metric(self, symbol: str) -> Optional[MetricRecord]:
+        return self._metrics.get(symbol)
+
+    def covers(self, symbols: Iterable[str]) -> bool:
+        return all(s in self._metrics for s in symbols)
+
+    def top_gainers(self, n: int = 5) -> List[TickerRow]:
+        return sorted(self._tickers.values(), key=lambda t: t.change_pct, reverse=True)[:n]
+
+async def build_snapshot(client: BinanceClient, min_quote_volume: float, size: int,
+                         extra: Iterable[str] = CORE_SYMBOLS,
+                         fallback: Iterable[str] = ("BTCUSDT", "ETHUSDT", "BNBUSDT", "SOLUSDT", "XRPUSDT")) -> MarketSnapshot:
+    raw = await fetch_24h_tickers(client)
+    tickers = {}
+    for d in raw:
+        try:
+            tickers[d["symbol"]] = TickerRow.from_raw(d)
+        except (KeyError, TypeError):
+            continue
+    universe = symbols_from_tickers(raw, min_quote_volume) or list(fallback)
+    # chép bảng funding: MarketStream cập nhật bảng gốc tại chỗ
+    live = await funding_table(client)
+    funding = FundingTable(list(live), fetched_at=live.fetched_at)
+    # tầng 1: chấm cả universe từ ticker + funding; chỉ `size` symbol tốt nhất sang tầng 2 (nến)
+    scan = client.ranker.select(universe, tickers, funding, size)
+    candidates = list(dict.fromkeys(scan + list(extra)))
+    for sym in client.ranker.evicted(keep=candidates):
+        client.kline_cache.drop(sym)
+        client.timeframes.drop(sym)
+        client.indicator_book.drop(sym)
+    await track_symbols(client, candidates)
+    metrics = await book_signal_metrics(client, candidates, interval="5m", funding=funding,
+                                         concurrency=SNAPSHOT_CONCURRENCY)
+    return MarketSnapshot(
+        tickers=tickers,
+        funding=funding,
+        metrics={s: MetricRecord(m) for s, m in metrics.items()},
+        universe=universe,
+        candidates=[s for s in scan if s in metrics],
+    )
+
+async def market_snapshot(client: BinanceClient, min_quote_volume: float, size: int,
+                          ttl: float = SNAPSHOT_TTL_SEC, **kwargs) -> MarketSnapshot:
+    """
+    Snapshot dùng chung (cache trên client theo TTL). Các job chạy chồng nhau trong
+    cùng tick chờ chung 1 lần dựng thay vì mỗi job tự tải và tính lại.
+    """
+    async with client._snapshot_lock:
+        snap: Optional[MarketSnapshot] = client._snapshot
+        if snap is None or snap.age() > ttl:
+            CACHE_LOOKUPS.inc(cache="snapshot", result="miss")
+            t0 = time.perf_counter()
+            snap = await build_snapshot(client, min_quote_volume, size, **kwargs)
+            SCAN_SECONDS.observe(time.perf_counter() - t0)
+            SCAN_SYMBOLS.observe(len(snap.metrics))
+            SCAN_UNIVERSE.set(len(snap.universe), set="universe")
+            SCAN_UNIVERSE.set(len(snap.candidates), set="candidates")
+            client._snapshot = snap
+        else:
+            CACHE_LOOKUPS.inc(cache="snapshot", result="hit")
+        return snap
@@ -0,0 +1,360 @@
+# cofure_bot/data/streaming.py
+import json
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from cofure_bot.utils.files import write_snapshot
+
+from .indicators import EMA_PERIODS, RSI_PERIOD, SIGNAL_WINDOW, VOL_MA
+from .kline_cache import INTERVAL_MS
+
+# Cộng dồn lại tổng cửa sổ sau mỗi N lần cập nhật để tránh trôi số thực
+_RESUM_EVERY = 256
+
+# === Chỉ báo O(1): update() khi nến đóng, peek() cho nến đang chạy ===
+class StreamingEMA:
+    """
+    EMA trên `window` giá cuối (kể cả giá đang chạy), seed = SMA `period` giá đầu cửa sổ:
+    trùng ema() chạy trên đúng cửa sổ nến REST mà build_frame() dùng.
+    EMA trên cửa sổ cố định là tổng có trọng số → trượt cửa sổ O(1):
+    value = (1-k)^(W-p)·head/p + tail + k·x, head = tổng p giá đầu, tail = phần EMA còn lại.
+    k mặc định 2/(p+1); RSI Wilder dùng k = 1/p.
+    """
+    __slots__ = ("period", "window", "k", "buf", "head", "tail", "_w_seed", "_w_out", "_since_resum")
+
+    def __init__(self, period: int, window: int = SIGNAL_WINDOW, k: Optional[float] = None):
+        if period > window:
+            raise ValueError(f"period {period} > window {window}")
+        self.period = period
+        self.window = window
+        self.k = (2.0 / (period + 1)) if k is None else k
+        self.buf: deque = deque(maxlen=window - 1)     # giá đã đóng trong cửa sổ
+        self.head = 0.0
+        self.tail = 0.0
+        self._w_seed = (1 - self.k) ** (window - period)
+        # trọng số của buf[period] trong tail (phần rời tail khi trượt)
+        self._w_out = self.k * (1 - self.k) ** (window - 1 - period)
+        self._since_resum = 0
+
+    @property
+    def full(self) -> bool:
+        return len(self.buf) == self.buf.maxlen
+
+    def _resum(self):
+        p, k = self.period, self.k
+        vals = list(self.buf)
+        self.head = sum(vals[:p])
+        t = 0.0
+        for x in vals[p:]:
+            t = t * (1 - k) + k * x
+        self.tail = t * (1 - k)
+        self._since_resum = 0
+
+    def update(self, x: float):
+        if not self.full:
+            self.buf.append(x)
+            if self.full:
+                self._resum()
+            return
+        p, k, buf = self.period, self.k, self.buf
+        self.head += (buf[p] if p < len(buf) else x) - buf[0]
+        if p < len(buf):
+            self.tail = (1 - k) * (self.tail - self._w_out * buf[p] + k * x)
+        buf.append(x)
+        self._since_resum += 1
+        if self._since_resum >= _RESUM_EVERY:
+            self._resum()
+
+    def peek(self, x: float) -> Optional[float]:
+        """Giá trị nếu x là giá cuối cửa sổ; None khi chưa đủ `period` giá."""
+        p = self.period
+        if not self.full:
+            vals = list(self.buf) + [x]
+            if len(vals) < p:
+                return None
+            e = sum(vals[:p]) / p
+            for v in vals[p:]:
+                e = v * self.k + e * (1 - self.k)
+            return e
+        if p == self.window:
+            return (self.head + x) / p
+        return self._w_seed * self.head / p + self.tail + self.k * x
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"period": self.period, "window": self.window, "k": self.k, "buf": list(self.buf),
+                "head": self.head, "tail": self.tail, "since_resum": self._since_resum}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "StreamingEMA":
+        o = cls(int(d["period"]), int(d["window"]), float(d["k"]))
+        o.buf.extend(float(x) for x in d["buf"])
+        o.head, o.tail = float(d["head"]), float(d["tail"])
+        o._since_resum = int(d["since_resum"])
+        return o
+
+class StreamingRSI:
+    """RSI Wilder trên cửa sổ `window` giá (trùng rsi() trên cùng cửa sổ): 2 EMA k=1/p trên lãi/lỗ."""
+    __slots__ = ("period", "prev", "gain", "loss")
+
+    def __init__(self, period: int = RSI_PERIOD, window: int = SIGNAL_WINDOW):
+        self.period = period
+        self.prev: Optional[float] = None
+        # window giá → window-1 biến động
+        self.gain = StreamingEMA(period, window - 1, 1.0 / period)
+        self.loss = StreamingEMA(period, window - 1, 1.0 / period)
+
+    def update(self, x: float):
+        if self.prev is not None:
+            d = x - self.prev
+            self.gain.update(max(d, 0.0))
+            self.loss.update(max(-d, 0.0))
+        self.prev = x
+
+    def peek(self, x: float) -> float:
+        if self.prev is None:
+            return 50.0
+        d = x - self.prev
+        ag, al = self.gain.peek(max(d, 0.0)), self.loss.peek(max(-d, 0.0))
+        if ag is None:
+            return 50.0
+        if al <= 0:
+            return 100.0 if ag > 0 else 50.0
+        return 100 - (100 / (1 + ag / al))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"period": self.period, "prev": self.prev,
+                "gain": self.gain.to_dict(), "loss": self.loss.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "StreamingRSI":
+        o = cls(int(d["period"]))
+        o.prev = d["prev"]
+        o.gain = StreamingEMA.from_dict(d["gain"])
+        o.loss = StreamingEMA.from_dict(d["loss"])
+        return o
+
+class RollingMean:
+    """Trung bình trượt `window` giá trị (MA volume)."""
+    __slots__ = ("window", "buf", "total", "_since_resum")
+
+    def __init__(self, window: int = VOL_MA):
+        self.window = window
+        self.buf: deque = deque(maxlen=window)
+        self.total = 0.0
+        self._since_resum = 0
+
+    def update(self, x: float):
+        if len(self.buf) == self.window:
+            self.total -= self.buf[0]
+        self.buf.append(x)
+        self.total += x
+        self._since_resum += 1
+        if self._since_resum >= _RESUM_EVERY:
+            self.total = sum(self.buf)
+            self._since_resum = 0
+
+    def peek(self, x: float) -> Optional[float]:
+        """MA nếu nạp thêm x; None khi chưa đủ cửa sổ."""
+        n = len(self.buf)
+        if n + 1 < self.window:
+            return None
+        drop = self.buf[0] if n == self.window else 0.0
+        return (self.total - drop + x) / self.window
+
+    def peek_ratio(self, x: float) -> float:
+        """x / MA (giống vol_ratio: thiếu nến → 1.0, MA≈0 → 0.0)."""
+        ma = self.peek(x)
+        if ma is None:
+            return 1.0
+        return (x / ma) if ma > 1e-12 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"window": self.window, "buf": list(self.buf), "total": self.total,
+                "since_resum": self._since_resum}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "RollingMean":
+        o = cls(int(d["window"]))
+        o.buf.extend(float(x) for x in d["buf"])
+        o.total, o._since_resum = float(d["total"]), int(d["since_resum"])
+        return o
+
+class RollingReturn:
+    """Tỷ suất sinh lời n nến: x / close[-n] - 1."""
+    __slots__ = ("n", "buf")
+
+    def __init__(self, n: int):
+        self.n = n
+        self.buf: deque = deque(maxlen=n)
+
+    def update(self, x: float):
+        self.buf.append(x)
+
+    def peek(self, x: float) -> float:
+        if len(self.buf) < self.n:
+            return 0.0
+        base = self.buf[0]
+        return (x / base - 1.0) if base != 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"n": self.n, "buf": list(self.buf)}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "RollingReturn":
+        o = cls(int(d["n"]))
+        o.buf.extend(float(x) for x in d["buf"])
+        return o
+
+# === Trạng thái chỉ báo của 1 (symbol, interval) ===
+class SymbolState:
+    """Nạp nến ĐÃ ĐÓNG bằng update(); metrics(nến đang chạy) trả về như IndicatorFrame.row()."""
+    __slots__ = ("emas", "rsi", "vol_ma", "ret1", "ret3", "last_open_time", "count")
+
+    def __init__(self):
+        self.emas = {p: StreamingEMA(p) for p in EMA_PERIODS}
+        self.rsi = StreamingRSI(RSI_PERIOD)
+        self.vol_ma = RollingMean(VOL_MA)
+        self.ret1 = RollingReturn(1)
+        self.ret3 = RollingReturn(3)
+        self.last_open_time: Optional[int] = None
+        self.count = 0
+
+    @property
+    def ready(self) -> bool:
+        # đủ nến để EMA200 có seed khi cộng nến đang chạy
+        return self.count + 1 >= max(EMA_PERIODS)
+
+    def update(self, row: List[Any]):
+        c, v = float(row[4]), float(row[5])
+        for e in self.emas.values():
+            e.update(c)
+        self.rsi.update(c)
+        self.vol_ma.update(v)
+        self.ret1.update(c)
+        self.ret3.update(c)
+        self.last_open_time = int(row[0])
+        self.count += 1
+
+    def metrics(self, open_row: List[Any]) -> Dict[str, float]:
+        c, v = float(open_row[4]), float(open_row[5])
+        out = {"last": c}
+        for p, e in self.emas.items():
+            out[f"ema{p}"] = e.peek(c)
+        out["rsi"] = self.rsi.peek(c)
+        out["vol_ratio"] = self.vol_ma.peek_ratio(v)
+        out["ret1"] = self.ret1.peek(c)
+        out["ret3"] = self.ret3.peek(c)
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "emas": [e.to_dict() for e in self.emas.values()],
+            "rsi": self.rsi.to_dict(),
+            "vol_ma": self.vol_ma.to_dict(),
+            "ret1": self.ret1.to_dict(),
+            "ret3": self.ret3.to_dict(),
+            "last_open_time": self.last_open_time,
+            "count": self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "SymbolState":
+        o = cls()
+        for e in d["emas"]:
+            se = StreamingEMA.from_dict(e)
+            o.emas[se.period] = se
+        o.rsi = StreamingRSI.from_dict(d["rsi"])
+        o.vol_ma = RollingMean.from_dict(d["vol_ma"])
+        o.ret1 = RollingReturn.from_dict(d["ret1"])
+        o.ret3 = RollingReturn.from_dict(d["ret3"])
+        o.last_open_time = d["last_open_time"]
+        o.count = int(d["count"])
+        return o
+
+class IndicatorBook:
+    """Trạng thái chỉ báo cho mọi (symbol, interval); lưu/khôi phục được qua JSON."""
+    def __init__(self):
+        self._states: Dict[Tuple[str, str], SymbolState] = {}
+
+    def get(self, symbol: str, interval: str) -> Optional[SymbolState]:
+        return self._states.get((symbol, interval))
+
+    def close_candle(self, symbol: str, interval: str, row: List[Any]) -> bool:
+        """
+        Nạp 1 nến vừa đóng (tin kline x=true của WebSocket) — O(1). Chỉ nhận nến nối liền
+        nến cuối trong state; hở/trùng → bỏ qua (lần advance() sau tự nạp bù từ KlineCache).
+        """
+        st = self._states.get((symbol, interval))
+        if st is None or st.last_open_time is None:
+            return False
+        step = INTERVAL_MS.get(interval)
+        if int(row[0]) <= st.last_open_time or (step and int(row[0]) != st.last_open_time + step):
+            return False
+        st.update(row)
+        return True
+
+    def advance(self, symbol: str, interval: str, rows: List[list]) -> Optional[Dict[str, float]]:
+        """
+        rows: nến từ last_open_time trở đi, nến cuối là nến đang chạy.
+        Nạp các nến đã đóng mới rồi trả về metrics; None nếu có khoảng hở (cần warm-up lại).
+        """
+        st = self._states.get((symbol, interval))
+        if st is None or not rows or st.last_open_time is None:
+            return None
+        start = None
+        for i, r in enumerate(rows):
+            if int(r[0]) == st.last_open_time:
+                start = i + 1
+                break
+            if int(r[0]) > st.last_open_time:
+                break
+        if start is None or start > len(rows) - 1:
+            # nến cuối trong state chưa đóng / mất dữ liệu → không nối được
+            return None
+        for r in rows[start:-1]:
+            st.update(r)
+        return st.metrics(rows[-1]) if st.ready else None
+
+    def warm(self, symbol: str, interval: str, rows: List[list]) -> Optional[Dict[str, float]]:
+        """Dựng lại state từ toàn bộ cửa sổ nến (nến cuối đang chạy)."""
+        if not rows:
+            return None
+        st = SymbolState()
+        for r in rows[:-1]:
+            st.update(r)
+        self._states[(symbol, interval)] = st
+        return st.metrics(rows[-1]) if st.ready else None
+
+    def drop(self, symbol: str):
+        """Bỏ state của symbol (mọi interval), vd. khi rời danh sách quét."""
+        for key in [k for k in self._states if k[0] == symbol]:
+            self._states.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    # --- Lưu / khôi phục ---
+    def to_dict(self) -> Dict[str, Any]:
+        return {f"{s}|{i}": st.to_dict() for (s, i), st in self._states.items()}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "IndicatorBook":
+        o = cls()
+        for key, v in (d or {}).items():
+            try:
+                s, i = key.split("|", 1)
+                o._states[(s, i)] = SymbolState.from_dict(v)
+            except Exception:
+                continue
+        return o
+
+    def save(self, path: str):
+        write_snapshot(path, self.to_dict())
+
+    @classmethod
+    def load(cls, path: str) -> "IndicatorBook":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError):
+            return cls()
@@ -0,0 +1,289 @@
+# cofure_bot/debug.py
+import asyncio
+import cProfile
+import hmac
+import io
+import linecache
+import logging
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter
+from typing import List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Endpoint chẩn đoán khi bot đang chạy (chỉ bật khi có DEBUG_TOKEN):
+#   GET /debug/profile?seconds=10&mode=cprofile|sample&sort=cumulative&limit=60
+#   GET /debug/tracemalloc?action=start|snapshot|diff|stop&limit=30&group=lineno|filename|traceback
+#   GET /debug/tasks
+#   GET /debug/slow                     (các lần loop bị chặn gần nhất kèm stack, từ LoopWatchdog)
+TOKEN_HEADER        = "X-Debug-Token"
+PROFILE_MAX_SEC     = 120.0
+SAMPLE_INTERVAL_SEC = 0.005
+TRACEMALLOC_FRAMES  = 10
+DEFAULT_LIMIT       = 60
+
+def _frame_label(f) -> str:
+    code = f.f_code
+    return f"{code.co_name} ({code.co_filename}:{f.f_lineno})"
+
+def await_chain(coro) -> List[str]:
+    """Chuỗi await của 1 coroutine (coroutine → coroutine → ... → Future): stack 'thật' của task."""
+    out, seen = [], set()
+    obj = coro
+    while obj is not None and id(obj) not in seen:
+        seen.add(id(obj))
+        frame = getattr(obj, "cr_frame", None) or getattr(obj, "gi_frame", None) or getattr(obj, "ag_frame", None)
+        if frame is not None:
+            out.append(_frame_label(frame))
+            obj = getattr(obj, "cr_await", None) or getattr(obj, "gi_yieldfrom", None) or getattr(obj, "ag_await", None)
+        elif isinstance(obj, asyncio.Future):
+            out.append(f"<{type(obj).__name__} {'done' if obj.done() else 'pending'}>")
+            break
+        else:
+            out.append(repr(obj)[:120])
+            break
+    return out
+
+def dump_tasks() -> str:
+    """Mọi asyncio task (tên, coroutine, chuỗi await) + stack của các thread khác."""
+    tasks = sorted(asyncio.all_tasks(), key=lambda t: t.get_name())
+    current = asyncio.current_task()
+    lines = [f"{len(tasks)} tasks"]
+    for t in tasks:
+        coro = t.get_coro()
+        state = "cancelling" if t.cancelling() else ("done" if t.done() else "pending")
+        mark = " (this request)" if t is current else ""
+        lines.append("")
+        lines.append(f"Task {t.get_name()} [{state}] {getattr(coro, '__qualname__', coro)!s}{mark}")
+        for fr in await_chain(coro):
+            lines.append(f"    {fr}")
+    main_id = threading.main_thread().ident
+    names = {th.ident: th.name for th in threading.enumerate()}
+    for ident, frame in sys._current_frames().items():
+        if ident == main_id:
+            continue
+        lines.append("")
+        lines.append(f"Thread {names.get(ident, ident)}")
+        for fs in traceback.extract_stack(frame):
+            lines.append(f"    {fs.name} ({fs.filename}:{fs.lineno})")
+    return "\n".join(lines) + "\n"
+
+class _Sampler:
+    """
+    Lấy mẫu stack của event loop (thread chính) từ 1 thread phụ: bắt được cả đoạn code
+    chạy đồng bộ chặn loop. Mỗi mẫu gắn tên task đang chạy → output dạng collapsed
+    stack (dùng thẳng cho flamegraph.pl / speedscope).
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = SAMPLE_INTERVAL_SEC):
+        self.loop = loop
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="debug_sampler", daemon=True)
+        self._target = threading.main_thread().ident
+
+    def _current_task_name(self) -> str:
+        # đọc không khoá từ thread khác: chỉ để gắn nhãn mẫu
+        task = asyncio.tasks._current_tasks.get(self.loop)
+        return task.get_name() if task is not None else "<loop>"
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(self._current_task_name())
+            self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self, limit: Optional[int] = None) -> str:
+        rows = self.counts.most_common(limit)
+        return "".join(f"{stack} {n}\n" for stack, n in rows)
+
+class DebugEndpoints:
+    """Profile CPU, tracemalloc, dump task — bảo vệ bằng token (so sánh hằng thời gian)."""
+    def __init__(self, token: str, watchdog=None):
+        self._token = token.encode()
+        self._watchdog = watchdog
+        self._profile_lock = asyncio.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    def register(self, app: web.Application):
+        app.router.add_get("/debug/profile", self.profile)
+        app.router.add_get("/debug/tracemalloc", self.memory)
+        app.router.add_get("/debug/tasks", self.tasks)
+        if self._watchdog is not None:
+            app.router.add_get("/debug/slow", self.slow)
+
+    def _authorized(self, request: web.Request) -> bool:
+        token = request.headers.get(TOKEN_HEADER, "")
+        auth = request.headers.get("Authorization", "")
+        if not token and auth.startswith("Bearer "):
+            token = auth[7:]
+        return bool(token) and hmac.compare_digest(token.encode(), self._token)
+
+    def _deny(self, request: web.Request) -> Optional[web.Response]:
+        if not self._authorized(request):
+            logger.warning("Rejected debug request from %s", request.remote)
+            return web.Response(status=401)
+        return None
+
+    # --- CPU ---
+    async def profile(self, request: web.Request) -> web.Response:
+        denied = self._deny(request)
+        if denied is not None:
+            return denied
+        q = request.query
+        try:
+            seconds = min(PROFILE_MAX_SEC, max(0.1, float(q.get("seconds", 10))))
+            limit = int(q.get("limit", DEFAULT_LIMIT))
+        except ValueError:
+            return web.Response(status=400, text="bad seconds/limit\n")
+        mode = q.get("mode", "cprofile")
+        if mode not in ("cprofile", "sample"):
+            return web.Response(status=400, text="mode must be cprofile or sample\n")
+        if self._profile_lock.locked():
+            return web.Response(status=409, text="a profile is already running\n")
+        async with self._profile_lock:
+            if mode == "sample":
+                text = await self._sample(seconds, limit)
+            else:
+                text = await self._cprofile(seconds, q.get("sort", "cumulative"), limit)
+        return web.Response(text=text)
+
+    async def _cprofile(self, seconds: float, sort: str, limit: int) -> str:
+        # chạy trên thread của event loop: mọi callback/coroutine được resume trong N giây đều được đo
+        prof = cProfile.Profile()
+        t0 = time.perf_counter()
+        prof.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            prof.disable()
+        out = io.StringIO()
+        out.write(f"cProfile of the event loop thread for {time.perf_counter() - t0:.1f}s\n")
+        try:
+            pstats.Stats(prof, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+        except KeyError:
+            return f"unknown sort key: {sort}\n"
+        return out.getvalue()
+
+    async def _sample(self, seconds: float, limit: int) -> str:
+        sampler = _Sampler(asyncio.get_running_loop())
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(sampler.stop)
+        header = (f"# {sampler.samples} samples every {sampler.interval * 1000:.0f}ms over {seconds:.1f}s "
+                  f"(collapsed stacks: task;outer;...;inner count)\n")
+        return header + sampler.collapsed(limit)
+
+    # --- Bộ nhớ ---
+    async def memory(self, request: web.Request) -> web.Response:
+        denied = self._deny(request)
+        if denied is not None:
+            return denied
+        q = request.query
+        action = q.get("action", "snapshot")
+        group = q.get("group", "lineno")
+        if group not in ("lineno", "filename", "traceback"):
+            return web.Response(status=400, text="group must be lineno, filename or traceback\n")
+        try:
+            limit = int(q.get("limit", 30))
+            frames = int(q.get("frames", TRACEMALLOC_FRAMES))
+        except ValueError:
+            return web.Response(status=400, text="bad limit/frames\n")
+
+        if action == "start":
+            if tracemalloc.is_tracing():
+                return web.Response(text=f"already tracing ({tracemalloc.get_traceback_limit()} frames)\n")
+            tracemalloc.start(frames)
+            self._baseline = None
+            return web.Response(text=f"tracemalloc started ({frames} frames)\n")
+        if action == "stop":
+            tracemalloc.stop()
+            self._baseline = None
+            return web.Response(text="tracemalloc stopped\n")
+        if not tracemalloc.is_tracing():
+            return web.Response(status=409, text="tracemalloc is not running (action=start first)\n")
+        if action == "snapshot":
+            text = await asyncio.to_thread(self._snapshot_report, group, limit)
+        elif action == "diff":
+            text = await asyncio.to_thread(self._diff_report, group, limit)
+        else:
+            return web.Response(status=400, text="action must be start, snapshot, diff or stop\n")
+        return web.Response(text=text)
+
+    @staticmethod
+    def _take() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def _snapshot_report(self, group: str, limit: int) -> str:
+        snap = self._take()
+        self._baseline = snap
+        stats = snap.statistics(group)
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced: {current / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB); baseline saved for diff",
+                 f"top {limit} by {group}:"]
+        for st in stats[:limit]:
+            lines.append(str(st))
+            if group == "traceback":
+                lines.extend("    " + l for l in st.traceback.format())
+        return "\n".join(lines) + "\n"
+
+    def _diff_report(self, group: str, limit: int) -> str:
+        if self._baseline is None:
+            return self._snapshot_report(group, limit)
+        snap = self._take()
+        diff = snap.compare_to(self._baseline, group)
+        self._baseline = snap
+        lines = [f"top {limit} changes since previous snapshot by {group}:"]
+        for st in diff[:limit]:
+            lines.append(str(st))
+            if group == "traceback":
+                lines.extend("    " + l for l in st.traceback.format())
+        return "\n".join(lines) + "\n"
+
+    # --- Task ---
+    async def tasks(self, request: web.Request) -> web.Response:
+        denied = self._deny(request)
+        if denied is not None:
+            return denied
+        return web.Response(text=dump_tasks())
+
+    async def slow(self, request: web.Request) -> web.Response:
+        denied = self._deny(request)
+        if denied is not None:
+            return denied
+        lines = []
+        for ev in reversed(self._watchdog.slow):
+            at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ev["at"]))
+            lines.append(f"{at} blocked {ev['lag_ms']:.0f}ms entry={ev['entry']} task={ev['task']}")
+            lines.extend(f"    {fr}" for fr in ev["stack"])
+            lines.append("")
+        return web.Response(text="\n".join(lines) or "no slow callbacks recorded\n")
@@ -1,6 +1,8 @@
 from telegram import Update
 from telegram.ext import ContextTypes
-from ..config import TELEGRAM_ALLOWED_USER_ID
+from ..config import TELEGRAM_ALLOWED_USER_ID, TELEGRAM_SUBSCRIBER_IDS
+from ..storage.subscriptions import KINDS, SUBSCRIPTIONS, Subscription
+from ..utils.outbox import get_outbox, PRIORITY_HIGH
 
 def _authorized(update: Update) -> bool:
     user = update.effective_user
@@ -9,9 +11,11 @@ def _authorized(update: Update) -> bool:
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _authorized(update):
         return
-    await update.message.reply_text(
+    get_outbox(context).send(
+        update.effective_chat.id,
         "Xin chào! Cofure đã sẵn sàng.\n"
-        "Từ khóa nhanh: lịch hôm nay | lịch ngày mai | lịch cả tuần"
+        "Từ khóa nhanh: lịch hôm nay | lịch ngày mai | lịch cả tuần",
+        priority=PRIORITY_HIGH,
     )
 
 async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -19,6 +23,82 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     text = (update.message.text or "").strip().lower()
     if text in {"lịch hôm nay", "lịch ngày mai", "lịch cả tuần"}:
-        await update.message.reply_text("Tính năng lịch sẽ hoạt động ở các nhánh tiếp theo 👌")
+        get_outbox(context).send(update.effective_chat.id, "Tính năng lịch sẽ hoạt động ở các nhánh tiếp theo 👌",
+                                 priority=PRIORITY_HIGH)
         return
-    await update.message.reply_text("Đã nhận. Gõ: lịch hôm nay | lịch ngày mai | lịch cả tuần")
+    get_outbox(context).send(update.effective_chat.id, "Đã nhận. Gõ: lịch hôm nay | lịch ngày mai | lịch cả tuần",
+                             priority=PRIORITY_HIGH)
+
+# ===== Đăng ký nhận tin =====
+SUB_HELP = (
+    "Cách dùng /sub:\n"
+    "• /sub — xem / bật đăng ký\n"
+    "• /sub min 60 — chỉ nhận tín hiệu độ mạnh ≥ 60%\n"
+    "• /sub coins BTCUSDT,ETHUSDT | all\n"
+    f"• /sub types {','.join(KINDS)} | all\n"
+    "• /sub quiet 23-6 | off — giờ im lặng (giờ VN)\n"
+    "• /unsub — ngừng nhận"
+)
+
+def _can_subscribe(update: Update) -> bool:
+    user = update.effective_user
+    return bool(user and (user.id == TELEGRAM_ALLOWED_USER_ID or user.id in TELEGRAM_SUBSCRIBER_IDS))
+
+def _fmt_sub(sub: Subscription) -> str:
+    if not sub.types:
+        return "🔕 Chat này đang không nhận tin. Gõ /sub để bật lại."
+    return (
+        "🔔 Đăng ký nhận tin:\n"
+        f"• Loại tin: {', '.join(t for t in KINDS if t in sub.types)}\n"
+        f"• Độ mạnh tối thiểu: {sub.min_strength}%\n"
+        f"• Coin: {', '.join(sorted(sub.symbols)) if sub.symbols else 'tất cả'}\n"
+        f"• Giờ im lặng: {f'{sub.quiet[0]:02d}:00–{sub.quiet[1]:02d}:00' if sub.quiet else 'không'}"
+    )
+
+def _apply_sub_args(sub: Subscription, args) -> Subscription:
+    """Áp 1 lệnh con lên đăng ký hiện tại; sai cú pháp → ValueError."""
+    if not args:
+        # /sub trơn: đang tắt (sau /unsub) → bật lại mọi loại tin, giữ các bộ lọc khác
+        return sub if sub.types else Subscription.from_dict({**sub.to_dict(), "types": list(KINDS)})
+    cmd, rest = args[0].lower(), "".join(args[1:]).strip()
+    d = sub.to_dict()
+    if cmd == "min":
+        d["min_strength"] = max(0, min(100, int(rest)))
+    elif cmd in ("coins", "coin"):
+        d["symbols"] = None if rest.lower() in ("", "all") else [
+            c if c.endswith("USDT") else c + "USDT" for c in rest.upper().split(",") if c]
+    elif cmd == "types":
+        types = list(KINDS) if rest.lower() in ("", "all") else [t for t in rest.lower().split(",") if t]
+        if any(t not in KINDS for t in types):
+            raise ValueError(rest)
+        d["types"] = types
+    elif cmd == "quiet":
+        if rest.lower() in ("", "off"):
+            d["quiet"] = None
+        else:
+            start, end = rest.split("-")
+            d["quiet"] = [int(start), int(end)]
+    else:
+        raise ValueError(cmd)
+    return Subscription.from_dict(d)
+
+async def sub_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _can_subscribe(update):
+        return
+    chat_id = update.effective_chat.id
+    sub = SUBSCRIPTIONS.get(chat_id) or Subscription(chat_id)
+    try:
+        new = _apply_sub_args(sub, context.args or [])
+    except ValueError:
+        get_outbox(context).send(chat_id, SUB_HELP, priority=PRIORITY_HIGH)
+        return
+    SUBSCRIPTIONS.upsert(new)
+    get_outbox(context).send(chat_id, _fmt_sub(new), priority=PRIORITY_HIGH)
+
+async def unsub_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _can_subscribe(update):
+        return
+    chat_id = update.effective_chat.id
+    SUBSCRIPTIONS.remove(chat_id)
+    get_outbox(context).send(chat_id, "🔕 Đã ngừng gửi tin cho chat này. Gõ /sub để đăng ký lại.",
+                             priority=PRIORITY_HIGH)
@@ -1,6 +1,5 @@
 # cofure_bot/handlers/menu.py
 
-import aiohttp
 from telegram import Update
 from telegram.ext import ContextTypes
 import pytz
@@ -8,12 +7,13 @@ from datetime import datetime, timedelta
 
 from cofure_bot.config import TELEGRAM_ALLOWED_USER_ID, TZ_NAME
 from cofure_bot.data.macro_calendar import fetch_macro_for_date
-from cofure_bot.data.binance_client import active_symbols, quick_signal_metrics
-from cofure_bot.signals.engine import generate_batch
+from cofure_bot.data.binance_client import get_client
+from cofure_bot.signals.engine import signal_from_metrics
+from cofure_bot.utils.outbox import get_outbox, PRIORITY_HIGH, PRIORITY_NORMAL
 from cofure_bot.scheduler.jobs import (
-    _fmt_signal, MIN_QUOTE_VOL, MAX_CANDIDATES,
+    _fmt_signal, _market_snapshot,
     ALERT_FUNDING, ALERT_VOLRATIO,
-    job_morning, job_macro
+    morning_text, macro_today_text
 )
 
 VN_TZ = pytz.timezone(TZ_NAME)
@@ -22,6 +22,11 @@ def _authorized(update: Update) -> bool:
     u = update.effective_user
     return bool(u and u.id == TELEGRAM_ALLOWED_USER_ID)
 
+def _reply(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str,
+           priority: int = PRIORITY_HIGH, **kwargs):
+    """Trả lời qua outbox (không chờ gửi xong)."""
+    get_outbox(context).send(update.effective_chat.id, text, priority=priority, **kwargs)
+
 # ===== Helpers: tên thứ & format lịch =====
 def _day_name_vi(d: datetime) -> str:
     return {
@@ -63,24 +68,24 @@ def _fmt_events(day: datetime, events: list) -> str:
 async def lich_hom_nay_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _authorized(update): return
     day = datetime.now(VN_TZ)
-    events = await fetch_macro_for_date(day.date())  # đã lọc crypto + impact cao trong macro_calendar.py
-    await update.message.reply_text(_fmt_events(day, events))
+    events = await fetch_macro_for_date(day.date(), get_client(context).session)  # đã lọc crypto + impact cao trong macro_calendar.py
+    _reply(update, context, _fmt_events(day, events))
 
 async def lich_ngay_mai_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _authorized(update): return
     day = datetime.now(VN_TZ) + timedelta(days=1)
-    events = await fetch_macro_for_date(day.date())
-    await update.message.reply_text(_fmt_events(day, events))
+    events = await fetch_macro_for_date(day.date(), get_client(context).session)
+    _reply(update, context, _fmt_events(day, events))
 
 async def lich_ca_tuan_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Gửi 7 tin riêng: Thứ 2 → Chủ nhật (không bị cắt)."""
+    """Lịch Thứ 2 → Chủ nhật: mỗi ngày 1 khối, outbox gộp các ngày vào ít tin nhất (không bị cắt)."""
     if not _authorized(update): return
     today = datetime.now(VN_TZ)
     monday = today - timedelta(days=today.weekday())  # Thứ 2 tuần hiện tại
     for i in range(7):
         d = monday + timedelta(days=i)
-        ev = await fetch_macro_for_date(d.date())
-        await update.message.reply_text(_fmt_events(d, ev))
+        ev = await fetch_macro_for_date(d.date(), get_client(context).session)
+        _reply(update, context, _fmt_events(d, ev), coalesce="lich_ca_tuan")
 
 async def test_full_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -88,63 +93,60 @@ async def test_full_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Không phụ thuộc khung giờ.
     """
     if not _authorized(update): return
-    await update.message.reply_text("🚀 Bắt đầu test FULL: chào sáng → lịch vĩ mô → 5 tín hiệu → cảnh báo khẩn → tổng kết.")
+    _reply(update, context, "🚀 Bắt đầu test FULL: chào sáng → lịch vĩ mô → 5 tín hiệu → cảnh báo khẩn → tổng kết.", priority=PRIORITY_NORMAL)
 
-    # 1) Chào buổi sáng + top gainers
+    # 1) Chào buổi sáng + top gainers (chỉ gửi chat đang test, không phát cho người đăng ký)
     try:
-        await job_morning(context)
+        _reply(update, context, await morning_text(context), priority=PRIORITY_NORMAL,
+               parse_mode="HTML", disable_web_page_preview=True)
     except Exception as e:
-        await update.message.reply_text(f"⚠️ Lỗi phần chào sáng: {e}")
+        _reply(update, context, f"⚠️ Lỗi phần chào sáng: {e}", priority=PRIORITY_NORMAL)
 
     # 2) Lịch vĩ mô hôm nay (crypto + impact cao)
     try:
-        await job_macro(context)
+        _reply(update, context, await macro_today_text(context), priority=PRIORITY_NORMAL)
     except Exception as e:
-        await update.message.reply_text(f"⚠️ Lỗi phần lịch vĩ mô: {e}")
+        _reply(update, context, f"⚠️ Lỗi phần lịch vĩ mô: {e}", priority=PRIORITY_NORMAL)
 
     # 3) 5 tín hiệu RIÊNG LẺ — bỏ qua khung giờ
     try:
-        async with aiohttp.ClientSession() as session:
-            syms = await active_symbols(session, min_quote_volume=MIN_QUOTE_VOL)
-        if not syms:
-            syms = ["BTCUSDT","ETHUSDT","BNBUSDT","SOLUSDT","XRPUSDT"]
-        sigs = await generate_batch(syms[:MAX_CANDIDATES], count=5)
+        snap = await _market_snapshot(get_client(context))
+        sigs = [signal_from_metrics(sym, snap.metrics[sym]) for sym in snap.candidates[:5]]
         for i, s in enumerate(sigs):
             s["signal_type"] = "Scalping" if i < 3 else "Swing"
             s["order_type"] = "Market"
-            await update.message.reply_text(_fmt_signal(s))
+            _reply(update, context, _fmt_signal(s), priority=PRIORITY_NORMAL)
     except Exception as e:
-        await update.message.reply_text(f"⚠️ Lỗi phần tín hiệu: {e}")
+        _reply(update, context, f"⚠️ Lỗi phần tín hiệu: {e}", priority=PRIORITY_NORMAL)
 
     # 4) Cảnh báo khẩn — quét nhanh, tối đa 2 cảnh báo
     try:
         sent = 0
-        async with aiohttp.ClientSession() as session:
-            syms = await active_symbols(session, min_quote_volume=MIN_QUOTE_VOL)
-            for sym in syms[:MAX_CANDIDATES]:
-                m = await quick_signal_metrics(session, sym, interval="5m")
-                if abs(m["funding"]) >= ALERT_FUNDING or m["vol_ratio"] >= ALERT_VOLRATIO:
-                    arrow = "▲" if m["vol_ratio"] >= ALERT_VOLRATIO else ""
-                    side_hint = "Long nghiêng" if m["funding"] > 0 else ("Short nghiêng" if m["funding"] < 0 else "Trung tính")
-                    text = (f"⏰ Cảnh báo khẩn — {sym}\n"
-                            f"• Funding: {m['funding']:.4f} ({side_hint})\n"
-                            f"• Volume 5m: x{m['vol_ratio']:.2f} {arrow}\n"
-                            f"• Gợi ý: cân nhắc {'MUA' if m['funding']>0 else 'BÁN' if m['funding']<0 else 'quan sát'} nếu ổn định thêm.")
-                    await update.message.reply_text(text)
-                    sent += 1
-                    if sent >= 2:
-                        break
+        snap = await _market_snapshot(get_client(context))
+        for sym in snap.candidates:
+            m = snap.metrics[sym]
+            if abs(m["funding"]) >= ALERT_FUNDING or m["vol_ratio"] >= ALERT_VOLRATIO:
+                arrow = "▲" if m["vol_ratio"] >= ALERT_VOLRATIO else ""
+                side_hint = "Long nghiêng" if m["funding"] > 0 else ("Short nghiêng" if m["funding"] < 0 else "Trung tính")
+                text = (f"⏰ Cảnh báo khẩn — {sym}\n"
+                        f"• Funding: {m['funding']:.4f} ({side_hint})\n"
+                        f"• Volume 5m: x{m['vol_ratio']:.2f} {arrow}\n"
+                        f"• Gợi ý: cân nhắc {'MUA' if m['funding']>0 else 'BÁN' if m['funding']<0 else 'quan sát'} nếu ổn định thêm.")
+                _reply(update, context, text, priority=PRIORITY_NORMAL)
+                sent += 1
+                if sent >= 2:
+                    break
     except Exception as e:
-        await update.message.reply_text(f"⚠️ Lỗi phần cảnh báo khẩn: {e}")
+        _reply(update, context, f"⚠️ Lỗi phần cảnh báo khẩn: {e}", priority=PRIORITY_NORMAL)
 
     # 5) Mô phỏng tổng kết
     try:
-        await update.message.reply_text(
+        _reply(update, context,
             "🌒 Tổng kết phiên (mô phỏng)\n"
             "• Tín hiệu đã gửi: ~5 (trong test)\n"
             "• Cảnh báo khẩn: ~0–2 (trong test)\n"
             "• Dự báo tối: Giữ kỷ luật, giảm đòn bẩy khi biến động mạnh.\n\n"
-            "🌙 Cảm ơn bạn đã đồng hành cùng Cofure hôm nay. 😴 Ngủ ngon nha!"
-        )
+            "🌙 Cảm ơn bạn đã đồng hành cùng Cofure hôm nay. 😴 Ngủ ngon nha!",
+            priority=PRIORITY_NORMAL)
     except Exception as e:
-        await update.message.reply_text(f"⚠️ Lỗi phần tổng kết: {e}")
+        _reply(update, context, f"⚠️ Lỗi phần tổng kết: {e}", priority=PRIORITY_NORMAL)
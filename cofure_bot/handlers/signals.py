@@ -1,13 +1,14 @@
-import asyncio
 from telegram import Update
 from telegram.ext import ContextTypes
+from ..data.binance_client import get_client
 from ..signals.engine import generate_batch
+from ..utils.outbox import get_outbox
 
 # Danh sách coin cần quét
 COINS = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "SOLUSDT", "XRPUSDT"]
 
 async def send_signals(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    signals = await generate_batch(COINS, count=5)
+    signals = await generate_batch(get_client(context), COINS, count=5)
     for sig in signals:
         msg = (
             f"📈 {sig['token']} – {sig['side']}\n"
@@ -18,5 +19,5 @@ async def send_signals(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"📌 Lý do: {sig['reason']}\n"
             f"🕒 {sig['time']}"
         )
-        await update.message.reply_text(msg)
-        await asyncio.sleep(1)  # tránh spam nhanh quá
+        # outbox tự giãn nhịp gửi theo giới hạn của Telegram
+        get_outbox(context).send(update.effective_chat.id, msg)
@@ -0,0 +1,147 @@
+# cofure_bot/ingress.py
+import asyncio
+import hmac
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from cofure_bot.config import WEBHOOK_QUEUE_MAX
+
+try:
+    import orjson
+
+    def _loads(body: bytes) -> Any:
+        return orjson.loads(body)
+except ImportError:  # orjson là tuỳ chọn
+    import json
+
+    def _loads(body: bytes) -> Any:
+        return json.loads(body)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER      = "X-Telegram-Bot-Api-Secret-Token"
+DEDUP_WINDOW       = 4096     # số update_id gần nhất được nhớ để bỏ trùng
+RETRY_AFTER_SEC    = 1
+_EWMA_ALPHA        = 0.1
+
+class WebhookIngress:
+    """
+    Đường nhận webhook: kiểm tra secret token (so sánh hằng thời gian), parse JSON
+    nhanh, bỏ trùng theo update_id rồi đẩy vào hàng đợi có giới hạn và trả 200 ngay.
+    Worker riêng dựng Update và chuyển cho Application; hàng đầy → 429 để Telegram gửi lại.
+    """
+    def __init__(self, application: Application, secret: str, maxsize: int = WEBHOOK_QUEUE_MAX,
+                 dedup_window: int = DEDUP_WINDOW):
+        self.application = application
+        self._secret = secret.encode()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        self._dedup_window = dedup_window
+        self._task: Optional[asyncio.Task] = None
+        self.counters: Dict[str, int] = {
+            "received": 0, "accepted": 0, "duplicates": 0,
+            "unauthorized": 0, "bad_request": 0, "rejected_full": 0, "dispatch_errors": 0,
+        }
+        self.max_depth = 0
+        self.handle_ms_avg = 0.0      # thời gian xử lý request webhook (EWMA)
+        self.handle_ms_max = 0.0
+        self.dispatch_ms_avg = 0.0    # từ lúc nhận tới lúc giao cho Application (EWMA)
+
+    # --- Vòng đời ---
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="webhook_ingress")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    # --- HTTP ---
+    def _authorized(self, request: web.Request) -> bool:
+        token = request.headers.get(SECRET_HEADER, "")
+        return hmac.compare_digest(token.encode(), self._secret)
+
+    def _remember(self, update_id: int):
+        self._seen[update_id] = None
+        if len(self._seen) > self._dedup_window:
+            self._seen.popitem(last=False)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        t0 = time.perf_counter()
+        self.counters["received"] += 1
+        try:
+            status, headers = await self._accept(request)
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            self.handle_ms_avg += _EWMA_ALPHA * (ms - self.handle_ms_avg)
+            self.handle_ms_max = max(self.handle_ms_max, ms)
+        return web.Response(status=status, headers=headers)
+
+    async def _accept(self, request: web.Request) -> Tuple[int, Optional[Dict[str, str]]]:
+        if not self._authorized(request):
+            self.counters["unauthorized"] += 1
+            return 401, None
+        try:
+            data = _loads(await request.read())
+            update_id = int(data["update_id"])
+        except (ValueError, TypeError, KeyError):
+            self.counters["bad_request"] += 1
+            return 400, None
+        if update_id in self._seen:
+            self.counters["duplicates"] += 1
+            return 200, None
+        if not self.application.running:
+            return 503, {"Retry-After": str(RETRY_AFTER_SEC)}
+        try:
+            self._queue.put_nowait((data, time.perf_counter()))
+        except asyncio.QueueFull:
+            # không ghi nhận update_id → Telegram gửi lại sau
+            self.counters["rejected_full"] += 1
+            return 429, {"Retry-After": str(RETRY_AFTER_SEC)}
+        self._remember(update_id)
+        self.counters["accepted"] += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return 200, None
+
+    # --- Worker ---
+    async def _run(self):
+        bot = self.application.bot
+        while True:
+            data, received_at = await self._queue.get()
+            try:
+                update = Update.de_json(data, bot)
+                # update_queue của Application cũng có giới hạn → chờ ở đây, hàng của ta đầy dần
+                await self.application.update_queue.put(update)
+            except Exception as e:
+                self.counters["dispatch_errors"] += 1
+                logger.warning("Could not dispatch update: %s", e)
+            else:
+                ms = (time.perf_counter() - received_at) * 1000
+                self.dispatch_ms_avg += _EWMA_ALPHA * (ms - self.dispatch_ms_avg)
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "queue_depth": self.depth,
+            "queue_max_depth": self.max_depth,
+            "handle_ms_avg": round(self.handle_ms_avg, 3),
+            "handle_ms_max": round(self.handle_ms_max, 3),
+            "dispatch_ms_avg": round(self.dispatch_ms_avg, 3),
+        }
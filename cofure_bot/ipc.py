@@ -0,0 +1,185 @@
+# cofure_bot/ipc.py
+import asyncio
+import itertools
+import json
+import logging
+import os
+import struct
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Khung tin: 4 byte độ dài (big-endian) + JSON
+_HEADER          = struct.Struct(">I")
+MAX_FRAME        = 4 * 1024 * 1024
+REQUEST_TIMEOUT  = 30.0
+RECONNECT_SEC    = 1.0
+
+Handler = Callable[["IpcPeer", Dict[str, Any]], Awaitable[Any]]
+
+class IpcError(Exception):
+    pass
+
+class IpcPeer:
+    """
+    1 đầu kết nối IPC (Unix socket). Tin có "op" → chuyển cho handler; request() chờ
+    tin trả lời cùng "id". Handler trả giá trị ≠ None → gửi lại {"op": "reply", ...}.
+    """
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, handler: Handler):
+        self._reader = reader
+        self._writer = writer
+        self._handler = handler
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._tasks: set = set()
+
+    @property
+    def closed(self) -> bool:
+        return self._writer.is_closing()
+
+    async def send(self, msg: Dict[str, Any]):
+        body = json.dumps(msg, separators=(",", ":"), ensure_ascii=False).encode()
+        self._writer.write(_HEADER.pack(len(body)) + body)
+        await self._writer.drain()
+
+    async def request(self, msg: Dict[str, Any], timeout: float = REQUEST_TIMEOUT) -> Any:
+        rid = next(self._ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[rid] = fut
+        try:
+            await self.send({**msg, "id": rid})
+            return await asyncio.wait_for(fut, timeout)
+        finally:
+            self._pending.pop(rid, None)
+
+    async def serve(self):
+        """Đọc tin tới khi kết nối đóng; mỗi tin xử lý ở task riêng (tin chậm không chặn tin sau)."""
+        try:
+            while True:
+                head = await self._reader.readexactly(_HEADER.size)
+                (n,) = _HEADER.unpack(head)
+                if n > MAX_FRAME:
+                    raise IpcError(f"frame too large: {n}")
+                msg = json.loads(await self._reader.readexactly(n))
+                if msg.get("op") == "reply":
+                    fut = self._pending.get(msg.get("id"))
+                    if fut is not None and not fut.done():
+                        if msg.get("ok"):
+                            fut.set_result(msg.get("result"))
+                        else:
+                            fut.set_exception(IpcError(msg.get("error") or "remote error"))
+                    continue
+                t = asyncio.create_task(self._dispatch(msg))
+                self._tasks.add(t)
+                t.add_done_callback(self._tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.close()
+
+    async def _dispatch(self, msg: Dict[str, Any]):
+        rid = msg.get("id")
+        try:
+            result = await self._handler(self, msg)
+            reply = {"op": "reply", "id": rid, "ok": True, "result": result}
+        except Exception as e:
+            logger.warning("IPC %s failed: %s", msg.get("op"), e)
+            reply = {"op": "reply", "id": rid, "ok": False, "error": f"{type(e).__name__}: {e}"}
+        if rid is not None and not self.closed:
+            try:
+                await self.send(reply)
+            except ConnectionError:
+                pass
+
+    def close(self):
+        for fut in self._pending.values():
+            if not fut.done():
+                fut.set_exception(IpcError("connection closed"))
+        self._pending.clear()
+        if not self._writer.is_closing():
+            self._writer.close()
+
+class IpcServer:
+    """Phía ingress: nghe trên Unix socket, giữ 1 kết nối worker (kết nối mới thay kết nối cũ)."""
+    def __init__(self, path: str, handler: Handler):
+        self.path = path
+        self._handler = handler
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.peer: Optional[IpcPeer] = None
+        self.connected = asyncio.Event()
+
+    async def start(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._on_connect, path=self.path)
+
+    async def _on_connect(self, reader, writer):
+        if self.peer is not None:
+            self.peer.close()
+        peer = self.peer = IpcPeer(reader, writer, self._handler)
+        self.connected.set()
+        logger.info("Worker connected over IPC")
+        try:
+            await peer.serve()
+        finally:
+            if self.peer is peer:
+                self.peer = None
+                self.connected.clear()
+                logger.warning("Worker disconnected")
+
+    async def stop(self):
+        if self.peer is not None:
+            self.peer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+class IpcClient:
+    """Phía worker: kết nối tới ingress, tự kết nối lại khi mất."""
+    def __init__(self, path: str, handler: Handler):
+        self.path = path
+        self._handler = handler
+        self.peer: Optional[IpcPeer] = None
+        self.connected = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="ipc_client")
+
+    async def _run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(RECONNECT_SEC)
+                continue
+            peer = self.peer = IpcPeer(reader, writer, self._handler)
+            self.connected.set()
+            logger.info("Connected to ingress over IPC")
+            try:
+                await peer.serve()
+            finally:
+                self.peer = None
+                self.connected.clear()
+            logger.warning("IPC connection lost, reconnecting")
+            await asyncio.sleep(RECONNECT_SEC)
+
+    async def request(self, msg: Dict[str, Any], timeout: float = REQUEST_TIMEOUT) -> Any:
+        await asyncio.wait_for(self.connected.wait(), timeout)
+        return await self.peer.request(msg, timeout)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.peer is not None:
+            self.peer.close()
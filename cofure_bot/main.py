@@ -1,17 +1,42 @@
 import asyncio
 import logging
+import os
 import sys
+from typing import Optional
 from aiohttp import web
-from telegram import Update, BotCommand
+from telegram import BotCommand, Update
 from telegram.ext import Application, ApplicationBuilder, CommandHandler, MessageHandler, filters
 
 # 👉 Dùng absolute import, KHÔNG dùng ".."
-from cofure_bot.config import APP_NAME, PORT, TELEGRAM_BOT_TOKEN, PUBLIC_BASE_URL
-from cofure_bot.handlers.commands import start, on_text
+from cofure_bot.config import (
+    APP_NAME, PORT, TELEGRAM_BOT_TOKEN, PUBLIC_BASE_URL, INDICATOR_STATE_FILE,
+    BINANCE_FAPI_URL, BINANCE_WS_URL, MARKET_STREAM_ENABLED, WEBHOOK_SECRET, WEBHOOK_QUEUE_MAX,
+    HISTORY_DIR, HISTORY_STORE_ENABLED, DEBUG_TOKEN, SLOW_CALLBACK_MS, LOOP_LAG_DEGRADED_MS,
+    ROLE, IPC_SOCKET, COMPUTE_MODE, COMPUTE_WORKERS, COMPUTE_POOL_MIN_SYMBOLS,
+)
+from cofure_bot.debug import DebugEndpoints
+from cofure_bot.ingress import WebhookIngress
+from cofure_bot.ipc import IpcClient, IpcError, IpcServer
+from cofure_bot.data.binance_client import BinanceClient, BOT_DATA_KEY
+from cofure_bot.data.compute_pool import ComputePool
+from cofure_bot.data.streaming import IndicatorBook
+from cofure_bot.data.market_stream import MarketStream
+from cofure_bot.handlers.commands import start, on_text, sub_cmd, unsub_cmd
 from cofure_bot.handlers.menu import (
     lich_hom_nay_cmd, lich_ngay_mai_cmd, lich_ca_tuan_cmd, test_full_cmd
 )
 from cofure_bot.scheduler.jobs import setup_jobs
+from cofure_bot.storage.history import HistoryStore
+from cofure_bot.storage.state import STORE
+from cofure_bot.storage.subscriptions import SUBSCRIPTIONS
+from cofure_bot.utils.loop_watchdog import LoopWatchdog
+from cofure_bot.utils.outbox import (
+    Outbox, RemoteOutbox, OUTBOX_KEY, PRIORITY_HIGH, get_outbox, serve_remote_send,
+)
+from cofure_bot.utils.metrics import (
+    REGISTRY, CONTENT_TYPE, BINANCE_USED_WEIGHT, OUTBOX_DEPTH, WEBHOOK_QUEUE_DEPTH, WEBHOOK_UPDATES,
+    instrument_handler,
+)
 
 logging.basicConfig(
     stream=sys.stdout,
@@ -20,30 +45,68 @@ logging.basicConfig(
 )
 logger = logging.getLogger(APP_NAME)
 
+# Lệnh cần dữ liệu thị trường/state → chạy ở process worker khi tách process
+WORKER_COMMANDS = (
+    ("sub", sub_cmd), ("unsub", unsub_cmd),
+    ("lich_hom_nay", lich_hom_nay_cmd), ("lich_ngay_mai", lich_ngay_mai_cmd),
+    ("lich_ca_tuan", lich_ca_tuan_cmd), ("test_full", test_full_cmd),
+)
+WORKER_HEALTH_TIMEOUT_SEC = 2.0
+
 # -------- AIOHTTP (endpoints) --------
 async def index(request):
     return web.json_response({"status": "ok", "app": APP_NAME})
 
+async def _worker_health(ipc: IpcServer) -> dict:
+    if ipc.peer is None:
+        return {"connected": False}
+    try:
+        return {"connected": True, **await ipc.peer.request({"op": "health"}, timeout=WORKER_HEALTH_TIMEOUT_SEC)}
+    except (IpcError, asyncio.TimeoutError) as e:
+        return {"connected": True, "error": str(e) or type(e).__name__}
+
 async def health(request):
-    return web.json_response({"status": "ok", "app": APP_NAME})
+    # vẫn trả 200 khi degraded: loop chậm không phải lý do để nền tảng restart instance
+    loop = request.app["watchdog"].stats()
+    body = {"app": APP_NAME, "loop": loop, "webhook": request.app["ingress"].stats()}
+    degraded = loop["degraded"]
+    ipc = request.app.get("ipc")
+    if ipc is not None:
+        worker = body["worker"] = await _worker_health(ipc)
+        degraded = degraded or not worker["connected"] or worker.get("loop", {}).get("degraded", True)
+    return web.json_response({"status": "degraded" if degraded else "ok", **body})
 
 async def info(request):
     return web.Response(text=f"{APP_NAME} is running", content_type="text/plain")
 
-async def webhook_handler(request):
-    data = await request.json()
-    application: Application = request.app["application"]
-    update = Update.de_json(data, application.bot)
-    await application.update_queue.put(update)
-    return web.Response(status=200)
+async def metrics(request):
+    return web.Response(body=REGISTRY.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+async def _start_ingress(app: web.Application):
+    await app["ingress"].start()
 
-async def _start_aiohttp(application: Application):
+async def _stop_ingress(app: web.Application):
+    await app["ingress"].stop()
+
+async def _start_aiohttp(application: Application, watchdog: LoopWatchdog, ipc: Optional[IpcServer] = None):
     app = web.Application()
     app["application"] = application
+    app["watchdog"] = watchdog
+    if ipc is not None:
+        app["ipc"] = ipc
+    ingress = app["ingress"] = WebhookIngress(application, WEBHOOK_SECRET, maxsize=WEBHOOK_QUEUE_MAX)
+    WEBHOOK_QUEUE_DEPTH.fn = lambda: {(): ingress.depth}
+    WEBHOOK_UPDATES.fn = lambda: {(k,): v for k, v in ingress.counters.items()}
+    app.on_startup.append(_start_ingress)
+    app.on_cleanup.append(_stop_ingress)
     app.router.add_get("/", index)
     app.router.add_get("/health", health)
     app.router.add_get("/info", info)
-    app.router.add_post("/webhook", webhook_handler)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_post("/webhook", ingress.handle)
+    if DEBUG_TOKEN:
+        DebugEndpoints(DEBUG_TOKEN, watchdog).register(app)
+        logger.info("Debug endpoints enabled at /debug/*")
 
     runner = web.AppRunner(app)
     await runner.setup()
@@ -52,43 +115,218 @@ async def _start_aiohttp(application: Application):
     return runner
 
 # -------- Telegram (WEBHOOK) --------
-async def _start_telegram_webhook() -> Application:
-    application: Application = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+def _add_worker_handlers(application: Application):
+    # Lệnh đăng ký + menu (lịch + test full), đo thời gian xử lý cho /metrics
+    for command, handler in WORKER_COMMANDS:
+        application.add_handler(CommandHandler(command, instrument_handler(command, handler)))
+
+def _forwarder(ipc: IpcServer):
+    """Handler ở ingress: chuyển nguyên update sang worker, không chờ worker xử lý xong."""
+    async def forward(update: Update, context):
+        if ipc.peer is None:
+            get_outbox(context).send(update.effective_chat.id, "⏳ Bộ quét đang khởi động, thử lại sau ít phút.",
+                                     priority=PRIORITY_HIGH)
+            return
+        await ipc.peer.send({"op": "update", "data": update.to_dict()})
+    return forward
 
-    # Handlers cơ bản
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_text))
+async def _start_telegram_webhook(client: Optional[BinanceClient], forward=None) -> Application:
+    """forward=None → xử lý mọi lệnh tại chỗ; có forward → lệnh WORKER_COMMANDS chuyển sang worker."""
+    # update_queue có giới hạn: handler chậm → ingress trả 429 thay vì dồn RAM
+    application: Application = (ApplicationBuilder().token(TELEGRAM_BOT_TOKEN)
+                                .update_queue(asyncio.Queue(maxsize=WEBHOOK_QUEUE_MAX)).build())
+    if client is not None:
+        # Client Binance dùng chung cho mọi job/handler (đặt trước khi nhận update)
+        application.bot_data[BOT_DATA_KEY] = client
 
-    # Handlers menu (lịch + test full)
-    application.add_handler(CommandHandler("lich_hom_nay", lich_hom_nay_cmd))
-    application.add_handler(CommandHandler("lich_ngay_mai", lich_ngay_mai_cmd))
-    application.add_handler(CommandHandler("lich_ca_tuan", lich_ca_tuan_cmd))
-    application.add_handler(CommandHandler("test_full", test_full_cmd))
+    # Handlers cơ bản (đo thời gian xử lý cho /metrics)
+    application.add_handler(CommandHandler("start", instrument_handler("start", start)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, instrument_handler("text", on_text)))
+    if forward is None:
+        _add_worker_handlers(application)
+    else:
+        application.add_handler(CommandHandler([c for c, _ in WORKER_COMMANDS],
+                                               instrument_handler("forward", forward)))
 
     await application.initialize()
     await application.start()
 
+    # Mọi tin gửi đi qua 1 hàng đợi chung (giới hạn tốc độ, RetryAfter, gộp tin)
+    outbox = Outbox(application.bot)
+    application.bot_data[OUTBOX_KEY] = outbox
+    OUTBOX_DEPTH.fn = lambda: {(): len(outbox)}
+    await outbox.start()
+
     # Menu lệnh trong Telegram
     await application.bot.set_my_commands([
         BotCommand("lich_hom_nay", "📅 Tin vĩ mô hôm nay"),
         BotCommand("lich_ngay_mai", "📅 Tin vĩ mô ngày mai"),
         BotCommand("lich_ca_tuan", "📅 Lịch từ Thứ 2 đến Chủ nhật"),
         BotCommand("test_full", "🧪 Test đầy đủ 06:00→22:00"),
+        BotCommand("sub", "🔔 Đăng ký / lọc tín hiệu"),
+        BotCommand("unsub", "🔕 Ngừng nhận tin"),
     ])
 
     webhook_url = f"{PUBLIC_BASE_URL.rstrip('/')}/webhook"
-    await application.bot.set_webhook(webhook_url)
+    await application.bot.set_webhook(webhook_url, secret_token=WEBHOOK_SECRET)
     logger.info("Webhook set to %s", webhook_url)
     return application
 
-async def main():
-    application = await _start_telegram_webhook()
+# -------- State + dữ liệu thị trường --------
+async def _start_watchdog() -> LoopWatchdog:
+    # Đo độ trễ event loop ngay từ đầu (cả lúc khôi phục state, tải nến)
+    watchdog = LoopWatchdog(slow_sec=SLOW_CALLBACK_MS / 1000, degraded_sec=LOOP_LAG_DEGRADED_MS / 1000)
+    await watchdog.start()
+    return watchdog
+
+async def _open_state():
+    # Cooldown, bộ đếm, sự kiện đã báo, đăng ký... sống qua restart
+    STORE.open()
+    await STORE.start()
+    logger.info("Restored %d state keys", len(STORE))
+    SUBSCRIPTIONS.load()
+    logger.info("Loaded %d subscriptions", len(SUBSCRIPTIONS))
+
+async def _start_client() -> BinanceClient:
+    client = await BinanceClient(base_url=BINANCE_FAPI_URL).start()
+    BINANCE_USED_WEIGHT.fn = lambda: {(): client.limiter.used}
+    # Khôi phục trạng thái chỉ báo → không phải tải lại toàn bộ lịch sử nến
+    client.indicator_book = IndicatorBook.load(INDICATOR_STATE_FILE)
+    logger.info("Restored indicator state for %d series", len(client.indicator_book))
+    if HISTORY_STORE_ENABLED:
+        # nến đã đóng nằm trên đĩa → khởi động lại chỉ tải phần còn thiếu
+        client.kline_cache.history = HistoryStore(HISTORY_DIR)
+    # universe lớn → tính chỉ báo ở process pool (1 CPU → COMPUTE_WORKERS=0 → luôn tại chỗ)
+    client.compute = ComputePool(COMPUTE_MODE, COMPUTE_WORKERS, COMPUTE_POOL_MIN_SYMBOLS)
+    await client.compute.start()
+    if MARKET_STREAM_ENABLED:
+        # nến 5m + mark price/funding qua WebSocket; job chỉ cần đọc cache
+        client.stream = MarketStream(client, url=BINANCE_WS_URL)
+        await client.stream.start()
+    return client
+
+async def _close_client(client: BinanceClient):
+    if client.stream is not None:
+        await client.stream.stop()
+    try:
+        client.indicator_book.save(INDICATOR_STATE_FILE)
+    except OSError as e:
+        logger.warning("Could not save indicator state: %s", e)
+    await client.close()
+
+# -------- Vai trò --------
+async def run_all():
+    """1 process: webhook, lệnh, job quét cùng 1 event loop (gói free của Render)."""
+    watchdog = await _start_watchdog()
+    await _open_state()
+    client = await _start_client()
+    application = await _start_telegram_webhook(client)
     setup_jobs(application)
-    runner = await _start_aiohttp(application)
+    runner = await _start_aiohttp(application, watchdog)
 
     try:
         await asyncio.Event().wait()
     finally:
+        await application.bot_data[OUTBOX_KEY].stop()
         await application.stop()
         await application.shutdown()
         await runner.cleanup()
+        await _close_client(client)
+        await STORE.close()
+        await watchdog.stop()
+
+async def run_ingress():
+    """
+    Process ingress: nhận webhook, trả lệnh nhẹ, gửi mọi tin Telegram (Outbox thật).
+    Lệnh cần dữ liệu chuyển sang worker qua IPC; worker gửi tin ngược lại qua IPC.
+    """
+    watchdog = await _start_watchdog()
+    application: Optional[Application] = None
+
+    async def on_ipc(peer, msg):
+        if msg.get("op") == "send":
+            return await serve_remote_send(application.bot_data[OUTBOX_KEY], msg)
+        raise IpcError(f"unknown op: {msg.get('op')}")
+
+    ipc = IpcServer(IPC_SOCKET, on_ipc)
+    application = await _start_telegram_webhook(None, forward=_forwarder(ipc))
+    await ipc.start()
+    runner = await _start_aiohttp(application, watchdog, ipc)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await application.bot_data[OUTBOX_KEY].stop()
+        await ipc.stop()
+        await application.stop()
+        await application.shutdown()
+        await watchdog.stop()
+
+async def run_worker():
+    """
+    Process worker: state, dữ liệu Binance, job quét và lệnh cần dữ liệu.
+    Không mở cổng HTTP, không nhận webhook; tin gửi đi qua RemoteOutbox → ingress.
+    """
+    watchdog = await _start_watchdog()
+    await _open_state()
+    client = await _start_client()
+    application: Application = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).updater(None).build()
+    application.bot_data[BOT_DATA_KEY] = client
+    _add_worker_handlers(application)
+
+    async def on_ipc(peer, msg):
+        op = msg.get("op")
+        if op == "update":
+            await application.update_queue.put(Update.de_json(msg["data"], application.bot))
+            return None
+        if op == "health":
+            return {"loop": watchdog.stats(), "outbox_pending": len(outbox),
+                    "state_keys": len(STORE), "subscriptions": len(SUBSCRIPTIONS)}
+        raise IpcError(f"unknown op: {op}")
+
+    ipc = IpcClient(IPC_SOCKET, on_ipc)
+    await application.initialize()
+    await application.start()
+    outbox = RemoteOutbox(ipc, application.bot)
+    application.bot_data[OUTBOX_KEY] = outbox
+    OUTBOX_DEPTH.fn = lambda: {(): len(outbox)}
+    await ipc.start()
+    setup_jobs(application)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await outbox.stop()
+        await ipc.stop()
+        await application.stop()
+        await application.shutdown()
+        await _close_client(client)
+        await STORE.close()
+        await watchdog.stop()
+
+async def run_split():
+    """Chạy ingress + worker thành 2 process con; 1 process thoát → dừng cả 2 để nền tảng khởi động lại."""
+    procs = {}
+    for role in ("ingress", "worker"):
+        procs[role] = await asyncio.create_subprocess_exec(sys.executable, *sys.argv,
+                                                           env={**os.environ, "COFURE_ROLE": role})
+    waits = {asyncio.create_task(p.wait()): role for role, p in procs.items()}
+    try:
+        done, _ = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+        role = waits[next(iter(done))]
+        logger.error("%s process exited with code %s", role, procs[role].returncode)
+    finally:
+        for p in procs.values():
+            if p.returncode is None:
+                p.terminate()
+        await asyncio.gather(*waits)
+
+ROLES = {"all": run_all, "ingress": run_ingress, "worker": run_worker, "split": run_split}
+
+async def main():
+    runner = ROLES.get(ROLE)
+    if runner is None:
+        raise SystemExit(f"Unknown COFURE_ROLE={ROLE!r} (expected one of {', '.join(ROLES)})")
+    logger.info("Starting %s (role=%s)", APP_NAME, ROLE)
+    await runner()
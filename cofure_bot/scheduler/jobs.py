@@ -1,18 +1,31 @@
+import asyncio
+import heapq
 import aiohttp
 import datetime as dt
 from datetime import datetime, timedelta
 from telegram.ext import Application, ContextTypes, JobQueue
 import pytz
 
-from cofure_bot.config import TELEGRAM_ALLOWED_USER_ID, TZ_NAME
-from cofure_bot.signals.engine import generate_batch, generate_signal
-from cofure_bot.data.binance_client import active_symbols, top_gainers, quick_signal_metrics
-from cofure_bot.data.macro_calendar import fetch_macro_today, fetch_macro_week, fetch_macro_tomorrow
+from cofure_bot.config import (
+    TZ_NAME, INDICATOR_STATE_FILE, FX_RATE_URL, FX_RATE_FALLBACK_URL,
+)
+from cofure_bot.utils.files import write_snapshot
+from cofure_bot.data.snapshot import market_snapshot
+from cofure_bot.data.rate_limit import request_weight
+from cofure_bot.signals.engine import signal_from_metrics
+from cofure_bot.data.binance_client import (
+    get_client, top_gainers, timeframe_metrics,
+)
+from cofure_bot.data.macro_calendar import fetch_macro_today, fetch_macro_tomorrow, macro_calendar
+from cofure_bot.utils.outbox import get_outbox, PRIORITY_URGENT, PRIORITY_HIGH
+from cofure_bot.utils.fanout import publish
+from cofure_bot.utils.metrics import instrument_job
 from cofure_bot.storage.state import (
     bump_signals, bump_alerts, snapshot,
     can_alert_symbol, mark_alert_symbol,
     can_alert_this_hour, bump_alert_hour,
     get_sticky_message_id, set_sticky_message_id,
+    was_macro_sent, mark_macro_sent,
 )
 
 VN_TZ = pytz.timezone(TZ_NAME)
@@ -47,15 +60,38 @@ URGENT_REQUIRE_TREND_ALIGN = True
 URGENT_MIN_RR              = 1.50
 URGENT_ENTRY_SLIPPAGE_MAX  = 0.003
 
-# CACHE phân tích lịch
-_pre_announced = set()
-_post_reported  = set()
+# Version lịch vĩ mô đã đặt job
+_macro_synced_version = -1
+
+# Job theo sự kiện vĩ mô
+MACRO_CHECKPOINTS     = (30, 15, 5)   # phút trước giờ ra tin
+MACRO_POST_WINDOW_MIN = 15            # hỏi số "actual" trong 15' sau giờ ra tin
+MACRO_POST_POLL_SEC   = 60
+MACRO_POST_DELAY_SEC  = 30            # nguồn lịch thường cập nhật trễ vài chục giây
+MACRO_SYNC_SEC        = 900
+MACRO_PRE_PREFIX      = "macro_pre:"
+MACRO_POST_PREFIX     = "macro_post:"
+
+# Weight dự trữ cho lệnh người dùng/job khác khi một lượt quét đang chạy
+SCAN_WEIGHT_RESERVE = 200
+
+# Tín hiệu Swing (vị trí 4–5) xét thêm xu hướng khung lớn, dựng từ nến 5m trong cache
+SWING_TIMEFRAMES = ("15m", "1h", "4h")
 
 # ========= TIỆN ÍCH =========
 def _in_work_hours() -> bool:
     now = datetime.now(VN_TZ)
     return WORK_START <= now.hour < WORK_END
 
+def _scan_size(client) -> int:
+    """Số symbol quét được với ngân sách weight còn lại (tối đa MAX_CANDIDATES)."""
+    per_symbol = request_weight("/fapi/v1/klines", {"limit": 200})
+    return max(5, min(MAX_CANDIDATES, client.limiter.affordable(per_symbol, reserve=SCAN_WEIGHT_RESERVE)))
+
+async def _market_snapshot(client):
+    """Snapshot thị trường dùng chung cho mọi job/lệnh trong cùng tick."""
+    return await market_snapshot(client, MIN_QUOTE_VOL, _scan_size(client))
+
 def _day_name_vi(d: datetime) -> str:
     return {1:"Thứ 2",2:"Thứ 3",3:"Thứ 4",4:"Thứ 5",5:"Thứ 6",6:"Thứ 7",7:"Chủ nhật"}[d.isoweekday()]
 
@@ -69,6 +105,11 @@ def _fmt_signal(sig: dict) -> str:
     if sig.get("ema9") is not None: reasons.append(f"EMA9={sig['ema9']}")
     if sig.get("ema21") is not None: reasons.append(f"EMA21={sig['ema21']}")
     reason_str = ", ".join(reasons)
+    tf_line = ""
+    if sig.get("timeframes"):
+        arrows = {1: "▲", -1: "▼", 0: "•"}
+        tf_str = " · ".join(f"{k} {arrows[t]}" for k, t in sig["timeframes"].items())
+        tf_line = f"🧭 Khung lớn: {tf_str} ({sig['tf_aligned']}/{len(sig['timeframes'])} cùng chiều)\n"
     return (
         f"📈 {sig['token']} — {side_square} {sig['side']}\n\n"
         f"🟢 Loại lệnh: {sig.get('signal_type','Scalping')}\n"
@@ -77,6 +118,7 @@ def _fmt_signal(sig: dict) -> str:
         f"🎯 TP: {sig['tp']}\n"
         f"🛡️ SL: {sig['sl']}\n"
         f"📊 Độ mạnh: {sig['strength']}% ({label})\n"
+        f"{tf_line}"
         f"📌 Lý do: {reason_str}\n"
         f"🕒 Thời gian: {sig['time']}"
     )
@@ -118,30 +160,30 @@ def _macro_bias(event_title_en: str, actual: str, forecast: str, previous: str)
     return "ℹ️ Sự kiện vĩ mô quan trọng — phản ứng tuỳ bối cảnh"
 
 # ========= 06:00 — Chào buổi sáng =========
-async def job_morning(context: ContextTypes.DEFAULT_TYPE):
+async def morning_text(context) -> str:
+    client = get_client(context)
     usd_vnd = None
+    s = client.session
     try:
-        async with aiohttp.ClientSession() as s:
-            try:
-                async with s.get("https://api.exchangerate.host/latest",
-                                 params={"base":"USD","symbols":"VND"},
-                                 timeout=aiohttp.ClientTimeout(total=10)) as r:
-                    if r.status == 200:
-                        data = await r.json()
-                        usd_vnd = float(data.get("rates", {}).get("VND") or 0) or None
-            except Exception:
-                pass
-            if not usd_vnd:
-                async with s.get("https://open.er-api.com/v6/latest/USD",
-                                 timeout=aiohttp.ClientTimeout(total=10)) as r2:
-                    if r2.status == 200:
-                        data2 = await r2.json()
-                        usd_vnd = float(data2.get("rates", {}).get("VND") or 0) or None
+        try:
+            async with s.get(FX_RATE_URL,
+                             params={"base":"USD","symbols":"VND"},
+                             timeout=aiohttp.ClientTimeout(total=10)) as r:
+                if r.status == 200:
+                    data = await r.json()
+                    usd_vnd = float(data.get("rates", {}).get("VND") or 0) or None
+        except Exception:
+            pass
+        if not usd_vnd:
+            async with s.get(FX_RATE_FALLBACK_URL,
+                             timeout=aiohttp.ClientTimeout(total=10)) as r2:
+                if r2.status == 200:
+                    data2 = await r2.json()
+                    usd_vnd = float(data2.get("rates", {}).get("VND") or 0) or None
     except Exception:
         usd_vnd = None
 
-    async with aiohttp.ClientSession() as session:
-        gainers = await top_gainers(session, 5)
+    gainers = await top_gainers(client, 5)
 
     lines = [f"Chào buổi sáng nhé Cofure ☀️  (1 USD ≈ {usd_vnd:,.0f} VND)" if usd_vnd else
              "Chào buổi sáng nhé Cofure ☀️  (USD≈VND - tham chiếu)", ""]
@@ -150,20 +192,18 @@ async def job_morning(context: ContextTypes.DEFAULT_TYPE):
         sym = g.get("symbol"); chg = float(g.get("priceChangePercent", 0) or 0); vol = float(g.get("quoteVolume", 0) or 0)
         lines.append(f"• <b>{sym}</b> ▲ {chg:.2f}% | Volume: {vol:,.0f} USDT")
     lines += ["", "📊 Funding, volume, xu hướng sẽ có trong tín hiệu định kỳ suốt ngày."]
+    return "\n".join(lines)
 
-    await context.bot.send_message(chat_id=TELEGRAM_ALLOWED_USER_ID,
-                                   text="\n".join(lines), parse_mode="HTML",
-                                   disable_web_page_preview=True)
+async def job_morning(context: ContextTypes.DEFAULT_TYPE):
+    publish(context, "daily", await morning_text(context), parse_mode="HTML", disable_web_page_preview=True)
 
 # ========= 07:00 — Lịch vĩ mô hôm nay =========
-async def job_macro(context: ContextTypes.DEFAULT_TYPE):
-    events = await fetch_macro_today()
+async def macro_today_text(context) -> str:
+    events = await fetch_macro_today(get_client(context).session)
     now = datetime.now(VN_TZ)
     header = f"📅 {_day_name_vi(now)}, ngày {now.strftime('%d/%m/%Y')}"
     if not events:
-        await context.bot.send_message(chat_id=TELEGRAM_ALLOWED_USER_ID,
-                                       text=header + "\n\nHôm nay không có tin vĩ mô đáng chú ý theo tiêu chí đã lọc.")
-        return
+        return header + "\n\nHôm nay không có tin vĩ mô đáng chú ý theo tiêu chí đã lọc."
     lines = [header, "", "🧭 Lịch tin vĩ mô đáng chú ý:"]
     for e in events:
         tstr = e["time_vn"].strftime("%H:%M")
@@ -178,16 +218,18 @@ async def job_macro(context: ContextTypes.DEFAULT_TYPE):
         else:
             countdown = ""
         lines.append(f"• {tstr} — {e['title_vi']} — Ảnh hưởng: {e['impact']}{extra_str}{countdown}")
-    await context.bot.send_message(chat_id=TELEGRAM_ALLOWED_USER_ID, text="\n".join(lines))
+    return "\n".join(lines)
+
+async def job_macro(context: ContextTypes.DEFAULT_TYPE):
+    publish(context, "macro", await macro_today_text(context))
 
 # ========= 21:00 — Xem trước lịch NGÀY MAI =========
 async def job_macro_tomorrow_preview(context: ContextTypes.DEFAULT_TYPE):
-    events = await fetch_macro_tomorrow()
+    events = await fetch_macro_tomorrow(get_client(context).session)
     now = datetime.now(VN_TZ) + timedelta(days=1)
     header = f"🔔 Xem trước lịch ngày mai ({_day_name_vi(now)} {now.strftime('%d/%m/%Y')})"
     if not events:
-        await context.bot.send_message(chat_id=TELEGRAM_ALLOWED_USER_ID,
-                                       text=header + "\n\nKhông có tin vĩ mô đáng chú ý theo tiêu chí đã lọc.")
+        publish(context, "macro", header + "\n\nKhông có tin vĩ mô đáng chú ý theo tiêu chí đã lọc.")
         return
     lines = [header, "", "🧭 Sự kiện đáng chú ý ngày mai:"]
     for e in events:
@@ -197,11 +239,10 @@ async def job_macro_tomorrow_preview(context: ContextTypes.DEFAULT_TYPE):
         if e.get("previous"): extra.append(f"Trước {e['previous']}")
         extra_str = (" — " + ", ".join(extra)) if extra else ""
         lines.append(f"• {tstr} — {e['title_vi']} — Ảnh hưởng: {e['impact']}{extra_str}")
-    await context.bot.send_message(chat_id=TELEGRAM_ALLOWED_USER_ID, text="\n".join(lines))
+    publish(context, "macro", "\n".join(lines))
 
 # ========= TÍNH ĐIỂM KHẨN =========
-async def _calc_urgency_components(session, symbol: str):
-    m = await quick_signal_metrics(session, symbol, interval="5m")
+def _urgency_components(m):
     last = m.get("last") or 0.0
     ema9  = m.get("ema50") or last
     ema21 = m.get("ema200") or last
@@ -209,11 +250,91 @@ async def _calc_urgency_components(session, symbol: str):
     vol_ratio = m.get("vol_ratio") or 1.0
     z_vol = max(0.0, vol_ratio - 1.0)
     abs_funding = abs(m.get("funding") or 0.0)
-    return ret15m_abs, z_vol, abs_funding, m
+    return ret15m_abs, z_vol, abs_funding
 
 def _urgent_score(ret15m_abs, z_vol, abs_funding):
     return 1.0 * z_vol + 0.6 * ret15m_abs + 40.0 * abs_funding
 
+def _urgent_candidate(sym: str, m: dict):
+    """Lọc + chấm điểm khẩn cho 1 symbol từ metrics có sẵn (không gọi mạng, không xét cooldown)."""
+    vr = float(m.get("vol_ratio") or 1.0)
+    fd = abs(float(m.get("funding") or 0.0))
+    if (fd < ALERT_FUNDING) and (vr < ALERT_VOLRATIO):
+        return None
+    ret15m_abs, z_vol, abs_funding = _urgency_components(m)
+    score = _urgent_score(ret15m_abs, z_vol, abs_funding)
+
+    if vr < URGENT_VOLRATIO_MIN or vr > URGENT_VOLRATIO_MAX:
+        return None
+    if abs_funding < URGENT_FUNDING_MIN:
+        return None
+
+    trend_long = None
+    if URGENT_REQUIRE_TREND_ALIGN:
+        last = float(m.get("last") or 0.0)
+        ema50 = float(m.get("ema50") or last)
+        ema200 = float(m.get("ema200") or last)
+        trend_long  = last > ema50 > ema200
+        trend_short = last < ema50 < ema200
+        if not (trend_long or trend_short):
+            return None
+
+    strong = (score >= ALERT_SCORE_STRONG) or (vr >= ALERT_STRONG_VOLRATIO)
+    return {"symbol": sym, "score": score, "metrics": m, "trend_long": trend_long, "strong": strong}
+
+def _urgent_confirm(it: dict):
+    """Dựng tín hiệu từ cùng metrics và kiểm tra hướng/RR/trượt giá. None nếu không đạt."""
+    sym = it["symbol"]; m = it["metrics"]
+    s = signal_from_metrics(sym, m)
+    last = float(m.get("last") or 0.0)
+    entry = float(s["entry"]); tp = float(s["tp"]); sl = float(s["sl"])
+    side = s["side"].upper()
+
+    if URGENT_REQUIRE_TREND_ALIGN:
+        tl = it["trend_long"]
+        if (side == "LONG" and not tl) or (side == "SHORT" and tl):
+            return None
+
+    if side == "LONG":
+        rr = (tp - entry) / max(entry - sl, 1e-9)
+    else:
+        rr = (entry - tp) / max(sl - entry, 1e-9)
+    if rr < URGENT_MIN_RR:
+        return None
+
+    if last > 0:
+        slippage = abs(entry - last) / last
+        if slippage > URGENT_ENTRY_SLIPPAGE_MAX:
+            return None
+
+    s["signal_type"] = "Swing (Khẩn)"
+    s["order_type"]  = "Market"
+    s["funding"]     = m.get("funding")
+    s["vol_ratio"]   = m.get("vol_ratio")
+    it["signal"] = s
+    return it
+
+def _scan_urgent(snap) -> list:
+    """
+    Quét khẩn trên snapshot của tick: lọc → chấm điểm → chọn top-K → xác nhận tín hiệu.
+    Dữ liệu đã tải/tính sẵn trong snapshot, không gọi mạng.
+    """
+    scored = []
+    for sym in snap.candidates:
+        m = snap.metrics[sym]
+        it = _urgent_candidate(sym, m)
+        if it is None:
+            continue
+        if (not it["strong"]) and (not can_alert_symbol(sym, ALERT_COOLDOWN_MIN)):
+            continue
+        scored.append(it)
+    if not scored:
+        return []
+    picks = heapq.nlargest(min(ALERT_TOPK, ALERT_MAX_PER_RUN), scored, key=lambda x: x["score"])
+    final = [it for it in (_urgent_confirm(p) for p in picks) if it is not None]
+    final.sort(key=lambda x: x["score"], reverse=True)
+    return final
+
 def _fmt_board(picks):
     lines = ["🔴 BẢNG CẢNH BÁO KHẨN (Top score)"]
     for it in picks:
@@ -228,30 +349,28 @@ def _fmt_board(picks):
 async def job_halfhour_signals(context: ContextTypes.DEFAULT_TYPE):
     if not _in_work_hours():
         return
-    async with aiohttp.ClientSession() as session:
-        syms = await active_symbols(session, min_quote_volume=MIN_QUOTE_VOL)
-    if not syms: syms = ["BTCUSDT","ETHUSDT","BNBUSDT","SOLUSDT","XRPUSDT"]
-
-    candidates = syms[:MAX_CANDIDATES]
-    signals = await generate_batch(candidates, count=5)
-
-    async with aiohttp.ClientSession() as session:
-        for i, s in enumerate(signals):
-            s["signal_type"] = "Scalping" if i < 3 else "Swing"
-            s["order_type"]  = "Market"
-            star = ""
-            try:
-                ret15m_abs, z_vol, abs_funding, m = await _calc_urgency_components(session, s["token"])
-                score = _urgent_score(ret15m_abs, z_vol, abs_funding)
-                s["funding"]   = m.get("funding")
-                s["vol_ratio"] = m.get("vol_ratio")
-                if score >= STAR_SCORE_THRESHOLD:
-                    star = "⭐ <b>Tín hiệu nổi bật</b>\n\n"
-            except Exception:
-                pass
-            await context.bot.send_message(chat_id=TELEGRAM_ALLOWED_USER_ID,
-                                           text=(star + _fmt_signal(s)),
-                                           parse_mode="HTML")
+    client = get_client(context)
+    snap = await _market_snapshot(client)
+    picked = snap.candidates[:5]
+    tf = await timeframe_metrics(client, list(picked[3:]), SWING_TIMEFRAMES) if len(picked) > 3 else {}
+    # sao/funding/vol dùng lại cùng metrics của snapshot
+    signals = [(signal_from_metrics(sym, snap.metrics[sym], tf.get(sym)), snap.metrics[sym]) for sym in picked]
+
+    for i, (s, m) in enumerate(signals):
+        s["signal_type"] = "Scalping" if i < 3 else "Swing"
+        s["order_type"]  = "Market"
+        star = ""
+        try:
+            score = _urgent_score(*_urgency_components(m))
+            s["funding"]   = m.get("funding")
+            s["vol_ratio"] = m.get("vol_ratio")
+            if score >= STAR_SCORE_THRESHOLD:
+                star = "⭐ <b>Tín hiệu nổi bật</b>\n\n"
+        except Exception:
+            pass
+        # dựng 1 lần, phát tới mọi chat khớp bộ lọc
+        if publish(context, s["signal_type"].lower(), star + _fmt_signal(s),
+                   symbol=s["token"], strength=s["strength"], parse_mode="HTML"):
             bump_signals(1)
 
 # ========= KHẨN (siết mạnh) =========
@@ -259,202 +378,178 @@ async def job_urgent_alerts(context: ContextTypes.DEFAULT_TYPE):
     if not _in_work_hours(): return
     if not can_alert_this_hour(ALERT_PER_HOUR_MAX): return
 
-    async with aiohttp.ClientSession() as session:
-        syms = await active_symbols(session, min_quote_volume=MIN_QUOTE_VOL)
-        syms = syms[:MAX_CANDIDATES] if syms else ["BTCUSDT","ETHUSDT","BNBUSDT","SOLUSDT","XRPUSDT"]
+    snap = await _market_snapshot(get_client(context))
+    final = _scan_urgent(snap)
+    if not final:
+        return
 
-        scored = []
-        for sym in syms:
-            try:
-                mq = await quick_signal_metrics(session, sym, interval="5m")
-                vr = float(mq.get("vol_ratio") or 1.0)
-                fd = abs(float(mq.get("funding") or 0.0))
-                if (fd < ALERT_FUNDING) and (vr < ALERT_VOLRATIO): 
-                    continue
-                ret15m_abs, z_vol, abs_funding, m = await _calc_urgency_components(session, sym)
-                score = _urgent_score(ret15m_abs, z_vol, abs_funding)
-
-                if vr < URGENT_VOLRATIO_MIN or vr > URGENT_VOLRATIO_MAX: 
-                    continue
-                if abs_funding < URGENT_FUNDING_MIN: 
-                    continue
-
-                trend_long = None
-                if URGENT_REQUIRE_TREND_ALIGN:
-                    last = float(m.get("last") or 0.0)
-                    ema50 = float(m.get("ema50") or last)
-                    ema200 = float(m.get("ema200") or last)
-                    trend_long  = last > ema50 > ema200
-                    trend_short = last < ema50 < ema200
-                    if not (trend_long or trend_short):
-                        continue
-
-                strong = (score >= ALERT_SCORE_STRONG) or (vr >= ALERT_STRONG_VOLRATIO)
-                if (not strong) and (not can_alert_symbol(sym, ALERT_COOLDOWN_MIN)):
-                    continue
-
-                scored.append({"symbol": sym, "score": score, "metrics": m, "trend_long": trend_long})
-            except Exception:
-                continue
+    top = final[:1]
 
-        if not scored: return
-        scored.sort(key=lambda x: x["score"], reverse=True)
-        picks = scored[:min(ALERT_TOPK, ALERT_MAX_PER_RUN)]
+    board = _fmt_board(top)
+    detail_lines = ["", "⏰ TÍN HIỆU KHẨN (Vào được ngay)"]
+    for it in top:
+        s = it["signal"]; m = it["metrics"]
+        side_hint = "Long nghiêng" if (m.get("funding") or 0) > 0 else ("Short nghiêng" if (m.get("funding") or 0) < 0 else "Trung tính")
+        guidance = f"\n💡 Gợi ý: {'MUA ngay' if s['side']=='LONG' else 'BÁN ngay'} (đủ điều kiện vào tức thì) — {side_hint}."
+        detail_lines += ["", _fmt_signal(s) + guidance]
 
-        final = []
-        for it in picks:
-            sym = it["symbol"]; m = it["metrics"]
-            try:
-                s = await generate_signal(sym)
-                last = float(m.get("last") or 0.0)
-                entry = float(s["entry"]); tp = float(s["tp"]); sl = float(s["sl"])
-                side = s["side"].upper()
-
-                if URGENT_REQUIRE_TREND_ALIGN:
-                    tl = it["trend_long"]
-                    if (side == "LONG" and not tl) or (side == "SHORT" and tl):
-                        continue
-
-                if side == "LONG":
-                    rr = (tp - entry) / max(entry - sl, 1e-9)
-                else:
-                    rr = (entry - tp) / max(sl - entry, 1e-9)
-                if rr < URGENT_MIN_RR:
-                    continue
-
-                if last > 0:
-                    slippage = abs(entry - last) / last
-                    if slippage > URGENT_ENTRY_SLIPPAGE_MAX:
-                        continue
-
-                s["signal_type"] = "Swing (Khẩn)"
-                s["order_type"]  = "Market"
-                s["funding"]     = m.get("funding")
-                s["vol_ratio"]   = m.get("vol_ratio")
-
-                it["signal"] = s
-                final.append(it)
-            except Exception:
-                continue
-
-        if not final: 
-            return
+        mark_alert_symbol(s["token"])
+        bump_alerts(1)
+        bump_alert_hour()
 
-        final.sort(key=lambda x: x["score"], reverse=True)
-        top = final[:1]
+    combo_text = "\n".join([board] + detail_lines)
 
-        board = _fmt_board(top)
-        detail_lines = ["", "⏰ TÍN HIỆU KHẨN (Vào được ngay)"]
-        for it in top:
-            s = it["signal"]; m = it["metrics"]
-            side_hint = "Long nghiêng" if (m.get("funding") or 0) > 0 else ("Short nghiêng" if (m.get("funding") or 0) < 0 else "Trung tính")
-            guidance = f"\n💡 Gợi ý: {'MUA ngay' if s['side']=='LONG' else 'BÁN ngay'} (đủ điều kiện vào tức thì) — {side_hint}."
-            detail_lines += ["", _fmt_signal(s) + guidance]
+    lead = top[0]
+    futs = publish(context, "urgent", combo_text, symbol=lead["symbol"], strength=lead["signal"]["strength"],
+                   parse_mode="HTML", priority=PRIORITY_URGENT)
+    if PIN_URGENT and futs:
+        await asyncio.gather(*(_pin_urgent(context, chat_id, fut, combo_text) for chat_id, fut in futs.items()),
+                             return_exceptions=True)
 
-            mark_alert_symbol(s["token"])
-            bump_alerts(1)
-            bump_alert_hour()
+async def _pin_urgent(context, chat_id: int, fut, combo_text: str):
+    """Ghim tin khẩn trong 1 chat (bỏ ghim tin cũ); không ghim được → sửa/gửi tin sticky ảo."""
+    try:
+        msg = await fut
+    except Exception:
+        return
+    old_mid = get_sticky_message_id(chat_id)
+    try:
+        if old_mid and old_mid != msg.message_id:
+            try:
+                await context.bot.unpin_chat_message(chat_id=chat_id, message_id=old_mid)
+            except Exception:
+                pass
+        await context.bot.pin_chat_message(chat_id=chat_id, message_id=msg.message_id, disable_notification=True)
+        set_sticky_message_id(msg.message_id, chat_id)
+    except Exception:
+        # sticky ảo
+        try:
+            if old_mid:
+                await context.bot.edit_message_text(chat_id=chat_id, message_id=old_mid, text=combo_text)
+            else:
+                m2 = await get_outbox(context).send(chat_id, text=combo_text, parse_mode="HTML",
+                                                    priority=PRIORITY_URGENT)
+                set_sticky_message_id(m2.message_id, chat_id)
+        except Exception:
+            pass
+
+# ========= LỊCH JOB THEO SỰ KIỆN VĨ MÔ =========
+def _fmt_macro_snap(sym, m):
+    return f"{sym}: funding {m.get('funding',0):.4f} | Vol5m x{(m.get('vol_ratio') or 1.0):.2f}"
+
+async def _macro_market(context):
+    try:
+        snap = await _market_snapshot(get_client(context))
+        return snap.metric("BTCUSDT") or {}, snap.metric("ETHUSDT") or {}
+    except Exception:
+        return {}, {}
 
-        combo_text = "\n".join([board] + detail_lines)
+def _find_event(cal, event_id: str):
+    return next((e for e in cal.events if e["id"] == event_id), None)
 
-        msg = await context.bot.send_message(chat_id=TELEGRAM_ALLOWED_USER_ID, text=combo_text, parse_mode="HTML")
+def _macro_plan(events, now: datetime) -> dict:
+    """Tên job → (loại, thời điểm chạy đầu, data) cho các mốc còn ở tương lai (first ≤ last với job post)."""
+    plan = {}
+    for e in events:
+        at = e["time_vn"]
+        for cp in MACRO_CHECKPOINTS:
+            key = f"{e['id']}@-{cp}"
+            when = at - timedelta(minutes=cp)
+            if when > now and not was_macro_sent(f"pre:{key}"):
+                plan[MACRO_PRE_PREFIX + key] = ("pre", when, {"event_id": e["id"], "cp": cp, "at": at.timestamp()})
+        last = at + timedelta(minutes=MACRO_POST_WINDOW_MIN)
+        if not was_macro_sent(f"post:{e['id']}") and last > now:
+            # đồng bộ rơi vào 30s cuối cửa sổ → vẫn chạy 1 lần lúc `last` (first > last thì job không bao giờ chạy)
+            first = min(max(at, now) + timedelta(seconds=MACRO_POST_DELAY_SEC), last)
+            plan[MACRO_POST_PREFIX + e["id"]] = ("post", first, {"event_id": e["id"], "at": at.timestamp()})
+    return plan
+
+def _sync_macro_jobs(jq: JobQueue, cal, force: bool = False):
+    """
+    Đối chiếu job run_once/run_repeating với lịch: thêm mốc mới, đặt lại khi sự kiện
+    dời giờ, huỷ khi sự kiện biến mất. Lịch không đổi (cùng version) → không làm gì.
+    """
+    global _macro_synced_version
+    if not force and cal.version == _macro_synced_version:
+        return
+    _macro_synced_version = cal.version
+    plan = _macro_plan(cal.events, datetime.now(VN_TZ))
+    for job in jq.jobs():
+        name = job.name or ""
+        if not name.startswith((MACRO_PRE_PREFIX, MACRO_POST_PREFIX)):
+            continue
+        want = plan.get(name)
+        if want is not None and (job.data or {}).get("at") == want[2]["at"]:
+            plan.pop(name)      # vẫn đúng giờ → giữ nguyên
+        else:
+            job.schedule_removal()
+    for name, (kind, when, data) in plan.items():
+        if kind == "pre":
+            jq.run_once(instrument_job(job_macro_pre), when=when, data=data, name=name)
+        else:
+            # chờ số "actual": hỏi lại lịch mỗi phút trong cửa sổ sau giờ ra tin
+            jq.run_repeating(instrument_job(job_macro_post), interval=MACRO_POST_POLL_SEC,
+                             first=when,
+                             last=datetime.fromtimestamp(data["at"], VN_TZ) + timedelta(minutes=MACRO_POST_WINDOW_MIN),
+                             data=data, name=name)
 
-        old_mid = get_sticky_message_id()
-        if PIN_URGENT:
-            try:
-                if old_mid and old_mid != msg.message_id:
-                    try:
-                        await context.bot.unpin_chat_message(chat_id=TELEGRAM_ALLOWED_USER_ID, message_id=old_mid)
-                    except Exception:
-                        pass
-                await context.bot.pin_chat_message(chat_id=TELEGRAM_ALLOWED_USER_ID, message_id=msg.message_id, disable_notification=True)
-                set_sticky_message_id(msg.message_id)
-            except Exception:
-                # sticky ảo
-                try:
-                    if old_mid:
-                        await context.bot.edit_message_text(chat_id=TELEGRAM_ALLOWED_USER_ID, message_id=old_mid, text=combo_text)
-                    else:
-                        m2 = await context.bot.send_message(chat_id=TELEGRAM_ALLOWED_USER_ID, text=combo_text, parse_mode="HTML")
-                        set_sticky_message_id(m2.message_id)
-                except Exception:
-                    pass
+async def job_macro_sync(context: ContextTypes.DEFAULT_TYPE):
+    cal = await macro_calendar(get_client(context).session)
+    _sync_macro_jobs(context.job_queue, cal)
 
 # ========= TRƯỚC GIỜ TIN =========
-async def job_macro_watch_pre(context: ContextTypes.DEFAULT_TYPE):
-    events = await fetch_macro_week()
-    if not events: return
-    now = datetime.now(VN_TZ)
-    checkpoints = [30, 15, 5]
-    targets = []
-    for e in events:
-        delta_min = int((e["time_vn"] - now).total_seconds() // 60)
-        for cp in checkpoints:
-            if delta_min == cp:
-                key = f"{e['id']}@-{cp}"
-                if key not in _pre_announced:
-                    targets.append((e, cp, key))
-    if not targets: return
-
-    async with aiohttp.ClientSession() as session:
-        def fmt_snap(sym, m):
-            return f"{sym}: funding {m.get('funding',0):.4f} | Vol5m x{(m.get('vol_ratio') or 1.0):.2f}"
-        for e, cp, key in targets:
-            try:
-                btc = await quick_signal_metrics(session, "BTCUSDT", interval="5m")
-                eth = await quick_signal_metrics(session, "ETHUSDT", interval="5m")
-            except Exception:
-                btc = {}; eth = {}
-            bias = _macro_bias(e.get("title") or "", e.get("actual") or "", e.get("forecast") or "", e.get("previous") or "")
-            lines = [
-                f"⏳ {cp} phút nữa ra tin: <b>{e['title_vi']}</b>",
-                f"🕒 Giờ VN: {e['time_vn'].strftime('%H:%M %d/%m')}",
-                f"📊 Ảnh hưởng: {e['impact']}",
-            ]
-            extra = []
-            if e.get("forecast"): extra.append(f"Dự báo: {e['forecast']}")
-            if e.get("previous"): extra.append(f"Trước: {e['previous']}")
-            if extra: lines.append(" — ".join(extra))
-            lines += ["", "📈 Snapshot thị trường:", f"• {fmt_snap('BTC', btc)}", f"• {fmt_snap('ETH', eth)}", "", f"🧭 Bias sơ bộ: {bias}", "💡 Mẹo: Đứng ngoài 5–10’ quanh giờ ra tin; tránh FOMO nến đầu."]
-            await context.bot.send_message(chat_id=TELEGRAM_ALLOWED_USER_ID, text="\n".join(lines), parse_mode="HTML")
-            _pre_announced.add(key)
+async def job_macro_pre(context: ContextTypes.DEFAULT_TYPE):
+    data = context.job.data
+    cp = data["cp"]
+    key = f"{data['event_id']}@-{cp}"
+    e = _find_event(await macro_calendar(get_client(context).session), data["event_id"])
+    if e is None or was_macro_sent(f"pre:{key}"):
+        return
+
+    btc, eth = await _macro_market(context)
+    bias = _macro_bias(e.get("title") or "", e.get("actual") or "", e.get("forecast") or "", e.get("previous") or "")
+    lines = [
+        f"⏳ {cp} phút nữa ra tin: <b>{e['title_vi']}</b>",
+        f"🕒 Giờ VN: {e['time_vn'].strftime('%H:%M %d/%m')}",
+        f"📊 Ảnh hưởng: {e['impact']}",
+    ]
+    extra = []
+    if e.get("forecast"): extra.append(f"Dự báo: {e['forecast']}")
+    if e.get("previous"): extra.append(f"Trước: {e['previous']}")
+    if extra: lines.append(" — ".join(extra))
+    lines += ["", "📈 Snapshot thị trường:", f"• {_fmt_macro_snap('BTC', btc)}", f"• {_fmt_macro_snap('ETH', eth)}", "", f"🧭 Bias sơ bộ: {bias}", "💡 Mẹo: Đứng ngoài 5–10’ quanh giờ ra tin; tránh FOMO nến đầu."]
+    publish(context, "macro", "\n".join(lines), parse_mode="HTML", priority=PRIORITY_HIGH)
+    mark_macro_sent(f"pre:{key}")
 
 # ========= SAU GIỜ TIN =========
-async def job_macro_watch_post(context: ContextTypes.DEFAULT_TYPE):
-    events = await fetch_macro_week()
-    if not events: return
-    now = datetime.now(VN_TZ)
-    candidates = []
-    for e in events:
-        dtv = e["time_vn"]
-        if 0 <= (now - dtv).total_seconds() <= 15*60:
-            if e.get("actual") and e["id"] not in _post_reported:
-                candidates.append(e)
-    if not candidates: return
-
-    async with aiohttp.ClientSession() as session:
-        for e in candidates:
-            try:
-                btc = await quick_signal_metrics(session, "BTCUSDT", interval="5m")
-                eth = await quick_signal_metrics(session, "ETHUSDT", interval="5m")
-            except Exception:
-                btc = {}; eth = {}
-            bias = _macro_bias(e.get("title") or "", e.get("actual") or "", e.get("forecast") or "", e.get("previous") or "")
-            def fmt_snap(sym, m):
-                return f"{sym}: funding {m.get('funding',0):.4f} | Vol5m x{(m.get('vol_ratio') or 1.0):.2f}"
-            lines = [
-                f"🛎️ <b>Kết quả vừa công bố:</b> {e['title_vi']}",
-                f"🕒 Giờ VN: {e['time_vn'].strftime('%H:%M %d/%m')}",
-                f"📊 Ảnh hưởng: {e['impact']}",
-            ]
-            trio = []
-            if e.get("actual"):   trio.append(f"Thực tế: {e['actual']}")
-            if e.get("forecast"): trio.append(f"Dự báo: {e['forecast']}")
-            if e.get("previous"): trio.append(f"Trước: {e['previous']}")
-            if trio: lines.append(" — ".join(trio))
-            lines += ["", "📈 Snapshot sau tin:", f"• {fmt_snap('BTC', btc)}", f"• {fmt_snap('ETH', eth)}", "", f"🧭 Đánh giá: {bias}", "⚠️ Lưu ý: Nến đầu sau tin thường nhiễu; chờ xác nhận 1–3 nến."]
-            await context.bot.send_message(chat_id=TELEGRAM_ALLOWED_USER_ID, text="\n".join(lines), parse_mode="HTML")
-            _post_reported.add(e["id"])
+async def job_macro_post(context: ContextTypes.DEFAULT_TYPE):
+    data = context.job.data
+    cal = await macro_calendar(get_client(context).session, max_age=MACRO_POST_POLL_SEC)
+    # lần hỏi này có thể thấy lịch đổi (dời giờ/huỷ tin) → đặt lại các job khác
+    _sync_macro_jobs(context.job_queue, cal)
+    e = _find_event(cal, data["event_id"])
+    if e is None or was_macro_sent(f"post:{e['id']}"):
+        context.job.schedule_removal()
+        return
+    if not e.get("actual"):
+        return  # chưa có số liệu → chờ lượt hỏi sau
+
+    btc, eth = await _macro_market(context)
+    bias = _macro_bias(e.get("title") or "", e.get("actual") or "", e.get("forecast") or "", e.get("previous") or "")
+    lines = [
+        f"🛎️ <b>Kết quả vừa công bố:</b> {e['title_vi']}",
+        f"🕒 Giờ VN: {e['time_vn'].strftime('%H:%M %d/%m')}",
+        f"📊 Ảnh hưởng: {e['impact']}",
+    ]
+    trio = []
+    if e.get("actual"):   trio.append(f"Thực tế: {e['actual']}")
+    if e.get("forecast"): trio.append(f"Dự báo: {e['forecast']}")
+    if e.get("previous"): trio.append(f"Trước: {e['previous']}")
+    if trio: lines.append(" — ".join(trio))
+    lines += ["", "📈 Snapshot sau tin:", f"• {_fmt_macro_snap('BTC', btc)}", f"• {_fmt_macro_snap('ETH', eth)}", "", f"🧭 Đánh giá: {bias}", "⚠️ Lưu ý: Nến đầu sau tin thường nhiễu; chờ xác nhận 1–3 nến."]
+    publish(context, "macro", "\n".join(lines), parse_mode="HTML", priority=PRIORITY_HIGH)
+    mark_macro_sent(f"post:{e['id']}")
+    context.job.schedule_removal()
 
 # ========= 22:00 — Tổng kết =========
 async def job_night_summary(context: ContextTypes.DEFAULT_TYPE):
@@ -466,7 +561,13 @@ async def job_night_summary(context: ContextTypes.DEFAULT_TYPE):
         "• Dự báo tối: Giữ kỷ luật, giảm đòn bẩy khi biến động mạnh.\n\n"
         "🌙 Cảm ơn bạn đã đồng hành cùng Cofure hôm nay. 😴 Ngủ ngon nha!"
     )
-    await context.bot.send_message(chat_id=TELEGRAM_ALLOWED_USER_ID, text=text)
+    publish(context, "daily", text)
+
+# ========= Lưu trạng thái chỉ báo =========
+async def job_persist_state(context: ContextTypes.DEFAULT_TYPE):
+    # chụp state trên event loop, ghi file ở thread phụ
+    data = get_client(context).indicator_book.to_dict()
+    await asyncio.to_thread(write_snapshot, INDICATOR_STATE_FILE, data)
 
 # ========= ĐĂNG KÝ JOB =========
 def setup_jobs(app: Application):
@@ -477,15 +578,17 @@ def setup_jobs(app: Application):
         jq.start()
         app.job_queue = jq
 
-    jq.run_daily(job_morning,               time=dt.time(hour=6,  minute=0, tzinfo=VN_TZ), name="morning_0600")
-    jq.run_daily(job_macro,                 time=dt.time(hour=7,  minute=0, tzinfo=VN_TZ), name="macro_0700")
-    jq.run_daily(job_macro_tomorrow_preview,time=dt.time(hour=21, minute=0, tzinfo=VN_TZ), name="macro_tmr_2100")  # ⬅️ xem trước ngày mai
+    jq.run_daily(instrument_job(job_morning),                  time=dt.time(hour=6,  minute=0, tzinfo=VN_TZ), name="morning_0600")
+    jq.run_daily(instrument_job(job_macro),                    time=dt.time(hour=7,  minute=0, tzinfo=VN_TZ), name="macro_0700")
+    jq.run_daily(instrument_job(job_macro_tomorrow_preview),   time=dt.time(hour=21, minute=0, tzinfo=VN_TZ), name="macro_tmr_2100")  # ⬅️ xem trước ngày mai
+
+    jq.run_repeating(instrument_job(job_halfhour_signals),     interval=1800, first=5,  name="signals_30m")
 
-    jq.run_repeating(job_halfhour_signals,  interval=1800, first=5,  name="signals_30m")
+    jq.run_repeating(instrument_job(job_urgent_alerts),        interval=600,  first=15, name="alerts_10m")
 
-    jq.run_repeating(job_urgent_alerts,     interval=600,  first=15, name="alerts_10m")
+    # lịch vĩ mô: xác thực lại (304 rẻ) rồi đặt job đúng giờ cho từng mốc T-30/15/5 và sau tin
+    jq.run_repeating(instrument_job(job_macro_sync),           interval=MACRO_SYNC_SEC, first=20, name="macro_sync")
 
-    jq.run_repeating(job_macro_watch_pre,   interval=300,  first=20, name="macro_pre_5m")
-    jq.run_repeating(job_macro_watch_post,  interval=300,  first=50, name="macro_post_5m")
+    jq.run_repeating(instrument_job(job_persist_state),        interval=600,  first=300, name="persist_10m")
 
-    jq.run_daily(job_night_summary,         time=dt.time(hour=22, minute=0, tzinfo=VN_TZ), name="summary_2200")
+    jq.run_daily(instrument_job(job_night_summary),            time=dt.time(hour=22, minute=0, tzinfo=VN_TZ), name="summary_2200")
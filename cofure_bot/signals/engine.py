@@ -1,8 +1,6 @@
-import aiohttp
-import asyncio
 from datetime import datetime
 import pytz
-from ..data.binance_client import quick_signal_metrics, klines, ema
+from ..data.binance_client import BinanceClient, quick_signal_metrics, book_signal_metrics, timeframe_metrics
 
 VN_TZ = pytz.timezone("Asia/Ho_Chi_Minh")
 
@@ -40,22 +38,23 @@ def _levels(entry, side, pct=0.006):
         sl = entry * (1 + pct)
     return round(tp, 6), round(sl, 6)
 
-async def generate_signal(symbol: str) -> dict:
-    async with aiohttp.ClientSession() as session:
-        # Chỉ số nhanh (RSI, EMA50/200, funding, vol_ratio, last)
-        m = await quick_signal_metrics(session, symbol, interval="5m")
-        # Lấy close để tính EMA9/EMA21 theo yêu cầu hiển thị
-        ks = await klines(session, symbol, interval="5m", limit=200)
-        closes = [float(k[4]) for k in ks]
-        ema9 = ema(closes, 9)
-        ema21 = ema(closes, 21)
+def _apply_timeframes(sig: dict, tf: dict):
+    # Khung lớn cùng chiều → cộng điểm, ngược chiều → trừ mạnh hơn
+    d = 1 if sig["side"] == "LONG" else -1
+    trends = {k: v["trend"] for k, v in tf.items()}
+    aligned = sum(1 for t in trends.values() if t == d)
+    opposed = sum(1 for t in trends.values() if t == -d)
+    sig["timeframes"] = trends
+    sig["tf_aligned"] = aligned
+    sig["strength"] = max(30, min(95, sig["strength"] + 5 * aligned - 8 * opposed))
 
+def signal_from_metrics(symbol: str, m: dict, tf: dict = None) -> dict:
     side = _decide_side(m)
     entry = float(m["last"])
     tp, sl = _levels(entry, side)
     strength = _strength(m, side)
 
-    return {
+    sig = {
         "token": symbol,
         "side": side,
         "entry": round(entry, 6),
@@ -63,14 +62,27 @@ async def generate_signal(symbol: str) -> dict:
         "sl": sl,
         "strength": strength,
         "rsi": round(m["rsi"], 1),
-        "ema9": round(ema9, 3),
-        "ema21": round(ema21, 3),
+        "ema9": round(m["ema9"], 3),
+        "ema21": round(m["ema21"], 3),
         "time": now_vn_str(),
         # mac định; scheduler sẽ set 3 Scalping + 2 Swing & Market/Limit
         "signal_type": "Scalping",
         "order_type": "Market",
     }
+    if tf:
+        _apply_timeframes(sig, tf)
+    return sig
 
-async def generate_batch(symbols: list, count: int = 5):
-    tasks = [generate_signal(s) for s in symbols[:count]]
-    return await asyncio.gather(*tasks)
+async def generate_signal(client: BinanceClient, symbol: str, timeframes=None) -> dict:
+    # Chỉ số nhanh (RSI, EMA9/21/50/200, funding, vol_ratio, last) — 1 lần tải nến
+    m = await quick_signal_metrics(client, symbol, interval="5m")
+    # timeframes (vd. ["15m", "1h", "4h"]): xu hướng từng khung dựng từ nến 5m vừa tải
+    tf = (await timeframe_metrics(client, [symbol], timeframes))[symbol] if timeframes else None
+    return signal_from_metrics(symbol, m, tf)
+
+async def generate_batch(client: BinanceClient, symbols: list, count: int = 5, timeframes=None):
+    # Chỉ báo qua IndicatorBook; symbol lạnh tính vector hoá 1 lượt cho cả nhóm
+    picked = symbols[:count]
+    metrics = await book_signal_metrics(client, picked, interval="5m")
+    tf = await timeframe_metrics(client, [s for s in picked if s in metrics], timeframes) if timeframes else {}
+    return [signal_from_metrics(s, metrics[s], tf.get(s)) for s in picked if s in metrics]
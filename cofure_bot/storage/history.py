@@ -0,0 +1,233 @@
+# cofure_bot/storage/history.py
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cofure_bot.config import HISTORY_DIR
+
+# Bố cục: <root>/<SYMBOL>/<interval>/<cột>.bin và <root>/<SYMBOL>/funding/<cột>.bin
+# Mỗi cột là mảng nhị phân little-endian chỉ ghi nối; cột khoá (open time / funding time)
+# tăng dần nên chính nó là chỉ mục: tìm vị trí bằng searchsorted trên memmap.
+KLINE_COLUMNS: Dict[str, str] = {
+    "open_time": "<i8", "open": "<f8", "high": "<f8", "low": "<f8",
+    "close": "<f8", "volume": "<f8", "quote_volume": "<f8",
+}
+FUNDING_COLUMNS: Dict[str, str] = {"time": "<i8", "rate": "<f8"}
+FUNDING_DIR = "funding"
+SUFFIX = ".bin"
+TMP_SUFFIX = ".tmp"
+# Có file này: mọi <cột>.bin.tmp của lần prepend() đã ghi xong → lần mở sau thay nốt (roll forward)
+PREPEND_MARKER = "prepend.commit"
+
+class ColumnTable:
+    """
+    1 bảng cột cho 1 (symbol, interval): mỗi cột 1 file, đọc qua np.memmap (không copy).
+    Cột khoá ghi sau cùng nên là mốc commit; lần mở sau cắt các cột về cùng số dòng
+    (phòng khi tắt ngang lúc đang ghi). prepend() ghi lại cả file nên đi qua file tạm +
+    PREPEND_MARKER: tắt ngang thì lần mở sau hoặc thay nốt mọi cột, hoặc bỏ hết file tạm.
+    """
+    def __init__(self, path: str, columns: Dict[str, str], key: str):
+        self.path = path
+        self.columns = columns
+        self.key = key
+        self._dtypes = {c: np.dtype(t) for c, t in columns.items()}
+        self._maps: Dict[str, np.ndarray] = {}
+        self._rows: Optional[int] = None
+
+    def _file(self, col: str) -> str:
+        return os.path.join(self.path, col + SUFFIX)
+
+    def exists(self) -> bool:
+        return os.path.exists(self._file(self.key))
+
+    def _size(self, col: str) -> int:
+        try:
+            return os.path.getsize(self._file(col)) // self._dtypes[col].itemsize
+        except OSError:
+            return 0
+
+    def _finish_prepend(self):
+        """Hoàn tất / huỷ 1 lần prepend() bị đứt giữa chừng."""
+        marker = os.path.join(self.path, PREPEND_MARKER)
+        committed = os.path.exists(marker)
+        for c in self.columns:
+            tmp = self._file(c) + TMP_SUFFIX
+            if os.path.exists(tmp):
+                if committed:
+                    os.replace(tmp, self._file(c))
+                else:
+                    os.remove(tmp)
+        if committed:
+            os.remove(marker)
+
+    def _repair(self) -> int:
+        self._finish_prepend()
+        n = min(self._size(c) for c in self.columns)
+        for c, dt in self._dtypes.items():
+            f = self._file(c)
+            if os.path.exists(f) and os.path.getsize(f) != n * dt.itemsize:
+                os.truncate(f, n * dt.itemsize)
+        return n
+
+    def __len__(self) -> int:
+        if self._rows is None:
+            self._rows = self._repair()
+        return self._rows
+
+    def refresh(self):
+        """File bị process khác ghi thêm → đọc lại độ dài (các view cũ vẫn hợp lệ)."""
+        self._rows = None
+        self._maps.clear()
+
+    def column(self, col: str) -> np.ndarray:
+        n = len(self)
+        m = self._maps.get(col)
+        if m is None or len(m) != n:
+            m = (np.memmap(self._file(col), dtype=self._dtypes[col], mode="r", shape=(n,))
+                 if n else np.empty(0, dtype=self._dtypes[col]))
+            self._maps[col] = m
+        return m
+
+    def first_key(self) -> Optional[int]:
+        return int(self.column(self.key)[0]) if len(self) else None
+
+    def last_key(self) -> Optional[int]:
+        return int(self.column(self.key)[-1]) if len(self) else None
+
+    def bounds(self, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[int, int]:
+        """Chỉ số [i, j) của các dòng có khoá trong [start, end)."""
+        k = self.column(self.key)
+        i = 0 if start is None else int(np.searchsorted(k, start, side="left"))
+        j = len(k) if end is None else int(np.searchsorted(k, end, side="left"))
+        return i, max(i, j)
+
+    def range(self, start: Optional[int] = None, end: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Các cột trong [start, end) dạng view chỉ đọc trên memmap."""
+        i, j = self.bounds(start, end)
+        return {c: self.column(c)[i:j] for c in self.columns}
+
+    def tail(self, n: int) -> Dict[str, np.ndarray]:
+        total = len(self)
+        return {c: self.column(c)[max(0, total - n):] for c in self.columns}
+
+    def append(self, data: Dict[str, np.ndarray]) -> int:
+        """Nối các dòng có khoá > khoá cuối (giữ thứ tự tăng dần); trả về số dòng đã ghi."""
+        keys = np.asarray(data[self.key], dtype=self._dtypes[self.key])
+        last = self.last_key()
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = keys[1:] > keys[:-1]
+        if last is not None:
+            keep &= keys > last
+        n = int(keep.sum())
+        if not n:
+            return 0
+        os.makedirs(self.path, exist_ok=True)
+        # cột khoá ghi cuối: đứt giữa chừng thì _repair() cắt phần thừa ở các cột khác
+        for c in sorted(self.columns, key=lambda c: c == self.key):
+            arr = np.asarray(data[c], dtype=self._dtypes[c])[keep]
+            with open(self._file(c), "ab") as f:
+                f.write(arr.tobytes())
+        self._rows = len(self) + n
+        return n
+
+    def prepend(self, data: Dict[str, np.ndarray]) -> int:
+        """Thêm các dòng cũ hơn khoá đầu: ghi lại toàn bộ file qua file tạm (hiếm khi dùng)."""
+        first = self.first_key()
+        keys = np.asarray(data[self.key], dtype=self._dtypes[self.key])
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = keys[1:] > keys[:-1]
+        if first is not None:
+            keep &= keys < first
+        n = int(keep.sum())
+        if not n:
+            return 0
+        os.makedirs(self.path, exist_ok=True)
+        old = {c: np.array(self.column(c)) for c in self.columns}
+        self._maps.clear()
+        # 1) ghi đủ mọi file tạm, 2) đánh dấu commit, 3) thay từng cột (khoá cuối), 4) bỏ dấu.
+        # Đứt trước 2) → file cũ còn nguyên; sau 2) → _repair() thay nốt các cột còn lại.
+        for c in self.columns:
+            arr = np.concatenate([np.asarray(data[c], dtype=self._dtypes[c])[keep], old[c]])
+            with open(self._file(c) + TMP_SUFFIX, "wb") as f:
+                f.write(arr.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        marker = os.path.join(self.path, PREPEND_MARKER)
+        with open(marker, "wb") as f:
+            os.fsync(f.fileno())
+        for c in sorted(self.columns, key=lambda c: c == self.key):
+            os.replace(self._file(c) + TMP_SUFFIX, self._file(c))
+        os.remove(marker)
+        self._rows = n + len(old[self.key])
+        return n
+
+class HistoryStore:
+    """Kho lịch sử nến + funding dạng cột trên đĩa, dùng chung cho cache nến, backtest, phân tích."""
+    def __init__(self, root: str = HISTORY_DIR):
+        self.root = root
+        self._tables: Dict[Tuple[str, str], ColumnTable] = {}
+
+    def klines(self, symbol: str, interval: str) -> ColumnTable:
+        key = (symbol, interval)
+        t = self._tables.get(key)
+        if t is None:
+            t = self._tables[key] = ColumnTable(os.path.join(self.root, symbol, interval),
+                                                KLINE_COLUMNS, "open_time")
+        return t
+
+    def funding(self, symbol: str) -> ColumnTable:
+        key = (symbol, FUNDING_DIR)
+        t = self._tables.get(key)
+        if t is None:
+            t = self._tables[key] = ColumnTable(os.path.join(self.root, symbol, FUNDING_DIR),
+                                                FUNDING_COLUMNS, "time")
+        return t
+
+    def symbols(self, interval: str) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(s for s in os.listdir(self.root) if self.klines(s, interval).exists())
+
+    # --- Chuyển đổi với nến thô của Binance ---
+    def append_klines(self, symbol: str, interval: str, rows: List[list]) -> int:
+        """Ghi nến đã đóng (thứ tự cột như /fapi/v1/klines)."""
+        if not rows:
+            return 0
+        return self.klines(symbol, interval).append(klines_to_columns(rows))
+
+    def prepend_klines(self, symbol: str, interval: str, rows: List[list]) -> int:
+        """Ghi nến cũ hơn nến đầu trên đĩa (tải bù lùi về quá khứ)."""
+        if not rows:
+            return 0
+        return self.klines(symbol, interval).prepend(klines_to_columns(rows))
+
+    def kline_rows(self, symbol: str, interval: str, n: int, step_ms: int) -> List[list]:
+        """n nến cuối dạng list như /fapi/v1/klines (8 cột đầu) để nạp vào KlineCache."""
+        t = self.klines(symbol, interval)
+        if not len(t):
+            return []
+        cols = t.tail(n)
+        ot = cols["open_time"].tolist()
+        close_time = [x + step_ms - 1 for x in ot]
+        return [list(r) for r in zip(ot, cols["open"].tolist(), cols["high"].tolist(), cols["low"].tolist(),
+                                     cols["close"].tolist(), cols["volume"].tolist(), close_time,
+                                     cols["quote_volume"].tolist())]
+
+    def append_funding(self, symbol: str, rows: List[dict]) -> int:
+        """Ghi funding đã chốt (dạng JSON của /fapi/v1/fundingRate)."""
+        if not rows:
+            return 0
+        data = {
+            "time": np.array([int(r["fundingTime"]) for r in rows], dtype=np.int64),
+            "rate": np.array([float(r["fundingRate"]) for r in rows], dtype=np.float64),
+        }
+        return self.funding(symbol).append(data)
+
+def klines_to_columns(rows: List[list]) -> Dict[str, np.ndarray]:
+    a = np.array([r[:8] for r in rows], dtype=np.float64)
+    return {
+        "open_time": np.array([int(r[0]) for r in rows], dtype=np.int64),
+        "open": a[:, 1], "high": a[:, 2], "low": a[:, 3], "close": a[:, 4],
+        "volume": a[:, 5], "quote_volume": a[:, 7],
+    }
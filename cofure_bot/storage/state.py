@@ -1,57 +1,222 @@
 # cofure_bot/storage/state.py
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
 from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 import pytz
-from cofure_bot.config import TZ_NAME
+from cofure_bot.config import TZ_NAME, STATE_DB_FILE, TELEGRAM_ALLOWED_USER_ID
 
 VN_TZ = pytz.timezone(TZ_NAME)
 
-_state = {
-    "signals_sent": 0,
-    "alerts_sent": 0,
-    "last_alert_symbol_at": {},   # {symbol: datetime}
-    "last_alert_hour_count": {},  # {"YYYYmmddHH": int}
-    "last_sticky_message_id": None,  # int|None (cho private chat)
-}
+logger = logging.getLogger(__name__)
 
-# ===== Counters =====
+FLUSH_INTERVAL_SEC = 2.0
+# Thời gian sống của từng loại khoá (bộ nhớ phẳng dù chạy nhiều tháng)
+COUNTER_TTL_SEC      = 2 * 86400     # bộ đếm theo ngày
+ALERT_SYMBOL_TTL_SEC = 86400         # cooldown theo symbol
+ALERT_HOUR_TTL_SEC   = 2 * 3600      # giới hạn cảnh báo theo giờ
+MACRO_SENT_TTL_SEC   = 8 * 86400     # sự kiện vĩ mô đã báo (lịch chỉ có 1 tuần)
+
+class StateStore:
+    """
+    Key/value có TTL: đọc/ghi trong bộ nhớ (không chặn event loop), ghi xuống SQLite
+    (WAL) theo lô ở thread phụ (write-behind). Khởi động lại → nạp các khoá còn hạn.
+    Chưa open() → chỉ chạy trong bộ nhớ.
+    """
+    def __init__(self, path: str = STATE_DB_FILE, flush_interval: float = FLUSH_INTERVAL_SEC):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._mem: Dict[str, Tuple[Any, Optional[float]]] = {}   # key → (value, expires_at | None)
+        self._dirty: set = set()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+
+    # --- Vòng đời ---
+    def open(self):
+        """Mở DB và nạp các khoá còn hạn (gọi 1 lần lúc khởi động)."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+        now = time.time()
+        conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        for key, value, exp in conn.execute("SELECT key, value, expires_at FROM kv"):
+            try:
+                self._mem.setdefault(key, (json.loads(value), exp))
+            except ValueError:
+                continue
+        self._conn = conn
+        return self
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="state_flush")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.evict_expired()
+                await self.flush()
+            except Exception as e:
+                logger.warning("State flush failed: %s", e)
+
+    # --- Truy cập (đồng bộ, chỉ chạm bộ nhớ) ---
+    def get(self, key: str, default: Any = None) -> Any:
+        item = self._mem.get(key)
+        if item is None:
+            return default
+        value, exp = item
+        if exp is not None and exp <= time.time():
+            self._mem.pop(key, None)
+            self._dirty.add(key)
+            return default
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._mem[key] = (value, time.time() + ttl if ttl else None)
+        self._dirty.add(key)
+
+    def incr(self, key: str, n: int = 1, ttl: Optional[float] = None) -> int:
+        value = int(self.get(key, 0)) + n
+        self.set(key, value, ttl)
+        return value
+
+    def delete(self, key: str):
+        self._mem.pop(key, None)
+        self._dirty.add(key)
+
+    def keys(self, prefix: str = "") -> List[str]:
+        now = time.time()
+        return [k for k, (_, exp) in self._mem.items()
+                if k.startswith(prefix) and (exp is None or exp > now)]
+
+    def evict_expired(self) -> int:
+        now = time.time()
+        dead = [k for k, (_, exp) in self._mem.items() if exp is not None and exp <= now]
+        for k in dead:
+            self._mem.pop(k, None)
+            self._dirty.add(k)
+        return len(dead)
+
+    def __len__(self) -> int:
+        return len(self._mem)
+
+    # --- Ghi xuống đĩa ---
+    def _take_batch(self) -> Tuple[List[tuple], List[tuple]]:
+        upserts, deletes = [], []
+        for k in self._dirty:
+            item = self._mem.get(k)
+            if item is None:
+                deletes.append((k,))
+            else:
+                upserts.append((k, json.dumps(item[0], separators=(",", ":")), item[1]))
+        self._dirty.clear()
+        return upserts, deletes
+
+    def _write(self, upserts: List[tuple], deletes: List[tuple]):
+        conn = self._conn
+        with conn:
+            conn.execute("BEGIN")
+            if upserts:
+                conn.executemany(
+                    "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value=excluded.value, expires_at=excluded.expires_at",
+                    upserts)
+            if deletes:
+                conn.executemany("DELETE FROM kv WHERE key = ?", deletes)
+            conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    async def flush(self):
+        """Ghi các khoá đổi từ lần trước trong 1 transaction (thread phụ)."""
+        if self._conn is None or not self._dirty:
+            return
+        async with self._flush_lock:
+            upserts, deletes = self._take_batch()
+            if not upserts and not deletes:
+                return
+            try:
+                await asyncio.to_thread(self._write, upserts, deletes)
+            except Exception:
+                # đánh dấu lại để lần sau ghi tiếp (giá trị lấy từ bộ nhớ lúc đó)
+                self._dirty.update(k for k, *_ in upserts)
+                self._dirty.update(k for (k,) in deletes)
+                raise
+            self.flushes += 1
+
+STORE = StateStore()
+
+def _day_key() -> str:
+    return datetime.now(VN_TZ).strftime("%Y%m%d")
+
+# ===== Counters (theo ngày giờ VN) =====
 def bump_signals(n: int = 1):
-    _state["signals_sent"] += n
+    STORE.incr(f"signals_sent:{_day_key()}", n, ttl=COUNTER_TTL_SEC)
 
 def bump_alerts(n: int = 1):
-    _state["alerts_sent"] += n
+    STORE.incr(f"alerts_sent:{_day_key()}", n, ttl=COUNTER_TTL_SEC)
 
 def snapshot():
+    day = _day_key()
     return {
-        "signals_sent": _state["signals_sent"],
-        "alerts_sent": _state["alerts_sent"],
+        "signals_sent": STORE.get(f"signals_sent:{day}", 0),
+        "alerts_sent": STORE.get(f"alerts_sent:{day}", 0),
     }
 
 # ===== Cooldown per symbol =====
 def can_alert_symbol(symbol: str, cooldown_minutes: int) -> bool:
-    last = _state["last_alert_symbol_at"].get(symbol)
+    last = STORE.get(f"alert_symbol:{symbol}")
     if not last:
         return True
-    now = datetime.now(VN_TZ)
-    return (now - last).total_seconds() >= cooldown_minutes * 60
+    return time.time() - last >= cooldown_minutes * 60
 
 def mark_alert_symbol(symbol: str):
-    _state["last_alert_symbol_at"][symbol] = datetime.now(VN_TZ)
+    STORE.set(f"alert_symbol:{symbol}", time.time(), ttl=ALERT_SYMBOL_TTL_SEC)
 
 # ===== Hourly cap =====
 def _hour_key() -> str:
     return datetime.now(VN_TZ).strftime("%Y%m%d%H")
 
 def can_alert_this_hour(max_per_hour: int) -> bool:
-    key = _hour_key()
-    return _state["last_alert_hour_count"].get(key, 0) < max_per_hour
+    return STORE.get(f"alert_hour:{_hour_key()}", 0) < max_per_hour
 
 def bump_alert_hour():
-    key = _hour_key()
-    _state["last_alert_hour_count"][key] = _state["last_alert_hour_count"].get(key, 0) + 1
+    STORE.incr(f"alert_hour:{_hour_key()}", 1, ttl=ALERT_HOUR_TTL_SEC)
+
+# ===== Sticky message (theo chat) =====
+def get_sticky_message_id(chat_id: Optional[int] = None):
+    legacy = STORE.get("last_sticky_message_id")
+    if chat_id is None:
+        return legacy
+    # khoá cũ (trước khi có nhiều chat) thuộc về chat của chủ bot
+    return STORE.get(f"sticky:{chat_id}", legacy if chat_id == TELEGRAM_ALLOWED_USER_ID else None)
+
+def set_sticky_message_id(mid: int, chat_id: Optional[int] = None):
+    STORE.set("last_sticky_message_id" if chat_id is None else f"sticky:{chat_id}", mid)
 
-# ===== Sticky message (private chat) =====
-def get_sticky_message_id():
-    return _state["last_sticky_message_id"]
+# ===== Sự kiện vĩ mô đã báo =====
+def was_macro_sent(key: str) -> bool:
+    return STORE.get(f"macro_sent:{key}") is not None
 
-def set_sticky_message_id(mid: int):
-    _state["last_sticky_message_id"] = mid
+def mark_macro_sent(key: str):
+    STORE.set(f"macro_sent:{key}", 1, ttl=MACRO_SENT_TTL_SEC)
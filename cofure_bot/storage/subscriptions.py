@@ -0,0 +1,145 @@
+# cofure_bot/storage/subscriptions.py
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import pytz
+
+from cofure_bot.config import TELEGRAM_ALLOWED_USER_ID, TZ_NAME
+from cofure_bot.storage.state import STORE, StateStore
+
+VN_TZ = pytz.timezone(TZ_NAME)
+
+SUB_PREFIX = "sub:"
+# Loại tin có thể đăng ký
+KINDS = ("scalping", "swing", "urgent", "macro", "daily")
+
+def _in_quiet(quiet: Optional[Tuple[int, int]], hour: int) -> bool:
+    if not quiet:
+        return False
+    start, end = quiet
+    if start == end:
+        return False
+    return start <= hour < end if start < end else (hour >= start or hour < end)
+
+class Subscription:
+    """
+    Bộ lọc của 1 chat: độ mạnh tối thiểu, danh sách coin (None = tất cả),
+    loại tin nhận, giờ im lặng (giờ VN, [start, end), có thể qua nửa đêm).
+    """
+    __slots__ = ("chat_id", "min_strength", "symbols", "types", "quiet")
+
+    def __init__(self, chat_id: int, min_strength: int = 0, symbols: Optional[Iterable[str]] = None,
+                 types: Iterable[str] = KINDS, quiet: Optional[Tuple[int, int]] = None):
+        self.chat_id = int(chat_id)
+        self.min_strength = int(min_strength)
+        self.symbols: Optional[FrozenSet[str]] = frozenset(s.upper() for s in symbols) if symbols else None
+        self.types: FrozenSet[str] = frozenset(t for t in types if t in KINDS)
+        self.quiet = (int(quiet[0]) % 24, int(quiet[1]) % 24) if quiet else None
+
+    def accepts(self, kind: str, symbol: Optional[str] = None, strength: Optional[float] = None,
+                hour: Optional[int] = None) -> bool:
+        if kind not in self.types:
+            return False
+        if symbol is not None and self.symbols is not None and symbol not in self.symbols:
+            return False
+        if strength is not None and strength < self.min_strength:
+            return False
+        return hour is None or not _in_quiet(self.quiet, hour)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "chat_id": self.chat_id,
+            "min_strength": self.min_strength,
+            "symbols": sorted(self.symbols) if self.symbols is not None else None,
+            "types": sorted(self.types),
+            "quiet": list(self.quiet) if self.quiet else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Subscription":
+        return cls(d["chat_id"], d.get("min_strength", 0), d.get("symbols"),
+                   d.get("types", KINDS), d.get("quiet"))
+
+class SubscriptionRegistry:
+    """
+    Danh sách chat nhận tin, lưu trong StateStore (1 khoá/chat, không hết hạn).
+    Chỉ mục theo loại tin → theo coin: mỗi lượt quét chỉ duyệt các chat có thể khớp,
+    chi phí theo số tin gửi chứ không theo tổng số người đăng ký.
+    Chủ bot (TELEGRAM_ALLOWED_USER_ID) luôn có đăng ký mặc định (nhận mọi tin) khi chưa tự chỉnh.
+    """
+    def __init__(self, store: StateStore = STORE, owner_id: int = TELEGRAM_ALLOWED_USER_ID):
+        self.store = store
+        self.owner_id = owner_id
+        self._subs: Dict[int, Subscription] = {}
+        # loại tin → (chat nhận mọi coin, {coin: chat})
+        self._index: Dict[str, Tuple[List[Subscription], Dict[str, List[Subscription]]]] = {}
+        self._reindex()
+
+    def load(self) -> "SubscriptionRegistry":
+        """Nạp đăng ký từ StateStore (gọi sau STORE.open())."""
+        self._subs = {}
+        for key in self.store.keys(SUB_PREFIX):
+            d = self.store.get(key)
+            if not d:
+                continue
+            try:
+                sub = Subscription.from_dict(d)
+            except (KeyError, TypeError, ValueError):
+                continue
+            self._subs[sub.chat_id] = sub
+        self._reindex()
+        return self
+
+    def _all(self) -> List[Subscription]:
+        subs = dict(self._subs)
+        if self.owner_id and self.owner_id not in subs:
+            subs[self.owner_id] = Subscription(self.owner_id)
+        return list(subs.values())
+
+    def _reindex(self):
+        index = {k: ([], {}) for k in KINDS}
+        for sub in self._all():
+            for kind in sub.types:
+                every, by_symbol = index[kind]
+                if sub.symbols is None:
+                    every.append(sub)
+                else:
+                    for s in sub.symbols:
+                        by_symbol.setdefault(s, []).append(sub)
+        self._index = index
+
+    def get(self, chat_id: int) -> Optional[Subscription]:
+        sub = self._subs.get(chat_id)
+        if sub is None and chat_id == self.owner_id and self.owner_id:
+            return Subscription(chat_id)
+        return sub
+
+    def upsert(self, sub: Subscription):
+        self._subs[sub.chat_id] = sub
+        self.store.set(f"{SUB_PREFIX}{sub.chat_id}", sub.to_dict())
+        self._reindex()
+
+    def remove(self, chat_id: int):
+        if chat_id == self.owner_id:
+            # giữ 1 đăng ký rỗng → không quay lại mặc định
+            self.upsert(Subscription(chat_id, types=()))
+            return
+        self._subs.pop(chat_id, None)
+        self.store.delete(f"{SUB_PREFIX}{chat_id}")
+        self._reindex()
+
+    def match(self, kind: str, symbol: Optional[str] = None, strength: Optional[float] = None,
+              now: Optional[datetime] = None) -> List[int]:
+        """Chat nhận 1 tin loại `kind` (coin/độ mạnh nếu có), bỏ chat đang trong giờ im lặng."""
+        every, by_symbol = self._index.get(kind, ((), {}))
+        if symbol is None:
+            pool = every + [s for subs in by_symbol.values() for s in subs]
+        else:
+            pool = every + by_symbol.get(symbol, [])
+        hour = (now or datetime.now(VN_TZ)).hour
+        return list(dict.fromkeys(s.chat_id for s in pool if s.accepts(kind, None, strength, hour)))
+
+    def __len__(self) -> int:
+        return len(self._all())
+
+SUBSCRIPTIONS = SubscriptionRegistry()
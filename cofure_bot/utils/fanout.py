@@ -0,0 +1,19 @@
+# cofure_bot/utils/fanout.py
+import asyncio
+from typing import Dict, Optional
+
+from cofure_bot.storage.subscriptions import SUBSCRIPTIONS
+from cofure_bot.utils.metrics import FANOUT_RECIPIENTS
+from cofure_bot.utils.outbox import get_outbox
+
+def publish(context, kind: str, text: str, *, symbol: Optional[str] = None,
+            strength: Optional[float] = None, **send_kwargs) -> Dict[int, asyncio.Future]:
+    """
+    Gửi 1 tin đã dựng sẵn tới mọi chat đăng ký khớp (loại tin, coin, độ mạnh, giờ im lặng).
+    Nội dung tính 1 lần; outbox gửi song song giữa các chat, giới hạn tốc độ theo từng chat.
+    Trả về {chat_id: Future} (chỉ await khi cần message_id, vd. để ghim).
+    """
+    outbox = get_outbox(context)
+    chats = SUBSCRIPTIONS.match(kind, symbol=symbol, strength=strength)
+    FANOUT_RECIPIENTS.observe(len(chats), kind=kind)
+    return {chat_id: outbox.send(chat_id, text, **send_kwargs) for chat_id in chats}
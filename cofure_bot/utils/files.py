@@ -0,0 +1,12 @@
+# cofure_bot/utils/files.py
+import json
+import os
+from typing import Any
+
+def write_snapshot(path: str, data: Any):
+    """Ghi JSON nguyên tử (file tạm + os.replace); gọi được từ thread phụ."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
@@ -0,0 +1,171 @@
+# cofure_bot/utils/loop_watchdog.py
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from cofure_bot.utils.metrics import LOOP_LAG, LOOP_LAG_QUANTILES, LOOP_SLOW_CALLBACKS
+
+logger = logging.getLogger(__name__)
+
+WATCHDOG_KEY      = "loop_watchdog"
+TICK_SEC          = 0.25      # nhịp đo độ trễ
+WINDOW_SEC        = 60.0      # cửa sổ tính phân vị / trạng thái degraded
+SLOW_EVENTS_KEPT  = 50
+STACK_DEPTH       = 12
+QUANTILES         = (0.5, 0.9, 0.99)
+
+_PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SKIP_FILES = {os.path.abspath(__file__), os.path.join(_PKG_DIR, "utils", "metrics.py")}
+
+def _quantile(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+def _short(f) -> str:
+    code = f.f_code
+    rel = os.path.relpath(code.co_filename, os.path.dirname(_PKG_DIR)) \
+        if code.co_filename.startswith(_PKG_DIR) else os.path.basename(code.co_filename)
+    return f"{rel}:{f.f_lineno} {code.co_name}"
+
+def attribute(frame) -> Dict[str, Any]:
+    """
+    Từ stack của thread event loop: entry = hàm ngoài cùng của bot trong callback đang chạy
+    (job/handler), where = hàm trong cùng của bot (chỗ đang chặn), stack = các frame trong callback.
+    """
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    # chỉ giữ phần sau Handle._run (ranh giới callback của asyncio)
+    start = 0
+    for i, f in enumerate(frames):
+        if f.f_code.co_name == "_run" and f.f_code.co_filename.endswith(os.path.join("asyncio", "events.py")):
+            start = i + 1
+    frames = frames[start:]
+    own = [f for f in frames if f.f_code.co_filename.startswith(_PKG_DIR) and f.f_code.co_filename not in _SKIP_FILES]
+    entry = own[0] if own else None
+    return {
+        "entry": f"{os.path.splitext(os.path.basename(entry.f_code.co_filename))[0]}.{entry.f_code.co_name}"
+                 if entry else "-",
+        "where": _short(own[-1]) if own else (_short(frames[-1]) if frames else "-"),
+        "stack": [_short(f) for f in frames[-STACK_DEPTH:]],
+    }
+
+class LoopWatchdog:
+    """
+    Đo độ trễ event loop liên tục: 1 task ngủ TICK_SEC và đo mức trễ khi thức dậy.
+    1 thread phụ theo dõi nhịp đó; khi loop bị chặn quá slow_sec thì chụp stack của thread
+    loop ngay lúc đang chặn → biết job/lệnh nào và dòng code nào gây trễ.
+    """
+    def __init__(self, slow_sec: float = 0.1, degraded_sec: float = 0.2,
+                 tick_sec: float = TICK_SEC, window_sec: float = WINDOW_SEC):
+        self.slow_sec = slow_sec
+        self.degraded_sec = degraded_sec
+        self.tick_sec = tick_sec
+        self._lags: deque = deque(maxlen=max(1, int(window_sec / tick_sec)))
+        self.slow: deque = deque(maxlen=SLOW_EVENTS_KEPT)
+        self.slow_total = 0
+        self._beat = 0.0
+        self._captured: Optional[Dict[str, Any]] = None
+        self._captured_beat = -1.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+
+    async def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run(), name="loop_watchdog")
+        self._thread = threading.Thread(target=self._watch, name="loop_watchdog", daemon=True)
+        self._thread.start()
+        LOOP_LAG_QUANTILES.fn = lambda: {(str(q),): v for q, v in self.quantiles().items()}
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    # --- Trên event loop ---
+    async def _run(self):
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.tick_sec)
+            now = time.perf_counter()
+            lag = max(0.0, now - t0 - self.tick_sec)
+            self._beat = now
+            self._lags.append(lag)
+            LOOP_LAG.observe(lag)
+            with self._lock:
+                captured, self._captured = self._captured, None
+            if captured is not None:
+                self._record(captured, lag)
+
+    def _record(self, ev: Dict[str, Any], lag: float):
+        ev["lag_ms"] = round(lag * 1000, 1)
+        self.slow.append(ev)
+        self.slow_total += 1
+        LOOP_SLOW_CALLBACKS.inc(entry=ev["entry"])
+        logger.warning("Event loop blocked %.0fms in %s (task %s) at %s",
+                       lag * 1000, ev["entry"], ev["task"], ev["where"])
+
+    # --- Thread phụ ---
+    def _watch(self):
+        while not self._stop.wait(self.slow_sec / 2):
+            beat = self._beat
+            overdue = time.perf_counter() - beat - self.tick_sec
+            if overdue < self.slow_sec or self._captured_beat == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            # đọc không khoá từ thread khác: chỉ để gắn nhãn
+            task = asyncio.tasks._current_tasks.get(self._loop)
+            ev = attribute(frame)
+            ev["task"] = task.get_name() if task is not None else "-"
+            ev["at"] = time.time()
+            with self._lock:
+                self._captured = ev
+                self._captured_beat = beat
+
+    # --- Đọc trạng thái ---
+    def quantiles(self) -> Dict[float, float]:
+        vals = sorted(self._lags)
+        return {q: _quantile(vals, q) for q in QUANTILES}
+
+    @property
+    def degraded(self) -> bool:
+        """Trễ kéo dài: trung vị trong cửa sổ vượt ngưỡng (1 lần chặn đơn lẻ không tính)."""
+        return len(self._lags) >= 4 and _quantile(sorted(self._lags), 0.5) > self.degraded_sec
+
+    def stats(self, recent: int = 5) -> Dict[str, Any]:
+        vals = sorted(self._lags)
+        return {
+            "degraded": self.degraded,
+            "lag_ms": {f"p{int(q * 100)}": round(_quantile(vals, q) * 1000, 1) for q in QUANTILES}
+                      | {"max": round((vals[-1] if vals else 0.0) * 1000, 1)},
+            "slow_callbacks": self.slow_total,
+            "recent_slow": [{k: ev[k] for k in ("at", "lag_ms", "entry", "task", "where")}
+                            for ev in list(self.slow)[-recent:]],
+        }
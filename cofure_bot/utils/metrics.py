@@ -0,0 +1,222 @@
+# cofure_bot/utils/metrics.py
+import functools
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Metric kiểu Prometheus (text format 0.0.4) tự viết, không thêm dependency.
+# Mọi cập nhật diễn ra trên event loop; render() gọi từ handler /metrics.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS    = (5, 10, 20, 40, 60, 100, 200, 300, 500)
+FANOUT_BUCKETS  = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+LAG_BUCKETS     = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 fn: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # fn (tuỳ chọn) trả về {label values: giá trị} đọc lúc render, vd. độ sâu hàng đợi
+        self.fn = fn
+        self._values: Dict[LabelValues, float] = {}
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[str]:
+        values = dict(self._values)
+        if self.fn is not None:
+            try:
+                values.update(self.fn())
+            except Exception:
+                pass
+        for k, v in sorted(values.items()):
+            yield f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, n: float = 1.0, **labels):
+        k = self._key(labels)
+        self._values[k] = self._values.get(k, 0.0) + n
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, v: float, **labels):
+        self._values[self._key(labels)] = float(v)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}   # [count theo bucket..., +Inf, sum]
+
+    def observe(self, v: float, **labels):
+        k = self._key(labels)
+        s = self._series.get(k)
+        if s is None:
+            s = self._series[k] = [0.0] * (len(self.buckets) + 2)
+        s[bisect_left(self.buckets, v)] += 1
+        s[-1] += v
+
+    def count(self, **labels) -> int:
+        s = self._series.get(self._key(labels))
+        return int(sum(s[:-1])) if s else 0
+
+    def samples(self):
+        for k, s in sorted(self._series.items()):
+            acc = 0.0
+            for le, n in zip(self.buckets + (float("inf"),), s[:-1]):
+                acc += n
+                le_label = 'le="%s"' % _fmt_value(le)
+                yield f"{self.name}_bucket{_fmt_labels(self.labels, k, le_label)} {_fmt_value(acc)}"
+            yield f"{self.name}_sum{_fmt_labels(self.labels, k)} {_fmt_value(s[-1])}"
+            yield f"{self.name}_count{_fmt_labels(self.labels, k)} {_fmt_value(acc)}"
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _add(self, m: _Metric):
+        if m.name in self._metrics:
+            raise ValueError(f"duplicate metric {m.name}")
+        self._metrics[m.name] = m
+        return m
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = (), fn=None) -> Counter:
+        return self._add(Counter(name, help, labels, fn))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (), fn=None) -> Gauge:
+        return self._add(Gauge(name, help, labels, fn))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics.values():
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# ===== Metric dùng chung =====
+JOB_SECONDS = REGISTRY.histogram("cofure_job_duration_seconds", "Thời gian chạy mỗi job", ("job",))
+JOB_ERRORS = REGISTRY.counter("cofure_job_errors_total", "Số lần job lỗi", ("job",))
+HANDLER_SECONDS = REGISTRY.histogram("cofure_handler_duration_seconds", "Thời gian xử lý mỗi lệnh", ("command",))
+HANDLER_ERRORS = REGISTRY.counter("cofure_handler_errors_total", "Số lần lệnh lỗi", ("command",))
+
+BINANCE_REQUESTS = REGISTRY.counter("cofure_binance_requests_total", "Request REST tới Binance theo endpoint và mã HTTP",
+                                    ("endpoint", "status"))
+BINANCE_ERRORS = REGISTRY.counter("cofure_binance_errors_total", "Lỗi request Binance (429/418, 4xx, 5xx, mạng)",
+                                  ("endpoint", "kind"))
+BINANCE_WEIGHT = REGISTRY.counter("cofure_binance_weight_total", "Weight đã dùng theo endpoint", ("endpoint",))
+BINANCE_SECONDS = REGISTRY.histogram("cofure_binance_request_seconds", "Độ trễ request Binance", ("endpoint",))
+
+CACHE_LOOKUPS = REGISTRY.counter("cofure_cache_lookups_total",
+                                 "Lượt đọc cache: hit (không gọi mạng), partial (chỉ tải phần mới), miss",
+                                 ("cache", "result"))
+
+def _cache_ratios() -> Dict[LabelValues, float]:
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), n in CACHE_LOOKUPS._values.items():
+        t = totals.setdefault(cache, [0.0, 0.0])
+        t[1] += n
+        if result == "hit":
+            t[0] += n
+    return {(c,): h / n for c, (h, n) in totals.items() if n}
+
+CACHE_HIT_RATIO = REGISTRY.gauge("cofure_cache_hit_ratio", "Tỷ lệ hit tích luỹ từ lúc khởi động", ("cache",),
+                                 fn=_cache_ratios)
+
+TELEGRAM_SEND_SECONDS = REGISTRY.histogram("cofure_telegram_send_seconds", "Độ trễ gọi sendMessage")
+TELEGRAM_MESSAGES = REGISTRY.counter("cofure_telegram_messages_total", "Tin Telegram theo kết quả (sent/failed)",
+                                     ("result",))
+TELEGRAM_RETRY_AFTER = REGISTRY.counter("cofure_telegram_retry_after_total", "Số lần Telegram trả 429 (RetryAfter)")
+TELEGRAM_QUEUE_WAIT = REGISTRY.histogram("cofure_telegram_queue_wait_seconds", "Thời gian tin chờ trong outbox")
+FANOUT_RECIPIENTS = REGISTRY.histogram("cofure_fanout_recipients", "Số chat nhận mỗi tin phát (theo loại tin)",
+                                       ("kind",), buckets=FANOUT_BUCKETS)
+
+SCAN_SYMBOLS = REGISTRY.histogram("cofure_scan_symbols", "Số symbol được tính chỉ số mỗi lượt quét",
+                                  buckets=SIZE_BUCKETS)
+SCAN_SECONDS = REGISTRY.histogram("cofure_scan_duration_seconds", "Thời gian dựng snapshot thị trường")
+SCAN_UNIVERSE = REGISTRY.gauge("cofure_scan_universe_symbols", "Kích thước universe/candidates của snapshot gần nhất",
+                               ("set",))
+
+LOOP_LAG = REGISTRY.histogram("cofure_loop_lag_seconds", "Độ trễ event loop (timer thức dậy muộn bao lâu)",
+                              buckets=LAG_BUCKETS)
+LOOP_SLOW_CALLBACKS = REGISTRY.counter("cofure_loop_slow_callbacks_total",
+                                       "Số lần loop bị chặn quá ngưỡng, theo job/lệnh đang chạy", ("entry",))
+
+# Đọc từ đối tượng đang chạy lúc render; main() gán fn khi tạo đối tượng
+BINANCE_USED_WEIGHT = REGISTRY.gauge("cofure_binance_used_weight_1m", "Weight đã dùng trong phút hiện tại (theo header)")
+OUTBOX_DEPTH = REGISTRY.gauge("cofure_outbox_depth", "Số tin đang chờ gửi trong outbox")
+WEBHOOK_QUEUE_DEPTH = REGISTRY.gauge("cofure_webhook_queue_depth", "Số update đang chờ trong hàng webhook")
+LOOP_LAG_QUANTILES = REGISTRY.gauge("cofure_loop_lag_quantile_seconds", "Phân vị độ trễ loop trong 60 giây gần nhất",
+                                    ("quantile",))
+WEBHOOK_UPDATES = REGISTRY.counter("cofure_webhook_updates_total", "Update webhook theo kết quả", ("result",))
+
+def instrument_job(fn):
+    """Bọc callback của JobQueue: đo thời gian, đếm lỗi (vẫn ném lại để PTB log)."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(context):
+        t0 = time.perf_counter()
+        try:
+            return await fn(context)
+        except Exception:
+            JOB_ERRORS.inc(job=name)
+            raise
+        finally:
+            JOB_SECONDS.observe(time.perf_counter() - t0, job=name)
+    return wrapper
+
+def instrument_handler(command: str, fn):
+    """Bọc handler lệnh Telegram (update, context)."""
+    @functools.wraps(fn)
+    async def wrapper(update, context):
+        t0 = time.perf_counter()
+        try:
+            return await fn(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(command=command)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - t0, command=command)
+    return wrapper
@@ -0,0 +1,346 @@
+# cofure_bot/utils/outbox.py
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from telegram import Bot, Message
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from cofure_bot.utils.metrics import (
+    TELEGRAM_MESSAGES, TELEGRAM_QUEUE_WAIT, TELEGRAM_RETRY_AFTER, TELEGRAM_SEND_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_KEY = "outbox"
+
+# Giới hạn của Telegram: ~30 tin/giây toàn bot, ~1 tin/giây mỗi chat, 20 tin/phút mỗi nhóm
+GLOBAL_RATE      = 30.0
+GLOBAL_BURST     = 30
+CHAT_RATE        = 1.0
+CHAT_BURST       = 3
+GROUP_RATE       = 20 / 60
+GROUP_BURST      = 3
+MAX_MESSAGE_LEN  = 4096
+MAX_ATTEMPTS     = 3
+MAX_IN_FLIGHT    = 8     # số tin gửi song song (mỗi chat tối đa 1 → giữ thứ tự trong chat)
+COALESCE_SEP     = "\n\n"
+
+PRIORITY_URGENT = 0     # cảnh báo khẩn
+PRIORITY_HIGH   = 1     # tin vĩ mô, trả lời lệnh
+PRIORITY_NORMAL = 5     # tín hiệu định kỳ, bản tin
+PRIORITY_LOW    = 9
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _fill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Số giây phải chờ tới khi có 1 token (0 = gửi được ngay)."""
+        self._fill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._fill(now)
+        return self.tokens >= self.capacity
+
+class _OutMsg:
+    __slots__ = ("chat_id", "text", "parse_mode", "kwargs", "priority", "seq", "coalesce", "future", "attempts",
+                 "queued_at")
+
+    def __init__(self, chat_id, text, parse_mode, kwargs, priority, seq, coalesce, future):
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.coalesce = coalesce
+        self.future = future
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+
+    def __lt__(self, other: "_OutMsg") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+def _retrieve(fut: asyncio.Future):
+    # lỗi đã được log; tránh cảnh báo "exception was never retrieved" khi không ai await
+    if not fut.cancelled():
+        fut.exception()
+
+class Outbox:
+    """
+    Hàng đợi gửi tin Telegram dùng chung: producer gọi send() và đi tiếp ngay.
+    1 worker lấy tin theo độ ưu tiên (rồi thứ tự vào hàng), tôn trọng token bucket toàn bot
+    và theo chat, tự chờ khi bị RetryAfter, gộp các tin ngắn cùng nhóm `coalesce` thành 1.
+    Tin của các chat khác nhau được gửi song song (tối đa MAX_IN_FLIGHT), mỗi chat 1 tin 1 lúc.
+    """
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._heap: List[_OutMsg] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._global = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._paused_until = 0.0
+        self._inflight: Dict[Any, asyncio.Task] = {}   # chat_id → lô đang gửi (đã lấy khỏi heap)
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.coalesced = 0
+
+    # --- Vòng đời ---
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="outbox")
+
+    async def join(self, timeout: Optional[float] = None) -> bool:
+        """Chờ tới khi hàng rỗng và không còn tin đang gửi; True nếu xong trước timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while (self._heap or self._inflight) and self._task and not self._task.done():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.005)
+        return not self._heap and not self._inflight
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Gửi nốt hàng đợi (tối đa drain_timeout giây) rồi dừng worker."""
+        await self.join(drain_timeout)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for t in list(self._inflight.values()):
+            t.cancel()
+        self._inflight.clear()
+        for m in self._heap:
+            m.future.cancel()
+        self._heap.clear()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    # --- Producer ---
+    def send(self, chat_id, text: str, *, parse_mode: Optional[str] = None,
+             priority: int = PRIORITY_NORMAL, coalesce: Optional[str] = None, **kwargs) -> asyncio.Future:
+        """
+        Xếp tin vào hàng, trả về Future (Message) ngay. Chỉ await khi cần kết quả
+        (vd. message_id để ghim). Các tin cùng chat/parse_mode/độ ưu tiên/`coalesce`
+        đang chờ trong hàng được gộp thành 1 tin (không quá 4096 ký tự).
+        """
+        fut = asyncio.get_running_loop().create_future()
+        fut.add_done_callback(_retrieve)
+        heapq.heappush(self._heap, _OutMsg(chat_id, text, parse_mode, kwargs, priority,
+                                           next(self._seq), coalesce, fut))
+        self._wakeup.set()
+        return fut
+
+    # --- Worker ---
+    def _bucket(self, chat_id) -> TokenBucket:
+        b = self._chats.get(chat_id)
+        if b is None:
+            if len(self._chats) > 1000:
+                now = time.monotonic()
+                self._chats = {k: v for k, v in self._chats.items() if not v.full(now)}
+            group = isinstance(chat_id, int) and chat_id < 0
+            b = self._chats[chat_id] = (TokenBucket(GROUP_RATE, GROUP_BURST) if group
+                                        else TokenBucket(CHAT_RATE, CHAT_BURST))
+        return b
+
+    def _next_ready(self, now: float):
+        """
+        Tin ưu tiên nhất có chat còn token và không có tin đang gửi → (tin, 0);
+        không có → (None, thời gian chờ ngắn nhất, None = chờ 1 lô gửi xong).
+        """
+        best, seen = float("inf"), set(self._inflight)
+        for m in sorted(self._heap):
+            if m.chat_id in seen:
+                continue
+            seen.add(m.chat_id)
+            w = self._bucket(m.chat_id).delay(now)
+            if w <= 0:
+                return m, 0.0
+            best = min(best, w)
+        return None, (None if best == float("inf") else best)
+
+    def _take_batch(self, head: _OutMsg) -> List[_OutMsg]:
+        self._heap.remove(head)
+        if head.coalesce is None:
+            heapq.heapify(self._heap)
+            return [head]
+        batch, size = [head], len(head.text)
+        keep = []
+        for m in sorted(self._heap):
+            if (m.coalesce == head.coalesce and m.chat_id == head.chat_id and m.parse_mode == head.parse_mode
+                    and m.priority == head.priority and size + len(COALESCE_SEP) + len(m.text) <= MAX_MESSAGE_LEN):
+                batch.append(m)
+                size += len(COALESCE_SEP) + len(m.text)
+            else:
+                keep.append(m)
+        heapq.heapify(keep)
+        self._heap = keep
+        self.coalesced += len(batch) - 1
+        return batch
+
+    async def _run(self):
+        while True:
+            if not self._heap or len(self._inflight) >= MAX_IN_FLIGHT:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            wait = max(self._paused_until - now, self._global.delay(now))
+            head = None
+            if wait <= 0:
+                # chat đang hết token không chặn tin của chat khác
+                head, wait = self._next_ready(now)
+            if head is None:
+                # có tin mới (có thể ưu tiên hơn) → tính lại
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            batch = self._take_batch(head)
+            self._global.take()
+            self._bucket(head.chat_id).take()
+            task = asyncio.create_task(self._deliver(batch), name=f"outbox_send:{head.chat_id}")
+            self._inflight[head.chat_id] = task
+            task.add_done_callback(lambda _t, chat_id=head.chat_id: self._done(chat_id))
+
+    def _done(self, chat_id):
+        self._inflight.pop(chat_id, None)
+        self._wakeup.set()
+
+    def _requeue(self, batch: List[_OutMsg]):
+        for m in batch:
+            heapq.heappush(self._heap, m)
+
+    async def _deliver(self, batch: List[_OutMsg]):
+        head = batch[0]
+        text = COALESCE_SEP.join(m.text for m in batch)
+        t0 = time.monotonic()
+        try:
+            msg = await self.bot.send_message(chat_id=head.chat_id, text=text,
+                                              parse_mode=head.parse_mode, **head.kwargs)
+        except RetryAfter as e:
+            wait = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+            self._paused_until = time.monotonic() + wait
+            self.retried += 1
+            TELEGRAM_RETRY_AFTER.inc()
+            logger.warning("Telegram flood control: pausing outbox for %.0fs", wait)
+            self._requeue(batch)
+            return
+        except (BadRequest, Forbidden) as e:
+            self._fail(batch, e)
+            return
+        except NetworkError as e:
+            head.attempts += 1
+            if head.attempts >= MAX_ATTEMPTS:
+                self._fail(batch, e)
+                return
+            self._paused_until = time.monotonic() + head.attempts
+            self.retried += 1
+            self._requeue(batch)
+            return
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        self.sent += 1
+        TELEGRAM_SEND_SECONDS.observe(time.monotonic() - t0)
+        TELEGRAM_MESSAGES.inc(len(batch), result="sent")
+        for m in batch:
+            TELEGRAM_QUEUE_WAIT.observe(t0 - m.queued_at)
+            if not m.future.done():
+                m.future.set_result(msg)
+
+    def _fail(self, batch: List[_OutMsg], exc: Exception):
+        self.failed += len(batch)
+        TELEGRAM_MESSAGES.inc(len(batch), result="failed")
+        logger.warning("Telegram send to %s failed: %s", batch[0].chat_id, exc)
+        for m in batch:
+            if not m.future.done():
+                m.future.set_exception(exc)
+
+class RemoteOutbox:
+    """
+    Outbox ở process worker (chế độ tách process): cùng giao diện send(), tin được chuyển
+    qua IPC cho Outbox thật ở process ingress (giới hạn tốc độ, gộp tin vẫn ở 1 chỗ).
+    Future trả về Message như Outbox thường (vd. để ghim).
+    """
+    def __init__(self, ipc, bot: Bot):
+        self.ipc = ipc
+        self.bot = bot
+        self._tasks: set = set()
+
+    async def start(self):
+        pass
+
+    def send(self, chat_id, text: str, *, parse_mode: Optional[str] = None,
+             priority: int = PRIORITY_NORMAL, coalesce: Optional[str] = None, **kwargs) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        fut.add_done_callback(_retrieve)
+        msg = {"op": "send", "chat_id": chat_id, "text": text, "parse_mode": parse_mode,
+               "priority": priority, "coalesce": coalesce, "kwargs": kwargs}
+        t = asyncio.create_task(self._forward(msg, fut))
+        self._tasks.add(t)
+        t.add_done_callback(self._tasks.discard)
+        return fut
+
+    async def _forward(self, msg: Dict[str, Any], fut: asyncio.Future):
+        try:
+            result = await self.ipc.request(msg)
+        except Exception as e:
+            TELEGRAM_MESSAGES.inc(result="failed")
+            logger.warning("Forwarding message to %s failed: %s", msg["chat_id"], e)
+            if not fut.done():
+                fut.set_exception(e)
+            return
+        if not fut.done():
+            fut.set_result(Message.de_json(result, self.bot))
+
+    async def join(self, timeout: Optional[float] = None) -> bool:
+        if not self._tasks:
+            return True
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        return not pending
+
+    async def stop(self, drain_timeout: float = 5.0):
+        await self.join(drain_timeout)
+        for t in list(self._tasks):
+            t.cancel()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+async def serve_remote_send(outbox: Outbox, msg: Dict[str, Any]) -> Dict[str, Any]:
+    """Phía ingress: thực hiện 1 tin RemoteOutbox gửi sang, trả Message dạng dict."""
+    sent = await outbox.send(msg["chat_id"], msg["text"], parse_mode=msg.get("parse_mode"),
+                             priority=msg.get("priority", PRIORITY_NORMAL), coalesce=msg.get("coalesce"),
+                             **(msg.get("kwargs") or {}))
+    return sent.to_dict()
+
+def get_outbox(context) -> Outbox:
+    """Lấy Outbox dùng chung từ context (job hoặc handler)."""
+    return context.bot_data[OUTBOX_KEY]
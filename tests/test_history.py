@@ -0,0 +1,71 @@
+# tests/test_history.py
+import os
+
+import numpy as np
+import pytest
+
+from cofure_bot.storage import history
+from cofure_bot.storage.history import FUNDING_COLUMNS, PREPEND_MARKER, ColumnTable
+
+def _table(path):
+    return ColumnTable(str(path), FUNDING_COLUMNS, "time")
+
+def _data(times):
+    t = np.asarray(times, dtype=np.int64)
+    return {"time": t, "rate": t.astype(np.float64) / 1000}
+
+def _assert_aligned(t, times):
+    assert t.column("time").tolist() == list(times)
+    # rate = time/1000 → dòng lệch thì lộ ngay
+    assert t.column("rate").tolist() == [x / 1000 for x in times]
+
+def test_append_then_prepend(tmp_path):
+    t = _table(tmp_path)
+    assert t.append(_data([5, 6, 7])) == 3
+    assert t.prepend(_data([1, 2, 5])) == 2
+    _assert_aligned(t, [1, 2, 5, 6, 7])
+    _assert_aligned(_table(tmp_path), [1, 2, 5, 6, 7])
+
+def test_prepend_crash_after_commit_rolls_forward(tmp_path, monkeypatch):
+    _table(tmp_path).append(_data([5, 6, 7]))
+    real = os.replace
+    calls = []
+
+    def crash(src, dst):
+        calls.append(dst)
+        if len(calls) == 2:
+            raise OSError("power loss")
+        real(src, dst)
+    monkeypatch.setattr(history.os, "replace", crash)
+    with pytest.raises(OSError):
+        _table(tmp_path).prepend(_data([1, 2]))
+    monkeypatch.setattr(history.os, "replace", real)
+
+    # 1 cột đã là dữ liệu mới, cột còn lại vẫn cũ → lần mở sau thay nốt
+    assert os.path.exists(tmp_path / PREPEND_MARKER)
+    t = _table(tmp_path)
+    _assert_aligned(t, [1, 2, 5, 6, 7])
+    assert not os.path.exists(tmp_path / PREPEND_MARKER)
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+def test_prepend_crash_before_commit_rolls_back(tmp_path, monkeypatch):
+    _table(tmp_path).append(_data([5, 6, 7]))
+
+    def crash(fd):
+        raise OSError("power loss")
+    monkeypatch.setattr(history.os, "fsync", crash)
+    with pytest.raises(OSError):
+        _table(tmp_path).prepend(_data([1, 2]))
+    monkeypatch.undo()
+
+    t = _table(tmp_path)
+    _assert_aligned(t, [5, 6, 7])
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+def test_append_crash_truncated(tmp_path):
+    t = _table(tmp_path)
+    t.append(_data([5, 6, 7]))
+    # cột không phải khoá đã ghi thêm, cột khoá chưa kịp ghi
+    with open(tmp_path / "rate.bin", "ab") as f:
+        f.write(np.array([9.0], dtype="<f8").tobytes())
+    _assert_aligned(_table(tmp_path), [5, 6, 7])
@@ -0,0 +1,33 @@
+# tests/test_macro_plan.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from cofure_bot.scheduler import jobs
+
+@pytest.fixture(autouse=True)
+def _nothing_sent(monkeypatch):
+    monkeypatch.setattr(jobs, "was_macro_sent", lambda key: False)
+
+def _post(at, now):
+    plan = jobs._macro_plan([{"id": "cpi", "time_vn": at}], now)
+    return plan.get(jobs.MACRO_POST_PREFIX + "cpi")
+
+@pytest.mark.parametrize("seconds_left", [1, 10, 29, 30, 31, 300])
+def test_post_job_first_run_not_after_last(seconds_left):
+    now = datetime.now(jobs.VN_TZ)
+    at = now - timedelta(minutes=jobs.MACRO_POST_WINDOW_MIN) + timedelta(seconds=seconds_left)
+    kind, first, _ = _post(at, now)
+    last = at + timedelta(minutes=jobs.MACRO_POST_WINDOW_MIN)
+    assert kind == "post"
+    assert now < first <= last
+
+def test_post_job_waits_for_release():
+    now = datetime.now(jobs.VN_TZ)
+    at = now + timedelta(minutes=20)
+    _, first, _ = _post(at, now)
+    assert first == at + timedelta(seconds=jobs.MACRO_POST_DELAY_SEC)
+
+def test_post_job_dropped_after_window():
+    now = datetime.now(jobs.VN_TZ)
+    assert _post(now - timedelta(minutes=jobs.MACRO_POST_WINDOW_MIN), now) is None
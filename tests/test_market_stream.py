@@ -0,0 +1,167 @@
+# tests/test_market_stream.py
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from cofure_bot.bench.fake_server import STEP_MS, FakeServer
+from cofure_bot.data import market_stream
+from cofure_bot.data.binance_client import BinanceClient, cached_klines, klines
+from cofure_bot.data.indicators import SIGNAL_WINDOW
+from cofure_bot.data.market_stream import MARK_PRICE_STREAM, MarketStream
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT"]
+
+@pytest.fixture(autouse=True)
+def _fast(monkeypatch):
+    # bỏ nhịp chờ giữa các lệnh / lần nối lại để test chạy nhanh
+    monkeypatch.setattr(market_stream, "SUBSCRIBE_GAP_SEC", 0.0)
+    monkeypatch.setattr(market_stream, "RECONNECT_MIN_SEC", 0.05)
+
+async def _until(pred, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not pred():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("timed out waiting for condition")
+        await asyncio.sleep(0.01)
+
+def _run(body):
+    """Chạy body(server, client, stream) với server giả (HTTP + WebSocket) trên cổng ngẫu nhiên."""
+    async def main():
+        server = FakeServer(symbols=len(SYMBOLS))
+        runner = web.AppRunner(server.app())
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        base = f"http://127.0.0.1:{port}"
+        client = BinanceClient(base_url=base)
+        client.kline_cache.min_refresh_sec = 0.0
+        stream = MarketStream(client, url=base)
+        try:
+            await body(server, client, stream)
+        finally:
+            await stream.stop()
+            await client.close()
+            await runner.cleanup()
+    asyncio.run(main())
+
+def _streams(symbols):
+    return {f"{s.lower()}@kline_5m" for s in symbols}
+
+def test_subscribe_and_ingest():
+    async def body(server, client, stream):
+        for s in SYMBOLS:
+            await cached_klines(client, s, limit=50)
+        await stream.set_symbols(SYMBOLS)
+        await stream.start()
+        await _until(lambda: server.subscriptions == _streams(SYMBOLS) | {MARK_PRICE_STREAM})
+        assert [c["method"] for c in server.ws_commands] == ["SUBSCRIBE"]
+
+        # đổi tập symbol khi đang kết nối → chỉ gửi phần chênh
+        await stream.set_symbols(["BTCUSDT"])
+        await _until(lambda: server.subscriptions == _streams(["BTCUSDT"]) | {MARK_PRICE_STREAM})
+        cmd = server.ws_commands[-1]
+        assert (cmd["method"], cmd["params"]) == ("UNSUBSCRIBE", ["ethusdt@kline_5m"])
+
+        # nến đang chạy đẩy qua WebSocket → thay nến cuối trong cache
+        last = client.kline_cache.peek("BTCUSDT", "5m")[-1]
+        live = last[:4] + ["12345.0", "7.0"] + last[6:]
+        assert await server.push_kline("BTCUSDT", live) == 1
+        await _until(lambda: client.kline_cache.peek("BTCUSDT", "5m")[-1][4] == "12345.0")
+        assert client.kline_cache.is_live("BTCUSDT", "5m")
+
+        # mark price → bảng funding dùng chung
+        assert await server.push_mark_prices() == 1
+        await _until(lambda: client._funding is not None and "ETHUSDT" in client._funding)
+        ref = {d["symbol"]: d for d in server.premium_index()}
+        assert client._funding.get("BTCUSDT").mark_price == pytest.approx(float(ref["BTCUSDT"]["markPrice"]))
+    _run(body)
+
+def test_closed_kline_advances_indicator_book():
+    async def body(server, client, stream):
+        rows = await cached_klines(client, "BTCUSDT", limit=SIGNAL_WINDOW)
+        client.indicator_book.warm("BTCUSDT", "5m", rows)
+        st = client.indicator_book.get("BTCUSDT", "5m")
+        await stream.set_symbols(["BTCUSDT"])
+        await stream.start()
+        await _until(lambda: server.subscriptions == _streams(["BTCUSDT"]) | {MARK_PRICE_STREAM})
+        await _until(lambda: not stream._backfills)
+
+        # nến đang chạy → chỉ cache đổi, state giữ nguyên
+        await server.push_kline("BTCUSDT", rows[-1])
+        await _until(lambda: client.kline_cache.is_live("BTCUSDT", "5m"))
+        assert st.last_open_time == rows[-2][0]
+        # bản cuối (x=true) → state nạp nến đó
+        await server.push_kline("BTCUSDT", rows[-1], closed=True)
+        await _until(lambda: st.last_open_time == rows[-1][0])
+        assert st.count == SIGNAL_WINDOW
+    _run(body)
+
+def test_reconnect_resubscribes():
+    async def body(server, client, stream):
+        await cached_klines(client, "BTCUSDT", limit=50)
+        await stream.set_symbols(SYMBOLS)
+        await stream.start()
+        await _until(lambda: server.subscriptions == _streams(SYMBOLS) | {MARK_PRICE_STREAM})
+
+        await server.drop_ws()
+        await _until(lambda: server.ws_connects == 2 and stream.connected.is_set())
+        await _until(lambda: server.subscriptions == _streams(SYMBOLS) | {MARK_PRICE_STREAM})
+        assert stream.reconnects >= 1
+        assert [c["method"] for c in server.ws_commands] == ["SUBSCRIBE", "SUBSCRIBE"]
+        assert server.ws_commands[0]["id"] != server.ws_commands[1]["id"]
+
+        # tin sau khi nối lại (và sau lượt backfill REST) vẫn tới cache
+        await _until(lambda: not stream._backfills)
+        last = client.kline_cache.peek("BTCUSDT", "5m")[-1]
+        await server.push_kline("BTCUSDT", last[:4] + ["999.0"] + last[5:])
+        await _until(lambda: client.kline_cache.peek("BTCUSDT", "5m")[-1][4] == "999.0")
+    _run(body)
+
+def test_gap_backfilled_over_rest():
+    async def body(server, client, stream):
+        # cache lỡ 5 nến cuối (vd. bot vừa mất kết nối)
+        async def behind(start_time, n):
+            return (await klines(client, "BTCUSDT", limit=n, start_time=start_time))[:-5]
+        await client.kline_cache.get(behind, "BTCUSDT", "5m", SIGNAL_WINDOW)
+        before = client.kline_cache.peek("BTCUSDT", "5m")
+        expected = await klines(client, "BTCUSDT", limit=3)
+
+        await stream.set_symbols(["BTCUSDT"])
+        await stream.start()
+        await _until(lambda: server.subscriptions == _streams(["BTCUSDT"]) | {MARK_PRICE_STREAM})
+
+        # kết nối xong → backfill REST điền phần thiếu
+        await _until(lambda: client.kline_cache.peek("BTCUSDT", "5m")[-1][0] == expected[-1][0])
+        await _until(lambda: not stream._backfills)
+        rows = client.kline_cache.peek("BTCUSDT", "5m")
+        assert rows[:len(before) - 1] == before[:-1]
+        assert all(b[0] - a[0] == STEP_MS for a, b in zip(rows, rows[1:]))
+
+        # nến live hở (nhảy cóc) → bỏ qua, series mất cờ live để get() sau tải bù
+        jump = rows[-1][:]
+        jump[0] = rows[-1][0] + 3 * STEP_MS
+        await server.push_kline("BTCUSDT", jump)
+        await asyncio.sleep(0.1)
+        assert client.kline_cache.peek("BTCUSDT", "5m")[-1][0] == rows[-1][0]
+        assert not client.kline_cache.is_live("BTCUSDT", "5m")
+    _run(body)
+
+def test_stop_cancels_backfill(monkeypatch):
+    async def body(server, client, stream):
+        gate = asyncio.Event()
+
+        async def slow(*a, **kw):
+            gate.set()
+            await asyncio.sleep(60)
+        monkeypatch.setattr(market_stream, "cached_klines", slow)
+        await stream.set_symbols(["BTCUSDT"])
+        await stream.start()
+        await asyncio.wait_for(gate.wait(), 5)
+        assert len(stream._backfills) == 1
+        task = next(iter(stream._backfills))
+        await stream.stop()
+        assert task.cancelled()
+        assert not stream._backfills
+    _run(body)
@@ -0,0 +1,72 @@
+# tests/test_signal_metrics.py
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from cofure_bot.bench.fake_server import FakeServer
+from cofure_bot.data.binance_client import BinanceClient, batch_signal_metrics, book_signal_metrics
+from cofure_bot.data.indicators import SIGNAL_WINDOW
+from cofure_bot.data.snapshot import build_snapshot
+
+def _run(body, symbols: int = 6):
+    async def main():
+        server = FakeServer(symbols=symbols)
+        runner = web.AppRunner(server.app())
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        client = BinanceClient(base_url=f"http://127.0.0.1:{port}")
+        client.kline_cache.min_refresh_sec = 0.0
+        try:
+            await body(server, client)
+        finally:
+            await client.close()
+            await runner.cleanup()
+    asyncio.run(main())
+
+def _assert_same(a, b):
+    assert a.keys() == b.keys()
+    for s in a:
+        for k, v in b[s].items():
+            assert a[s][k] == pytest.approx(v, rel=1e-9, abs=1e-12), (s, k)
+
+def test_book_metrics_warm_then_advance():
+    async def body(server, client):
+        syms = server.symbols
+        cold = await book_signal_metrics(client, syms)
+        _assert_same(cold, await batch_signal_metrics(client, syms))
+        # lượt đầu warm state cho mọi symbol
+        assert all(client.indicator_book.get(s, "5m").ready for s in syms)
+
+        # lượt sau: đi qua advance(), cùng kết quả với tính lại cả cửa sổ
+        st = client.indicator_book.get(syms[0], "5m")
+        count = st.count
+        hot = await book_signal_metrics(client, syms)
+        _assert_same(hot, await batch_signal_metrics(client, syms))
+        assert client.indicator_book.get(syms[0], "5m") is st and st.count >= count
+    _run(body)
+
+def test_book_metrics_recovers_from_gap():
+    async def body(server, client):
+        sym = server.symbols[0]
+        await book_signal_metrics(client, [sym])
+        st = client.indicator_book.get(sym, "5m")
+        # state tụt lại xa hơn cửa sổ cache → hở nến → tính lạnh và warm lại
+        st.last_open_time -= 10_000 * 300_000
+        out = await book_signal_metrics(client, [sym])
+        _assert_same(out, await batch_signal_metrics(client, [sym]))
+        assert client.indicator_book.get(sym, "5m") is not st
+    _run(body)
+
+def test_snapshot_uses_indicator_book():
+    async def body(server, client):
+        snap = await build_snapshot(client, min_quote_volume=0, size=4)
+        assert snap.candidates
+        for s in snap.metrics:
+            st = client.indicator_book.get(s, "5m")
+            assert st is not None and st.count == SIGNAL_WINDOW - 1
+        ref = await batch_signal_metrics(client, list(snap.metrics))
+        _assert_same({s: m.as_dict() for s, m in snap.metrics.items()}, ref)
+    _run(body)
@@ -0,0 +1,124 @@
+# tests/test_streaming.py
+import json
+import random
+
+import pytest
+
+from cofure_bot.data.binance_client import ema, rsi
+from cofure_bot.data.indicators import EMA_PERIODS, RSI_PERIOD, SIGNAL_WINDOW, build_frame
+from cofure_bot.data.streaming import IndicatorBook
+
+STEP = 300_000  # 5m
+
+def _rows(n: int, seed: int = 7):
+    """Nến giả dạng Binance: [open_time, open, high, low, close, volume]."""
+    rnd = random.Random(seed)
+    price, out = 100.0, []
+    for i in range(n):
+        price *= 1 + rnd.gauss(0, 0.01)
+        out.append([i * STEP, price, price, price, price, rnd.uniform(1, 100)])
+    return out
+
+def _reference(rows):
+    """Tính lại toàn chuỗi trên cửa sổ REST (SIGNAL_WINDOW nến cuối) bằng ema()/rsi()."""
+    closes = [r[4] for r in rows[-SIGNAL_WINDOW:]]
+    ref = {f"ema{p}": ema(closes, p) for p in EMA_PERIODS}
+    ref["rsi"] = rsi(closes, RSI_PERIOD)
+    return ref
+
+def _assert_matches(row, rows):
+    for k, v in _reference(rows).items():
+        assert row[k] == pytest.approx(v, rel=1e-9), k
+    # và trùng đường batch (build_frame) mà các lượt quét dùng
+    frame = build_frame({"X": rows[-SIGNAL_WINDOW:]}).row("X")
+    for k, v in frame.items():
+        assert row[k] == pytest.approx(v, rel=1e-9, abs=1e-12), k
+
+def test_warm_matches_recompute():
+    rows = _rows(SIGNAL_WINDOW)
+    row = IndicatorBook().warm("X", "5m", rows)
+    assert row is not None
+    _assert_matches(row, rows)
+
+def test_warm_not_ready_on_short_history():
+    assert IndicatorBook().warm("X", "5m", _rows(SIGNAL_WINDOW - 1)) is None
+
+def test_advance_matches_recompute():
+    rows = _rows(1500)
+    book = IndicatorBook()
+    book.warm("X", "5m", rows[:SIGNAL_WINDOW])
+    end = SIGNAL_WINDOW
+    rnd = random.Random(3)
+    # đủ nến để vượt qua các lần cộng dồn lại (_RESUM_EVERY)
+    while end < len(rows):
+        end = min(len(rows), end + rnd.randint(1, 9))
+        st = book.get("X", "5m")
+        # như cached_klines_since: từ nến cuối đã nạp tới nến đang chạy
+        since = next(i for i, r in enumerate(rows) if r[0] == st.last_open_time)
+        row = book.advance("X", "5m", rows[since:end])
+        assert row is not None
+        _assert_matches(row, rows[:end])
+
+def test_advance_running_candle_is_not_committed():
+    rows = _rows(SIGNAL_WINDOW + 5)
+    book = IndicatorBook()
+    book.warm("X", "5m", rows[:SIGNAL_WINDOW])
+    st = book.get("X", "5m")
+    last = st.last_open_time
+    # nến đang chạy cập nhật nhiều lần → state không đổi, metrics theo giá mới nhất
+    for price in (90.0, 110.0):
+        live = rows[SIGNAL_WINDOW - 1][:4] + [price, 50.0]
+        row = book.advance("X", "5m", [rows[SIGNAL_WINDOW - 2], live])
+        assert st.last_open_time == last
+        _assert_matches(row, rows[:SIGNAL_WINDOW - 1] + [live])
+
+def test_advance_gap_needs_warm():
+    rows = _rows(SIGNAL_WINDOW + 20)
+    book = IndicatorBook()
+    book.warm("X", "5m", rows[:SIGNAL_WINDOW])
+    # thiếu nến nối tiếp last_open_time → None (gọi warm lại)
+    assert book.advance("X", "5m", rows[SIGNAL_WINDOW + 5:]) is None
+
+def test_round_trip_preserves_state():
+    rows = _rows(900)
+    book = IndicatorBook()
+    book.warm("X", "5m", rows[:SIGNAL_WINDOW])
+    book.advance("X", "5m", rows[SIGNAL_WINDOW - 2:600])
+    restored = IndicatorBook.from_dict(json.loads(json.dumps(book.to_dict())))
+    assert len(restored) == 1
+    assert restored.get("X", "5m").metrics(rows[600]) == book.get("X", "5m").metrics(rows[600])
+    # tiếp tục nạp sau khi khôi phục → vẫn trùng bản gốc và bản tính lại
+    a = book.advance("X", "5m", rows[598:])
+    b = restored.advance("X", "5m", rows[598:])
+    assert a == b
+    _assert_matches(b, rows)
+
+def test_save_load(tmp_path):
+    rows = _rows(SIGNAL_WINDOW + 50)
+    book = IndicatorBook()
+    book.warm("X", "5m", rows)
+    path = str(tmp_path / "indicators.json")
+    book.save(path)
+    restored = IndicatorBook.load(path)
+    assert restored.get("X", "5m").metrics(rows[-1]) == book.get("X", "5m").metrics(rows[-1])
+
+def test_load_skips_unreadable_entries(tmp_path):
+    path = tmp_path / "indicators.json"
+    path.write_text(json.dumps({"X|5m": {"emas": [{"period": 9}]}}))
+    assert len(IndicatorBook.load(str(path))) == 0
+    assert len(IndicatorBook.load(str(tmp_path / "missing.json"))) == 0
+
+def test_close_candle_matches_recompute():
+    rows = _rows(SIGNAL_WINDOW + 40)
+    book = IndicatorBook()
+    book.warm("X", "5m", rows[:SIGNAL_WINDOW])
+    st = book.get("X", "5m")
+    # nến đã nạp → bỏ qua; nhảy cóc → bỏ qua
+    assert not book.close_candle("X", "5m", rows[SIGNAL_WINDOW - 2])
+    assert not book.close_candle("X", "5m", rows[SIGNAL_WINDOW])
+    for i in range(SIGNAL_WINDOW - 1, len(rows) - 1):
+        assert book.close_candle("X", "5m", rows[i])
+    assert st.last_open_time == rows[-2][0]
+    _assert_matches(st.metrics(rows[-1]), rows)
+    # advance() sau đó không nạp lại nến đã đóng qua close_candle
+    _assert_matches(book.advance("X", "5m", rows[-2:]), rows)